@@ -0,0 +1,55 @@
+"""
+Check that the modules shared by the apps are the same in every app.
+
+Each app is built and mounted on its own, so the shared modules are copied
+in all of them instead of imported from a common package. This script fails
+when the copies differ, printing the differences with the first copy.
+
+`logs.py` can only differ in the values of the constants of the app, the
+rest of the lines must be the same. Run it from the root of the repository:
+
+    python check_shared.py
+"""
+
+import difflib
+import os
+import re
+import sys
+
+# Folders of the apps with the shared modules
+APPS = ["postcodes/src", "traveltimes/scripts", "schools/src"]
+
+# Shared modules and the pattern of the lines that can differ between apps
+SHARED = {
+    "logs.py": re.compile(r"^(LOG_FORMAT|DATE_FORMAT|LOG_FILE|QUIET_LOGGERS) = .*$"),
+    "report.py": None,
+}
+
+
+def read_lines(path, app_lines):
+    """
+    Read the lines of a module, with the lines matching `app_lines` reduced
+    to the name of the constant they set.
+    """
+    with open(path, "r") as f:
+        lines = f.read().splitlines(keepends=True)
+    if app_lines is None:
+        return lines
+    return [app_lines.sub(r"\1 = ...", line.rstrip("\n")) + "\n" if app_lines.match(line) else line for line in lines]
+
+
+if __name__ == "__main__":
+    root = os.path.dirname(os.path.abspath(__file__))
+    failed = False
+    for module, app_lines in SHARED.items():
+        paths = [os.path.join(app, module) for app in APPS]
+        reference = read_lines(os.path.join(root, paths[0]), app_lines)
+        for path in paths[1:]:
+            diff = list(difflib.unified_diff(reference, read_lines(os.path.join(root, path), app_lines), paths[0], path))
+            if diff:
+                failed = True
+                sys.stdout.writelines(diff)
+                print(f"{path} differs from {paths[0]}.")
+    if failed:
+        exit(1)
+    print(f"The shared modules {', '.join(SHARED)} are the same in {', '.join(APPS)}.")
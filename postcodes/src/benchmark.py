@@ -0,0 +1,294 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import time
+
+from logs import LOG_FILE, setup_logging
+from config import Config
+from compute_centroids import compute_centroid
+from extract_postcodes import extract_centroids, extract_postcodes
+from process import Process
+from report import PeakRSS, process_tree_usage
+from synthetic import load_dataset
+
+logger = logging.getLogger("benchmark")
+
+# Province of the synthetic datasets, so Process finds them offline
+PROVINCE = "valencia"
+
+def postcodes_dir(working_dir: str) -> str:
+    return os.path.join(working_dir, "data", "postcodes", PROVINCE)
+
+
+def extract_points(working_dir: str):
+    """
+    Extract the points of the dataset into a clean postcodes folder.
+    """
+    output_dir = postcodes_dir(working_dir)
+    shutil.rmtree(os.path.join(working_dir, "data", "postcodes"), ignore_errors=True)
+    os.makedirs(output_dir)
+    return extract_postcodes(os.path.join(working_dir, "data", "provinces", f"{PROVINCE}.gpkg"), output_dir)
+
+
+def ensure_points(working_dir: str):
+    """
+    Make sure the CSV postcodes exist before the stages that read them.
+    """
+    if not os.path.isdir(postcodes_dir(working_dir)) or not os.listdir(postcodes_dir(working_dir)):
+        extract_points(working_dir)
+
+
+def postcode_paths(working_dir: str) -> list:
+    return sorted(os.path.join(postcodes_dir(working_dir), name) for name in os.listdir(postcodes_dir(working_dir)))
+
+
+def clean_points(working_dir: str):
+    shutil.rmtree(os.path.join(working_dir, "data", "postcodes"), ignore_errors=True)
+
+
+def process_config(working_dir: str, threads: int, **kwargs) -> Config:
+    return Config(working_dir=working_dir, province=PROVINCE, threads=threads, **kwargs)
+
+
+def run_process(working_dir: str, threads: int, **kwargs):
+    Process(process_config(working_dir, threads, **kwargs)).process()
+
+
+def run_get_centroids(working_dir: str, threads: int):
+    process = Process(process_config(working_dir, threads))
+    try:
+        process.get_centroids()
+    finally:
+        process.close()
+
+
+# Stages to measure: (setup, stage) functions of the working directory and
+# the number of workers. The setup is not measured.
+STAGES = {
+    "extract_postcodes": (None, lambda working_dir, threads: extract_points(working_dir)),
+    "compute_centroid": (ensure_points, lambda working_dir, threads: [compute_centroid(path) for path in postcode_paths(working_dir)]),
+    "get_centroids": (ensure_points, run_get_centroids),
+    "extract_centroids": (
+        None,
+        lambda working_dir, threads: extract_centroids(os.path.join(working_dir, "data", "provinces", f"{PROVINCE}.gpkg")),
+    ),
+    "process": (clean_points, run_process),
+    "process_fused": (clean_points, lambda working_dir, threads: run_process(working_dir, threads, fused=True)),
+}
+
+
+def measure_stage(stage: str, working_dir: str, threads: int, connection):
+    """
+    Run a stage in this process and send its measurements through the
+    connection. Runs in a new process, so the peak memory is the stage's own.
+    The CPU time includes the workers of the pooled stages, like RunReport.
+    """
+    os.chdir(working_dir)
+    setup_logging(logging.WARNING, file=LOG_FILE)
+    setup, run = STAGES[stage]
+    if setup:
+        setup(working_dir)
+
+    with PeakRSS() as peak:
+        cpu = process_tree_usage(os.getpid())["cpu_seconds"]
+        start = time.perf_counter()
+        run(working_dir, threads)
+        wall = time.perf_counter() - start
+        cpu = process_tree_usage(os.getpid())["cpu_seconds"] - cpu
+
+    connection.send(
+        {
+            "wall_seconds": wall,
+            "cpu_seconds": cpu,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "peak_tree_rss_mb": peak.peak / 2**20,
+        }
+    )
+    connection.close()
+
+
+def run_stage(stage: str, working_dir: str, threads: int, points: int, repeat: int) -> dict:
+    """
+    Measure a stage `repeat` times, each in a fresh process, keeping the
+    fastest run.
+    """
+    context = multiprocessing.get_context("spawn")
+    runs = []
+    for _ in range(repeat):
+        receiver, sender = context.Pipe(duplex=False)
+        child = context.Process(target=measure_stage, args=(stage, working_dir, threads, sender))
+        child.start()
+        sender.close()
+        try:
+            runs.append(receiver.recv())
+        except EOFError:
+            child.join()
+            raise RuntimeError(f"Stage {stage} failed with exit code {child.exitcode}")
+        child.join()
+
+    best = min(runs, key=lambda run: run["wall_seconds"])
+    return {
+        **{key: round(value, 3) for key, value in best.items()},
+        "points_per_second": round(points / best["wall_seconds"], 1),
+        "runs": [round(run["wall_seconds"], 3) for run in runs],
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Regressions of the results against the baseline: a throughput lower or a
+    peak memory higher by more than the tolerance.
+    """
+    regressions = []
+    for scale, stages in results["scales"].items():
+        for stage, current in stages.items():
+            previous = baseline["scales"].get(scale, {}).get(stage)
+            if previous is None:
+                continue
+            throughput = current["points_per_second"] / previous["points_per_second"]
+            memory = current["peak_tree_rss_mb"] / previous["peak_tree_rss_mb"]
+            logger.info(
+                f"{scale:>8} {stage:<18} {current['points_per_second']:>10.0f} points/s ({throughput - 1:+.1%}), "
+                f"peak {current['peak_tree_rss_mb']:.0f} MB ({memory - 1:+.1%})"
+            )
+            if throughput < 1 - tolerance:
+                regressions.append(f"{stage} at {scale} points is {1 - throughput:.1%} slower")
+            if memory > 1 + tolerance:
+                regressions.append(f"{stage} at {scale} points uses {memory - 1:.1%} more memory")
+    return regressions
+
+
+def parse_args():
+    """
+    Parse command line arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark the postcodes stages offline on synthetic datasets."
+    )
+    parser.add_argument(
+        "--log-level",
+        "-l",
+        type=str,
+        default=os.getenv("DCAC_LOG", "INFO"),
+        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+        help="Set the logging level. Default is INFO or the value of DCAC_LOG environment variable.",
+    )
+    parser.add_argument(
+        "--working-dir",
+        "-w",
+        type=str,
+        default=os.path.join(os.getcwd(), "data", "benchmark"),
+        help="Folder for the synthetic datasets and their outputs. Default is data/benchmark.",
+    )
+    parser.add_argument(
+        "--scales",
+        type=lambda value: [int(v) for v in value.split(",")],
+        default="20000,100000",
+        help="Comma separated numbers of points of the synthetic datasets. Default is 20000,100000.",
+    )
+    parser.add_argument(
+        "--stages",
+        type=lambda value: value.split(","),
+        default=",".join(STAGES),
+        help=f"Comma separated stages to measure. Default is {','.join(STAGES)}.",
+    )
+    parser.add_argument(
+        "--threads",
+        "-t",
+        type=int,
+        default=os.getenv("DCAC_THREADS", 3),
+        help="Number of workers of the pooled stages. Default is 3 or the value of DCAC_THREADS environment variable.",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of every stage, the fastest is kept. Default is 3.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic datasets. Default is 0.")
+    parser.add_argument(
+        "--output",
+        "-o",
+        type=str,
+        default="data/benchmark.json",
+        help="Path of the JSON file with the results. Default is data/benchmark.json.",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        default="data/benchmark.baseline.json",
+        help="Path of the JSON file with the results to compare with. Default is data/benchmark.baseline.json.",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Store the results as the new baseline instead of comparing with it.",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Relative loss of throughput or growth of peak memory against the baseline that fails the run. Default is 0.2.",
+    )
+    args = parser.parse_args()
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(sorted(unknown))}. Valid options are: {', '.join(STAGES)}")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    logging.basicConfig(
+        level=getattr(logging, args.log_level.upper(), logging.INFO),
+        format="%(asctime)s | %(name)s | %(levelname)s | %(message)s",
+    )
+
+    results = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+        },
+        "threads": args.threads,
+        "seed": args.seed,
+        "scales": {},
+    }
+    for points in args.scales:
+        working_dir = os.path.join(args.working_dir, str(points))
+        os.makedirs(os.path.join(working_dir, "data", "provinces"), exist_ok=True)
+        dataset = load_dataset(
+            os.path.join(working_dir, "data", "provinces", f"{PROVINCE}.gpkg"),
+            points,
+            max(20, points // 1500),
+            args.seed,
+        )
+        logger.info(f"Benchmarking {dataset['points']} points in {dataset['postcodes']} postcodes...")
+        scale = results["scales"][str(points)] = {}
+        for stage in args.stages:
+            scale[stage] = run_stage(stage, working_dir, args.threads, dataset["points"], args.repeat)
+            logger.info(
+                f"\t{stage}: {scale[stage]['wall_seconds']:.2f} s, {scale[stage]['points_per_second']:.0f} points/s, "
+                f"peak {scale[stage]['peak_tree_rss_mb']:.0f} MB"
+            )
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    logger.info(f"Results written to {args.output}")
+
+    if args.save_baseline or not os.path.exists(args.baseline):
+        shutil.copyfile(args.output, args.baseline)
+        logger.info(f"Baseline stored in {args.baseline}")
+        exit(0)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline["machine"] != results["machine"] or baseline["threads"] != results["threads"]:
+        logger.warning(f"The baseline was measured on another machine or settings: {baseline['machine']}")
+    logger.info(f"Comparing with the baseline of {baseline['created']} (tolerance {args.tolerance:.0%}):")
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        logger.error(f"Regression: {regression}")
+    exit(1 if regressions else 0)
@@ -5,7 +5,6 @@ import os
 from config import CARTOCIUDAD_PROVINCES_IDS, DEFAULTS
 
 logger = logging.getLogger("cli")
-logger_format = "%(asctime)s | %(name)s | %(levelname)s | %(message)s"
 
 
 def parse_args():
@@ -25,6 +24,20 @@ def parse_args():
         choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
         help="Set the logging level. Default is INFO or the value of DCAC_LOG environment variable.",
     )
+    parser.add_argument(
+        "--log-format",
+        type=str,
+        default=os.getenv("DCAC_LOG_FORMAT", DEFAULTS["log_format"]),
+        choices=["text", "json"],
+        help=f"Write the log as text or as JSON lines. Default is {DEFAULTS['log_format']} or the value of DCAC_LOG_FORMAT environment variable.",
+    )
+    parser.add_argument(
+        "--log-sample",
+        metavar="EVERY",
+        type=int,
+        default=os.getenv("DCAC_LOG_SAMPLE", DEFAULTS["log_sample"]),
+        help=f"Log one of every EVERY messages about single postcodes and features after the first ones, 1 to log all of them. Default is {DEFAULTS['log_sample']} or the value of DCAC_LOG_SAMPLE environment variable.",
+    )
 
     # Province argument
     parser.add_argument(
@@ -65,4 +78,40 @@ def parse_args():
         help=f"The number of threads to use. Default is {DEFAULTS['threads']} or the value of DCAC_THREADS environment variable.",
     )
 
+    # Fused mode arguments
+    parser.add_argument(
+        "--fused",
+        default=os.getenv("DCAC_FUSED", "false").lower() == "true" or DEFAULTS["fused"],
+        action="store_true",
+        help=f"Compute the centroids while extracting the points, without writing the CSV postcodes. Default is {DEFAULTS['fused']} or the value of DCAC_FUSED environment variable.",
+    )
+    parser.add_argument(
+        "--debug-points",
+        default=os.getenv("DCAC_DEBUG_POINTS", "false").lower() == "true" or DEFAULTS["debug_points"],
+        action="store_true",
+        help=f"Also write the CSV postcodes in the fused mode. Default is {DEFAULTS['debug_points']} or the value of DCAC_DEBUG_POINTS environment variable.",
+    )
+
+    # Parameter sweep arguments
+    parser.add_argument(
+        "--sweep",
+        default=os.getenv("DCAC_SWEEP", "false").lower() == "true" or DEFAULTS["sweep"],
+        action="store_true",
+        help=f"Compute the centroids of the CSV postcodes for every combination of the sweep parameters into data/postcodes_sweep.csv instead of processing the datasets. Default is {DEFAULTS['sweep']} or the value of DCAC_SWEEP environment variable.",
+    )
+    parser.add_argument(
+        "--sweep-eps",
+        metavar="EPS",
+        type=lambda value: tuple(float(v) for v in value.split(",")),
+        default=os.getenv("DCAC_SWEEP_EPS", ",".join(str(v) for v in DEFAULTS["sweep_eps"])),
+        help=f"Comma separated DBSCAN eps values in meters for the sweep. Default is {','.join(str(v) for v in DEFAULTS['sweep_eps'])} or the value of DCAC_SWEEP_EPS environment variable.",
+    )
+    parser.add_argument(
+        "--sweep-min-samples",
+        metavar="MIN_SAMPLES",
+        type=lambda value: tuple(int(v) for v in value.split(",")),
+        default=os.getenv("DCAC_SWEEP_MIN_SAMPLES", ",".join(str(v) for v in DEFAULTS["sweep_min_samples"])),
+        help=f"Comma separated DBSCAN min_samples values for the sweep. Default is {','.join(str(v) for v in DEFAULTS['sweep_min_samples'])} or the value of DCAC_SWEEP_MIN_SAMPLES environment variable.",
+    )
+
     return parser.parse_args()
@@ -1,14 +1,18 @@
 import logging
 import csv
 
-from sklearn.cluster import DBSCAN
 import numpy as np
 
-from config import CLUSTERING_PARAMETERS
+from logs import get_sampled_logger
+from workers import get_dbscan
 
 logger = logging.getLogger("compute_centroids")
+postcode_logger = get_sampled_logger("compute_centroids.postcodes")
 
-def compute_centroid(postcode_path: str) -> None:
+def read_points(postcode_path: str) -> list:
+    """
+    Read the street number points of a postcode CSV file, or None on errors
+    """
     # Check the path
     if not postcode_path.endswith(".csv"):
         logger.error(f"Invalid postcode path: {postcode_path}. Must be a .csv file.")
@@ -25,12 +29,25 @@ def compute_centroid(postcode_path: str) -> None:
     except Exception as e:
         logger.error(f"Error reading file {postcode_path}: {e}")
         return
-    
-    # Create a numpy array from the rows with the x and y coordinates
-    postcode = rows[0]["codigo_postal"]
-    town = rows[0]["poblacion"]
+
+    return rows
+
+
+def compute_centroid(postcode_path: str) -> None:
+    rows = read_points(postcode_path)
+    if rows is None:
+        return
+
+    return centroid_of(rows)
+
+
+def points_array(rows: list):
+    """
+    Create a numpy array from the rows with the x and y coordinates, or None
+    on errors
+    """
     try:
-        np_rows = np.array([[float(row["x"]), float(row["y"])] for row in rows])
+        return np.array([[float(row["x"]), float(row["y"])] for row in rows])
     except KeyError as e:
         logger.error(f"Missing key in row: {e}")
         return
@@ -40,19 +57,33 @@ def compute_centroid(postcode_path: str) -> None:
     except Exception as e:
         logger.error(f"Error processing rows: {e}")
         return
-    
 
-    # Compute the DBSCAN clustering in the rows with scikit-learn
-    dbscan = DBSCAN(
-        eps=CLUSTERING_PARAMETERS["eps"],
-        min_samples=CLUSTERING_PARAMETERS["min_samples"],
-        metric=CLUSTERING_PARAMETERS["metric"],
-    )
-    clusters = dbscan.fit_predict(np_rows)
+
+def centroid_of(rows: list) -> dict:
+    """
+    Compute the centroid of the street number points of a postcode, as
+    dictionaries with their x and y coordinates and properties.
+    """
+    np_rows = points_array(rows)
+    if np_rows is None:
+        return
+
+    # Compute the DBSCAN clustering in the rows with scikit-learn, reusing
+    # the estimator configured once per worker
+    clusters = get_dbscan().fit_predict(np_rows)
 
     logger.debug(f"Computed {len(set(clusters))} clusters")
-    
-    
+
+    return select_centroid(rows, np_rows, clusters)
+
+
+def select_centroid(rows: list, np_rows, clusters) -> dict:
+    """
+    Select the point closest to the center of the largest cluster, with the
+    number and percentage of points in that cluster.
+    """
+    postcode = rows[0]["codigo_postal"]
+    town = rows[0]["poblacion"]
     labels = np.unique(clusters)
     num_rows = len(rows)
 
@@ -94,8 +125,8 @@ def compute_centroid(postcode_path: str) -> None:
         "y": None,
     }
     if result:
-        logger.debug(f"Postcode {result['codigo_postal']} centroid on {result['pct']}% cluster")
+        postcode_logger.debug("Postcode %s centroid on %s%% cluster", result["codigo_postal"], result["pct"])
     else:
-        logger.debug("No centroids found")
+        postcode_logger.debug("No centroids found")
     
     return result
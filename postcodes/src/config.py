@@ -12,6 +12,13 @@ DEFAULTS = {
     "province": "all",
     "force": False,
     "threads": 3,
+    "fused": False,
+    "debug_points": False,
+    "sweep": False,
+    "sweep_eps": (100, 150, 200, 250, 300, 400),
+    "sweep_min_samples": (5, 10, 20, 40),
+    "log_format": "text",
+    "log_sample": 100,
 }
 
 STREET_NUMBERS_FIELDS = [
@@ -36,3 +43,8 @@ class Config(NamedTuple):
     province: str = DEFAULTS["province"]
     force: bool = DEFAULTS["force"]
     threads: int = DEFAULTS["threads"]
+    fused: bool = DEFAULTS["fused"]
+    debug_points: bool = DEFAULTS["debug_points"]
+    sweep: bool = DEFAULTS["sweep"]
+    sweep_eps: tuple = DEFAULTS["sweep_eps"]
+    sweep_min_samples: tuple = DEFAULTS["sweep_min_samples"]
@@ -2,14 +2,17 @@ import os
 import fiona
 import logging
 import csv
-from pyproj import Transformer
+
+from collections import Counter
 
 from config import STREET_NUMBERS_FIELDS
+from compute_centroids import centroid_of
+from workers import get_transformer
 
-logger = logging.getLogger("extract_postcodes")
+from logs import get_sampled_logger
 
-# Initialize a transformer (e.g., EPSG:4258 to UTM Zone 33N)
-transformer = Transformer.from_crs("EPSG:4258", "EPSG:25830", always_xy=True)
+logger = logging.getLogger("extract_postcodes")
+feature_logger = get_sampled_logger("extract_postcodes.features")
 
 def transform_coordinates(geometry):
     """
@@ -21,7 +24,8 @@ def transform_coordinates(geometry):
 
     lon, lat = geometry["coordinates"]
 
-    return transformer.transform(lon, lat)
+    # The transformer (EPSG:4258 to UTM Zone 30N) is created once per process
+    return get_transformer("EPSG:4258", "EPSG:25830").transform(lon, lat)
 
 def create_feature_dict(feature):
     """
@@ -76,18 +80,82 @@ def extract_postcodes(gpkg_path, output_path):
                 # Append the feature to the list for the postcode
                 features_per_postcode[postcode].append(feature_dict)
             else:
-                logger.debug(f"Feature without postcode: {feature_dict}")
+                feature_logger.debug("Feature without postcode: %s", feature_dict)
                 continue
     
     # Create the output CSV files
     for postcode, features in features_per_postcode.items():
-        # Create the output file path
-        output_file = os.path.join(output_path, f"{postcode}.csv")
-
-        # Write the features to the CSV file
-        with open(output_file, "w", newline="") as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=features[0].keys())
-            writer.writeheader()
-            writer.writerows(features)
+        write_points(output_path, postcode, features)
 
     return list(features_per_postcode.keys())
+
+
+def write_points(output_path, postcode, features):
+    """
+    Write the street number points of a postcode into its CSV file
+    """
+    # Create the output file path
+    output_file = os.path.join(output_path, f"{postcode}.csv")
+
+    # Write the features to the CSV file
+    with open(output_file, "w", newline="") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=features[0].keys())
+        writer.writeheader()
+        writer.writerows(features)
+
+
+def count_points(gpkg_path):
+    """
+    Count the street number points of each postcode, reading only the
+    postcode field
+    """
+    with fiona.open(gpkg_path, ignore_geometry=True, include_fields=["codigo_postal"]) as src:
+        return Counter(
+            feature["properties"]["codigo_postal"]
+            for feature in src
+            if feature["properties"]["codigo_postal"]
+        )
+
+
+def extract_centroids(gpkg_path, output_path=None):
+    """
+    Extract the street number points of each postcode and compute its centroid
+    as soon as all its points are read, in a single pass over the dataset.
+    Only the points of the postcodes that are still being read are kept in
+    memory, a single one when the dataset is sorted by postcode. With an
+    `output_path`, the points are also saved into a CSV file per postcode.
+    Returns a dictionary of postcode and centroid.
+    """
+    # The number of points of each postcode tells when it is complete
+    counts = count_points(gpkg_path)
+    logger.debug(f"Counted the points of {len(counts)} postcodes in {gpkg_path}")
+
+    buffers = {}
+    centroids = {}
+    buffered = max_buffered = 0
+    with fiona.open(gpkg_path) as src:
+        for feature in src:
+            feature_dict = create_feature_dict(feature)
+
+            # Extract the postcode from the properties
+            postcode = feature_dict.get("codigo_postal")
+            if not postcode:
+                feature_logger.debug("Feature without postcode: %s", feature_dict)
+                continue
+
+            # Add the feature to the buffer of the postcode
+            features = buffers.setdefault(postcode, [])
+            features.append(feature_dict)
+            buffered += 1
+            max_buffered = max(max_buffered, buffered)
+
+            # Compute the centroid once all the points are read
+            if len(features) == counts[postcode]:
+                del buffers[postcode]
+                buffered -= len(features)
+                if output_path:
+                    write_points(output_path, postcode, features)
+                centroids[postcode] = centroid_of(features)
+
+    logger.debug(f"Computed {len(centroids)} centroids keeping up to {max_buffered} points in memory")
+    return centroids
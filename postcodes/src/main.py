@@ -2,40 +2,38 @@
 import logging
 
 from config import CARTOCIUDAD_PROVINCES_IDS, Config
-from cli import parse_args, logger_format
+from cli import parse_args
+from logs import LOG_FILE, setup_logging
 from process import Process
 
 
 if __name__ == "__main__":
 
-    # setup a basic logger
-    logging.basicConfig(
-        level=logging.INFO,
-        format=logger_format,
-        handlers=[logging.FileHandler("data/dcac-postcodes.log"), logging.StreamHandler()],
-    )
-    # set up a basic logger
-    logger = logging.getLogger()
-    logger.name = "main"
-
     # Get CLI args
     args = parse_args()
 
-    # Reset the logger level
-    logger.setLevel(getattr(logging, args.log_level.upper(), logging.INFO))
+    # Set up the logging of the main process and the workers
+    setup_logging(
+        getattr(logging, args.log_level.upper(), logging.INFO),
+        json_format=args.log_format == "json",
+        sample_every=args.log_sample,
+        file=LOG_FILE,
+    )
+    logger = logging.getLogger()
+    logger.name = "main"
 
-    logging.getLogger("requests").setLevel(logging.WARNING)
-    logger.debug("Requests log level set to WARNING")
-    logging.getLogger("urllib3").setLevel(logging.WARNING)
-    logger.debug("Urllib3 log level set to WARNING")
-    logging.getLogger("fiona").setLevel(logging.WARNING)
-    logger.debug("Fiona log level set to WARNING")
+    logger.debug("Requests, urllib3 and fiona log levels set to WARNING")
 
     config = Config(
         working_dir=args.working_dir,
         province=args.province,
         force=args.force,
         threads=args.threads,
+        fused=args.fused,
+        debug_points=args.debug_points,
+        sweep=args.sweep,
+        sweep_eps=args.sweep_eps,
+        sweep_min_samples=args.sweep_min_samples,
     )
     logger.debug("Configuration:")
     for key, value in config._asdict().items():
@@ -44,5 +42,8 @@ if __name__ == "__main__":
     # Create the processing object
     process = Process(config)
 
-    # Run the process
-    process.process()
+    # Run the process, or the sweep of the clustering parameters
+    if config.sweep:
+        process.sweep()
+    else:
+        process.process()
@@ -1,13 +1,16 @@
 import os
 import logging
 import csv
-from multiprocessing import Pool
-from pyproj import Transformer
+import threading
+from functools import partial
 
 from config import CARTOCIUDAD_PROVINCES_IDS, Config, DEFAULTS
 from download import download_dataset
-from extract_postcodes import extract_postcodes
+from extract_postcodes import extract_centroids, extract_postcodes
 from compute_centroids import compute_centroid
+from report import RunReport, timed
+from sweep import SWEEP_FIELDS, summarize, sweep_centroid
+from workers import create_pool, get_transformer
 
 logger = logging.getLogger("process")
 
@@ -17,6 +20,32 @@ class Process:
     def __init__(self, config: Config):
         self.config = config
         self.processes = min(self.config.threads, os.cpu_count())
+        self._pool = None
+
+    @property
+    def pool(self):
+        """
+        Worker pool shared by all the stages, started on first use so the
+        workers are only started and import their modules once per run.
+        """
+        if self._pool is None:
+            self._pool = create_pool(self.processes)
+        return self._pool
+
+    def close(self):
+        """
+        Stop the worker pool.
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __getstate__(self):
+        # The methods sent to the workers carry the object, but not the pool
+        state = self.__dict__.copy()
+        state["_pool"] = None
+        return state
 
     def get_province_data(self, province: str):
         # Check if the province is valid
@@ -49,19 +78,21 @@ class Process:
 
         return gpkg_path
 
+    def get_provinces(self):
+        """
+        Provinces to process.
+        """
+        if self.config.province != DEFAULTS["province"]:
+            return [self.config.province]
+        return list(CARTOCIUDAD_PROVINCES_IDS.keys())
+
     def get_data(self):
         logger.info("Getting datasets...")
-        provinces = (
-            [self.config.province]
-            if self.config.province != DEFAULTS["province"]
-            else CARTOCIUDAD_PROVINCES_IDS.keys()
-        )
+        provinces = self.get_provinces()
 
-        # Use a multiprocessing pool to download the datasets in parallel
+        # Use the worker pool to download the datasets in parallel
         logger.debug(f"Using {self.processes} processes for downloading datasets.")
-        with Pool(self.processes) as pool:
-            # Map the get_province_data function to the provinces
-            results = pool.map(self.get_province_data, provinces)
+        results = self.pool.map(self.get_province_data, provinces)
 
         logger.info("All datasets ready for processing.")
         for result in results:
@@ -70,19 +101,24 @@ class Process:
         return results
 
     def get_points(self, datasets):
-        # Use a multiprocessing pool to download the datasets in parallel
+        # Use the worker pool to traverse the datasets in parallel
         logger.debug(f"Using {self.processes} processes for traversing the datasets.")
-        with Pool(self.processes) as pool:
-            # Map the get_province_data function to the provinces
-            results = pool.map(self.extract_province, datasets)
+        results = self.pool.map(self.extract_province, datasets)
 
-            # Merge all the results into a single list
-            results_merged = [item for sublist in results for item in sublist]
+        # Merge all the results into a single list
+        results_merged = [item for sublist in results for item in sublist]
 
         logger.info(
             f"All datasets processed generating {len(results_merged)} CSV postcodes."
         )
 
+    def postcodes_dir(self, province=""):
+        """
+        Folder with the CSV files of the postcodes of a province, or of all of
+        them.
+        """
+        return os.path.join(self.config.working_dir, "data", "postcodes", province)
+
     def extract_province(self, dataset):
         """
         Extract the street_number points from the dataset.
@@ -90,39 +126,64 @@ class Process:
         # Get the file name from the dataset path
         province = os.path.basename(dataset).replace(".gpkg", "")
         logger.info(f"Extracting points into data/{province}...")
-        output_dir = os.path.join(
-            self.config.working_dir, "data", "postcodes", province
-        )
+        output_dir = self.postcodes_dir(province)
         os.makedirs(output_dir, exist_ok=True)
         return extract_postcodes(dataset, output_dir)
 
-    def get_centroids(self):
+    def extract_province_centroids(self, dataset):
         """
-        Generate the centroids of the postcodes
+        Extract the street_number points from the dataset and compute the
+        centroids of its postcodes in the same pass. Returns the centroids by
+        the path of their CSV postcode, written only with `debug_points`.
+        """
+        province = os.path.basename(dataset).replace(".gpkg", "")
+        logger.info(f"Extracting points and centroids of {province}...")
+        output_dir = self.postcodes_dir(province)
+        if self.config.debug_points:
+            os.makedirs(output_dir, exist_ok=True)
+        centroids = extract_centroids(dataset, output_dir if self.config.debug_points else None)
+        return {
+            os.path.join(output_dir, f"{postcode}.csv"): centroid
+            for postcode, centroid in centroids.items()
+        }
+
+    def find_postcodes(self):
+        """
+        Paths of all the postcode CSV files.
         """
-        logger.info("Generating centroids...")
-        # Get the list of postcodes
-        postcodes_dir = os.path.join(self.config.working_dir, "data", "postcodes")
         # Walk the postcodes_dir to get all CSV files
         postcodes = []
-        for root, _, files in os.walk(postcodes_dir):
+        for root, _, files in os.walk(self.postcodes_dir()):
             for file in files:
                 if file.endswith(".csv"):
                     postcodes.append(os.path.join(root, file))
+        return postcodes
+
+    def get_centroids(self):
+        """
+        Generate the centroids of the postcodes
+        """
+        logger.info("Generating centroids...")
+        # Get the list of postcodes
+        postcodes = self.find_postcodes()
         logger.info(f"Found {len(postcodes)} postcodes to process.")
 
-        # Use a multiprocessing pool to generate the centroids in parallel
+        # Use the worker pool to generate the centroids in parallel
         logger.debug(f"Using {self.processes} processes for generating centroids.")
-        with Pool(self.processes) as pool:
-            results = pool.map(compute_centroid, postcodes)
-        
+        results = self.pool.map(compute_centroid, postcodes)
+        self.write_centroids(results)
+
+    def write_centroids(self, results):
+        """
+        Write the centroids to the postcodes CSV file.
+        """
         # Write the results in a CSV file using the keys from the results
         logger.info("Writing the centroids to a single CSV file...")
         output_dir = os.path.join(self.config.working_dir, "data")
         output_file = os.path.join(output_dir, "postcodes.csv")
 
         # Transform back from EPSG:25830 to EPSG:4258
-        transformer = Transformer.from_crs("EPSG:25830", "EPSG:4258", always_xy=True)
+        transformer = get_transformer("EPSG:25830", "EPSG:4258")
         for result in results:
             if result is not None:
                 x,y = result["x"], result["y"]
@@ -134,34 +195,170 @@ class Process:
                 result["lon"] = lon
                 result["lat"] = lat
 
+        # The postcodes without a cluster have fewer fields than the rest, so
+        # the header has the fields of every row
         with open(output_file, "w") as f:
-            fieldnames = results[0].keys()
+            fieldnames = list(dict.fromkeys(key for result in results if result is not None for key in result))
             writer = csv.DictWriter(f, fieldnames=fieldnames)
             writer.writeheader()
             for result in results:
                 writer.writerow(result)
         logger.info(f"Centroids written to {output_file}")
 
+    def sweep(self):
+        """
+        Compute the centroids of the CSV postcodes for every combination of
+        the sweep parameters, to compare them with the configured ones.
+        """
+        try:
+            postcodes = sorted(self.find_postcodes())
+            if not postcodes:
+                logger.error("No CSV postcodes found, run the extraction first (use --debug-points with --fused).")
+                return
+            eps_values = list(self.config.sweep_eps)
+            min_samples_values = list(self.config.sweep_min_samples)
+            logger.info(
+                f"Sweeping {len(eps_values) * len(min_samples_values)} combinations of DBSCAN parameters on {len(postcodes)} postcodes..."
+            )
+            results = self.pool.map(
+                partial(sweep_centroid, eps_values=eps_values, min_samples_values=min_samples_values),
+                postcodes,
+            )
+            rows = [row for result in results for row in result]
+        finally:
+            self.close()
+
+        output_file = os.path.join(self.config.working_dir, "data", "postcodes_sweep.csv")
+        with open(output_file, "w") as f:
+            writer = csv.DictWriter(f, fieldnames=SWEEP_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        logger.info(f"Sweep written to {output_file}")
+
+        # Shift in meters from the centroids of the configured parameters
+        for combination in summarize(rows):
+            logger.info(
+                f"eps {combination['eps']}, min_samples {combination['min_samples']}: "
+                f"{combination['pct']}% points in the cluster, {combination['no_cluster']} postcodes without cluster, "
+                f"shift p50 {combination['shift_p50']} m, p95 {combination['shift_p95']} m"
+            )
+
+    def pipeline(self, stage=None):
+        """
+        Run the stages as a graph of tasks on the worker pool instead of one
+        stage after the other: each province is extracted as soon as its
+        dataset is ready, and the centroids of its postcodes are computed as
+        soon as its extraction finishes, or during the extraction in the
+        fused mode. The wall and CPU time of the tasks are added to the
+        report `stage` by the name of their function. Returns the centroids
+        by postcode CSV path.
+        """
+        centroids = {}
+        errors = []
+        pending = threading.Condition()
+        tasks = 0
+
+        def submit(func, arg, then):
+            nonlocal tasks
+            with pending:
+                tasks += 1
+
+            def done(timed_result):
+                nonlocal tasks
+                try:
+                    result, wall, cpu = timed_result
+                    if stage is not None:
+                        stage.task(func.__name__, wall, cpu)
+                    then(result)
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    with pending:
+                        tasks -= 1
+                        pending.notify_all()
+
+            def failed(error):
+                nonlocal tasks
+                errors.append(error)
+                with pending:
+                    tasks -= 1
+                    pending.notify_all()
+
+            # The callbacks run in a thread of the pool, new tasks can be
+            # submitted from them
+            self.pool.apply_async(timed, (func, arg), callback=done, error_callback=failed)
+
+        def on_dataset(dataset):
+            if dataset is None or errors:
+                return
+            logger.info(f"Dataset ready for processing: {dataset}")
+            if self.config.fused:
+                submit(self.extract_province_centroids, dataset, lambda found: on_centroids(dataset, found))
+            else:
+                submit(self.extract_province, dataset, lambda postcodes: on_points(dataset, postcodes))
+
+        def on_centroids(dataset, province_centroids):
+            if province_centroids is None or errors:
+                return
+            province = os.path.basename(dataset).replace(".gpkg", "")
+            logger.info(f"Generated the centroids of {len(province_centroids)} postcodes from {province} in a single pass.")
+            centroids.update(province_centroids)
+
+        def on_points(dataset, postcodes):
+            if postcodes is None or errors:
+                return
+            province = os.path.basename(dataset).replace(".gpkg", "")
+            logger.info(f"Extracted {len(postcodes)} CSV postcodes from {province}, generating their centroids...")
+            for postcode in postcodes:
+                path = os.path.join(self.postcodes_dir(province), f"{postcode}.csv")
+                submit(compute_centroid, path, lambda centroid, path=path: centroids.__setitem__(path, centroid))
+
+        logger.debug(f"Using {self.processes} processes for all the stages.")
+        for province in self.get_provinces():
+            submit(self.get_province_data, province, on_dataset)
+
+        # Wait until every task and the ones they submitted finished
+        with pending:
+            pending.wait_for(lambda: tasks == 0)
+        if errors:
+            raise errors[0]
+        return centroids
 
     def process(self):
         """
-        Process the datasets.
+        Process the datasets, recording the time, memory and I/O of each
+        stage in data/postcodes.report.json.
         """
+        report = RunReport("postcodes")
+        try:
+            # Get, extract and compute the centroids of each dataset as soon
+            # as it is ready
+            logger.info("===========================")
+            logger.info("Processing datasets, extracting their points and generating the centroids...")
+            logger.info("===========================")
+            with report.stage("pipeline") as stage:
+                # The datasets already downloaded are reused
+                provinces = self.get_provinces()
+                data_dir = os.path.join(self.config.working_dir, "data", "provinces")
+                downloaded = sum(os.path.exists(os.path.join(data_dir, f"{province}.gpkg")) for province in provinces)
+                stage.cache("datasets", 0 if self.config.force else downloaded, len(provinces))
 
-        # Get the data
-        logger.info("===========================")
-        logger.info("[1] Processing datasets...")
-        logger.info("===========================")
-        datasets = self.get_data()
+                centroids = self.pipeline(stage)
+                stage.items = len(centroids)
 
-        # Extract the postcodes from the datasets
-        logger.info("===========================")
-        logger.info("[2] Extracting street number points from datasets...")
-        logger.info("===========================")
-        self.get_points(datasets)
+            # Postcodes extracted by previous runs of other provinces
+            with report.stage("remaining_centroids") as stage:
+                remaining = [path for path in self.find_postcodes() if path not in centroids]
+                if remaining:
+                    logger.info(f"Generating the centroids of {len(remaining)} previously extracted postcodes...")
+                    centroids.update(zip(remaining, self.pool.map(compute_centroid, remaining)))
+                stage.items = len(remaining)
 
-        # Generate the centroid of each postcode
-        logger.info("===========================")
-        logger.info("[3] Generating centroids...")
-        logger.info("===========================")
-        self.get_centroids()
+            logger.info(f"Generated the centroids of {len(centroids)} postcodes.")
+            with report.stage("write_centroids") as stage:
+                self.write_centroids([centroids[path] for path in sorted(centroids)])
+                stage.items = len(centroids)
+        finally:
+            # Stop the workers shared by the stages
+            self.close()
+            report.write(os.path.join(self.config.working_dir, "data", "postcodes.report.json"))
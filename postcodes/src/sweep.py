@@ -0,0 +1,107 @@
+import logging
+import math
+
+import numpy as np
+from sklearn.cluster import DBSCAN
+from sklearn.neighbors import radius_neighbors_graph
+
+from config import CLUSTERING_PARAMETERS
+from compute_centroids import points_array, read_points, select_centroid
+
+logger = logging.getLogger("sweep")
+
+SWEEP_FIELDS = [
+    "codigo_postal",
+    "poblacion",
+    "eps",
+    "min_samples",
+    "clusters",
+    "num_points",
+    "pct",
+    "id_porpk",
+    "x",
+    "y",
+    "shift",
+]
+
+
+def sweep_centroid(postcode_path: str, eps_values: list, min_samples_values: list) -> list:
+    """
+    Compute the centroid of a postcode for every combination of the DBSCAN
+    parameters, building the neighbourhood graph of its points once at the
+    largest eps and reusing it as a precomputed sparse distance matrix.
+    Returns a row per combination, with the distance in meters (`shift`)
+    from the centroid computed with the configured parameters.
+    """
+    rows = read_points(postcode_path)
+    if not rows:
+        return []
+    np_rows = points_array(rows)
+    if np_rows is None:
+        return []
+
+    # Distances to the neighbours within the largest eps, DBSCAN only keeps
+    # the ones within the eps of each combination
+    graph = radius_neighbors_graph(
+        np_rows,
+        radius=max(eps_values + [CLUSTERING_PARAMETERS["eps"]]),
+        mode="distance",
+        metric=CLUSTERING_PARAMETERS["metric"],
+    )
+
+    def centroid(eps, min_samples):
+        clusters = DBSCAN(eps=eps, min_samples=min_samples, metric="precomputed").fit_predict(graph)
+        return select_centroid(rows, np_rows, clusters), len(set(clusters) - {-1})
+
+    baseline, _ = centroid(CLUSTERING_PARAMETERS["eps"], CLUSTERING_PARAMETERS["min_samples"])
+
+    results = []
+    for eps in eps_values:
+        for min_samples in min_samples_values:
+            result, clusters = centroid(eps, min_samples)
+            shift = None
+            if result["x"] is not None and baseline["x"] is not None:
+                shift = round(
+                    math.dist(
+                        (float(result["x"]), float(result["y"])),
+                        (float(baseline["x"]), float(baseline["y"])),
+                    ),
+                    1,
+                )
+            results.append(
+                {
+                    **{key: result.get(key) for key in SWEEP_FIELDS},
+                    "eps": eps,
+                    "min_samples": min_samples,
+                    "clusters": clusters,
+                    "shift": shift,
+                }
+            )
+    return results
+
+
+def summarize(results: list) -> list:
+    """
+    Summarize the sweep rows of all the postcodes per combination of
+    parameters: mean cluster share, postcodes without cluster, and median
+    and 95th percentile of the centroid shift.
+    """
+    combinations = {}
+    for result in results:
+        combinations.setdefault((result["eps"], result["min_samples"]), []).append(result)
+
+    summary = []
+    for (eps, min_samples), rows in sorted(combinations.items()):
+        shifts = [row["shift"] for row in rows if row["shift"] is not None]
+        summary.append(
+            {
+                "eps": eps,
+                "min_samples": min_samples,
+                "postcodes": len(rows),
+                "pct": round(float(np.mean([row["pct"] for row in rows])), 2),
+                "no_cluster": sum(1 for row in rows if row["num_points"] == 0),
+                "shift_p50": round(float(np.percentile(shifts, 50)), 1) if shifts else None,
+                "shift_p95": round(float(np.percentile(shifts, 95)), 1) if shifts else None,
+            }
+        )
+    return summary
@@ -0,0 +1,181 @@
+import argparse
+import json
+import logging
+import math
+import os
+import random
+
+import fiona
+from fiona.crs import CRS
+
+from config import STREET_NUMBERS_FIELDS
+
+logger = logging.getLogger("synthetic")
+
+# Center of the synthetic city, and side in meters of the square around it
+# with the rural postcodes
+CITY_CENTER = (-0.376, 39.470)
+REGION_SIZE = 120000
+
+# Share of the postcodes that are urban, and weight of each of them against
+# the Pareto weights (minimum 1) of the rural ones
+URBAN_SHARE = 0.05
+URBAN_WEIGHT = 100
+
+# Share of the points scattered around their postcode instead of in one of
+# its clusters, and of the points without postcode
+NOISE_SHARE = 0.1
+NO_POSTCODE_SHARE = 0.005
+
+METERS_PER_DEGREE = 111320
+
+
+def postcode_sizes(points: int, postcodes: int, rng: random.Random) -> list:
+    """
+    Number of points of each postcode: a few urban postcodes with most of
+    them and a long tail of small rural ones, as in the Cartociudad datasets.
+    """
+    urban = max(1, round(postcodes * URBAN_SHARE))
+    weights = [URBAN_WEIGHT * rng.lognormvariate(0, 0.4) for _ in range(urban)]
+    weights += [rng.paretovariate(1.2) for _ in range(postcodes - urban)]
+    total = sum(weights)
+    return [max(5, round(points * weight / total)) for weight in weights]
+
+
+def postcode_layout(index: int, urban: bool, rng: random.Random) -> list:
+    """
+    Clusters of a postcode as (x, y, sigma) in meters from the city center:
+    one dense cluster per urban postcode around the center, and one to four
+    villages per rural postcode anywhere in the region.
+    """
+    if urban:
+        angle = rng.uniform(0, 2 * math.pi)
+        distance = rng.uniform(0, 4000) * math.sqrt(index + 1) / 2
+        return [(distance * math.cos(angle), distance * math.sin(angle), rng.uniform(400, 900))]
+    x, y = rng.uniform(-REGION_SIZE / 2, REGION_SIZE / 2), rng.uniform(-REGION_SIZE / 2, REGION_SIZE / 2)
+    return [
+        (x + rng.uniform(-6000, 6000), y + rng.uniform(-6000, 6000), rng.uniform(150, 400))
+        for _ in range(rng.randint(1, 4))
+    ]
+
+
+def to_lonlat(x: float, y: float) -> tuple:
+    """
+    Approximate EPSG:4258 coordinates of a point in meters from the city center.
+    """
+    lon0, lat0 = CITY_CENTER
+    return (
+        round(lon0 + x / (METERS_PER_DEGREE * math.cos(math.radians(lat0))), 7),
+        round(lat0 + y / METERS_PER_DEGREE, 7),
+    )
+
+
+def generate_features(points: int, postcodes: int, seed: int = 0, first_postcode: int = 46000):
+    """
+    Generate the street number features of the synthetic dataset, mostly in
+    postcode order but with the neighbouring postcodes interleaved as in the
+    real datasets.
+    """
+    rng = random.Random(seed)
+    sizes = postcode_sizes(points, postcodes, rng)
+    urban = max(1, round(postcodes * URBAN_SHARE))
+
+    records = []
+    for index, size in enumerate(sizes):
+        postcode = f"{first_postcode + index:05d}"
+        town = f"Población {index // 3}" if index >= urban else "València"
+        clusters = postcode_layout(index, index < urban, rng)
+        for _ in range(size):
+            x, y, sigma = rng.choice(clusters)
+            if rng.random() < NOISE_SHARE:
+                x, y = x + rng.uniform(-5 * sigma, 5 * sigma), y + rng.uniform(-5 * sigma, 5 * sigma)
+            else:
+                x, y = rng.gauss(x, sigma), rng.gauss(y, sigma)
+            records.append((index + rng.uniform(0, 2), postcode, town, to_lonlat(x, y)))
+    records.sort(key=lambda record: record[0])
+
+    for number, (_, postcode, town, coordinates) in enumerate(records, start=1):
+        yield {
+            "geometry": {"type": "Point", "coordinates": coordinates},
+            "properties": {
+                "id_porpk": str(number),
+                "codigo_postal": "" if rng.random() < NO_POSTCODE_SHARE else postcode,
+                "tipo_vial": rng.choice(("CALLE", "CALLE", "CALLE", "AVENIDA", "PLAZA", "CAMINO")),
+                "poblacion": town,
+            },
+        }
+
+
+def generate_dataset(gpkg_path: str, points: int, postcodes: int, seed: int = 0) -> dict:
+    """
+    Write a synthetic street numbers GeoPackage, with the schema and CRS of
+    the Cartociudad datasets, and a JSON file with its description next to
+    it. Returns the description.
+    """
+    schema = {
+        "geometry": "Point",
+        "properties": {field: "str" for field in STREET_NUMBERS_FIELDS},
+    }
+    written = 0
+    batch = []
+    with fiona.open(gpkg_path, "w", driver="GPKG", crs=CRS.from_epsg(4258), schema=schema) as dst:
+        for feature in generate_features(points, postcodes, seed):
+            batch.append(feature)
+            if len(batch) == 10000:
+                dst.writerecords(batch)
+                written += len(batch)
+                batch = []
+        dst.writerecords(batch)
+        written += len(batch)
+
+    description = {"points": written, "postcodes": postcodes, "seed": seed}
+    with open(gpkg_path.replace(".gpkg", ".json"), "w") as f:
+        json.dump(description, f, indent=2)
+    logger.info(f"Generated {written} points in {postcodes} postcodes into {gpkg_path}")
+    return description
+
+
+def load_dataset(gpkg_path: str, points: int, postcodes: int, seed: int = 0) -> dict:
+    """
+    Description of a synthetic dataset, generated only when missing or with
+    other parameters.
+    """
+    description_path = gpkg_path.replace(".gpkg", ".json")
+    if os.path.exists(gpkg_path) and os.path.exists(description_path):
+        with open(description_path) as f:
+            description = json.load(f)
+        if description["postcodes"] == postcodes and description["seed"] == seed and (
+            abs(description["points"] - points) <= postcodes * 5
+        ):
+            logger.debug(f"Reusing the synthetic dataset {gpkg_path}")
+            return description
+    os.makedirs(os.path.dirname(gpkg_path), exist_ok=True)
+    return generate_dataset(gpkg_path, points, postcodes, seed)
+
+
+def parse_args():
+    """
+    Parse command line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Generate a synthetic Cartociudad street numbers dataset.")
+    parser.add_argument("output", help="Path of the GeoPackage to write.")
+    parser.add_argument(
+        "--points",
+        type=int,
+        default=100000,
+        help="Approximate number of street numbers. Default is 100000.",
+    )
+    parser.add_argument(
+        "--postcodes",
+        type=int,
+        default=None,
+        help="Number of postcodes. Default is one per 1500 points, with a minimum of 20.",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator. Default is 0.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(name)s | %(levelname)s | %(message)s")
+    args = parse_args()
+    generate_dataset(args.output, args.points, args.postcodes or max(20, args.points // 1500), args.seed)
@@ -0,0 +1,76 @@
+import logging
+import multiprocessing
+from functools import lru_cache
+
+from config import CLUSTERING_PARAMETERS
+from logs import worker_config
+
+logger = logging.getLogger("workers")
+
+# Modules imported once by the forkserver, so the workers forked from it
+# start with them already loaded instead of importing them again
+PRELOAD_MODULES = [
+    "numpy",
+    "fiona",
+    "pyproj",
+    "sklearn.cluster",
+    "download",
+    "extract_postcodes",
+    "compute_centroids",
+    "sweep",
+    "logs",
+]
+
+# State of each worker, set by init_worker
+worker_state = {}
+
+
+@lru_cache(maxsize=None)
+def get_transformer(source_crs: str, target_crs: str):
+    """
+    Get a transformer between two CRS, created once per process.
+    """
+    from pyproj import Transformer
+
+    return Transformer.from_crs(source_crs, target_crs, always_xy=True)
+
+
+def get_dbscan():
+    """
+    Get the DBSCAN estimator of the worker, or a new one with the clustering
+    parameters of the configuration outside the pool.
+    """
+    if "dbscan" not in worker_state:
+        from sklearn.cluster import DBSCAN
+
+        worker_state["dbscan"] = DBSCAN(**CLUSTERING_PARAMETERS)
+    return worker_state["dbscan"]
+
+
+def init_worker(clustering_parameters: dict, log_config: tuple):
+    """
+    Pool initializer: send the logs to the main process, as the setup is not
+    inherited with the forkserver, and create the transformers and the DBSCAN
+    estimator once per worker, so every task of every stage reuses them.
+    """
+    from sklearn.cluster import DBSCAN
+    from logs import init_worker_logging
+
+    init_worker_logging(*log_config)
+
+    get_transformer("EPSG:4258", "EPSG:25830")
+    worker_state["dbscan"] = DBSCAN(**clustering_parameters)
+
+
+def create_pool(processes: int):
+    """
+    Create the worker pool shared by all the stages. The workers are forked
+    from a forkserver that preloads the heavy modules, where available.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(PRELOAD_MODULES)
+    else:
+        context = multiprocessing.get_context()
+    logger.debug(f"Starting {processes} workers with the {context.get_start_method()} start method.")
+    return context.Pool(processes, initializer=init_worker, initargs=(CLUSTERING_PARAMETERS, worker_config()))
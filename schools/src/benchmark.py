@@ -0,0 +1,243 @@
+import os
+import sys
+import json
+import logging
+import argparse
+import statistics
+import subprocess
+import time
+from typing import Dict, List
+from urllib.error import URLError
+from urllib.request import urlopen
+
+from synthetic_pages import generate_schools, list_page, write_corpus
+
+logger = logging.getLogger(__name__)
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def variant_groups(school: Dict) -> List[str]:
+    """Groups of the parsing times a detail page belongs to: its levels table and its missing sections."""
+    variant = school['variant']
+    return [f"levels with {variant['level_columns']} columns"] + [
+        f"no {section}" for section in ('contact', 'schedule', 'info') if not variant[section]
+    ]
+
+
+def benchmark_list(scraper, schools: List[Dict], repeat: int) -> Dict:
+    """
+    Measure the parsing of the list page, as scrape_schools does it.
+
+    Args:
+        scraper (SchoolScraper): Scraper whose parser is measured
+        schools (List[Dict]): Synthetic schools of the page
+        repeat (int): Times the page is parsed
+
+    Returns:
+        Dict: Pages and schools parsed per second
+    """
+    from bs4 import BeautifulSoup
+
+    html = list_page(schools)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        soup = BeautifulSoup(html, 'lxml')
+        rows = scraper._extract_table_data(soup.find('table').find_all('table')[0])
+        times.append(time.perf_counter() - start)
+    best = min(times)
+    return {
+        'page_bytes': len(html.encode('utf-8')),
+        'schools': len(rows),
+        'seconds': round(best, 4),
+        'pages_per_second': round(1 / best, 2),
+        'schools_per_second': round(len(rows) / best, 1),
+    }
+
+
+def benchmark_details(scraper, schools: List[Dict], repeat: int) -> Dict:
+    """
+    Measure the parsing of the detail pages of the corpus in local mode, so
+    only reading and parsing the pages is measured.
+
+    Args:
+        scraper (SchoolScraper): Scraper in local mode whose parser is measured
+        schools (List[Dict]): Synthetic schools of the corpus in tmp/
+        repeat (int): Times the corpus is parsed
+
+    Returns:
+        Dict: Pages parsed per second, in total and per variant of the pages
+    """
+    per_variant = {}
+    totals = []
+    for _ in range(repeat):
+        total = 0
+        for school in schools:
+            start = time.perf_counter()
+            scraper._extract_school_data(school['código'])
+            elapsed = time.perf_counter() - start
+            total += elapsed
+            for group in variant_groups(school):
+                per_variant.setdefault(group, []).append(elapsed)
+        totals.append(total)
+    best = min(totals)
+    return {
+        'pages': len(schools),
+        'seconds': round(best, 4),
+        'pages_per_second': round(len(schools) / best, 1),
+        'variants': {
+            name: {
+                'pages': len(times) // repeat,
+                'median_ms': round(statistics.median(times) * 1000, 3),
+            }
+            for name, times in sorted(per_variant.items())
+        },
+    }
+
+
+def start_portal(port: int, schools: int, seed: int, latency: float, jitter: float, error_rate: float):
+    """
+    Start the fake portal in a subprocess and wait until it answers.
+
+    Returns:
+        subprocess.Popen: The portal process
+    """
+    process = subprocess.Popen([
+        sys.executable, os.path.join(SRC_DIR, 'fake_portal.py'),
+        '--port', str(port), '--schools', str(schools), '--seed', str(seed),
+        '--latency', str(latency), '--jitter', str(jitter), '--error-rate', str(error_rate),
+    ], env={**os.environ, 'LOG_LEVEL': 'WARNING'})
+    for _ in range(100):
+        try:
+            urlopen(f"http://127.0.0.1:{port}/centro.asp?codi=", timeout=5)
+        except URLError as e:
+            if getattr(e, 'code', None) == 404:
+                return process
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"The fake portal didn't start on port {port}")
+
+
+def benchmark_scraping(threads: List[int], port: int) -> List[Dict]:
+    """
+    Measure scrape_schools against the fake portal for every number of
+    threads, with an empty requests cache (cold) and again with the cache
+    of that run (warm).
+
+    Args:
+        threads (List[int]): Numbers of threads to scrape with
+        port (int): Port of the fake portal
+
+    Returns:
+        List[Dict]: Pages per second of every run
+    """
+    import scraper as scraper_module
+
+    os.environ['CONSULTABASE_URL'] = f"http://127.0.0.1:{port}/consulta01.asp"
+    os.environ['CONSULTA_CENTRO_URL'] = f"http://127.0.0.1:{port}/centro.asp"
+    os.environ['REQUEST_DELAY'] = '0'
+    os.environ['OUTPUT_DIR'] = os.path.join('data', 'benchmark_output')
+    os.environ['OUTPUT_FORMAT'] = 'JSON'
+
+    runs = []
+    for count in threads:
+        for cache in ('cold', 'warm'):
+            if cache == 'cold':
+                scraper_module.requests_session.cache.clear()
+            scraper = scraper_module.SchoolScraper(use_local=False)
+            list_pages = len(scraper.list_provinces) * len(scraper.list_regimes)
+            start = time.perf_counter()
+            schools = scraper.scrape_schools(threads=count)
+            elapsed = time.perf_counter() - start
+            with open(os.path.join(os.environ['OUTPUT_DIR'], 'schools.metadata.json'), encoding='utf-8') as f:
+                scraped = json.load(f)['total_schools']
+            runs.append({
+                'threads': count,
+                'cache': cache,
+                'seconds': round(elapsed, 3),
+                'schools': len(schools),
+                'scraped': scraped,
+                'pages_per_second': round((scraped + list_pages) / elapsed, 1),
+            })
+            logger.info(
+                f"Scraped {scraped} of {len(schools)} schools with {count} threads and a {cache} cache "
+                f"in {elapsed:.2f} s, {runs[-1]['pages_per_second']} pages/s"
+            )
+    return runs
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Benchmark the parser and the scraping of the school pages')
+    parser.add_argument('--schools', type=int, default=500,
+                        help='Number of synthetic schools (default: 500)')
+    parser.add_argument('--threads', type=str, default='1,2,4,8',
+                        help='Comma separated numbers of threads to scrape with (default: 1,2,4,8)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Times the pages are parsed, the fastest is kept (default: 3)')
+    parser.add_argument('--port', type=int, default=8090,
+                        help='Port of the fake portal (default: 8090)')
+    parser.add_argument('--latency', type=float, default=20,
+                        help='Mean milliseconds the fake portal adds to every response (default: 20)')
+    parser.add_argument('--jitter', type=float, default=5,
+                        help='Standard deviation in milliseconds of the added latency (default: 5)')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='Share of the requests the fake portal fails (default: 0)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the synthetic schools (default: 0)')
+    parser.add_argument('--work-dir', type=str, default='data/benchmark',
+                        help='Folder for the corpus, the cache and the outputs of the runs (default: data/benchmark)')
+    parser.add_argument('--skip-scraping', action='store_true',
+                        help='Only measure the parser, without the fake portal')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        level=os.getenv('LOG_LEVEL', 'INFO'),
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    )
+    args = parse_args()
+    threads = [int(t) for t in args.threads.split(',') if t.strip()]
+
+    # The scraper opens its cache in the data folder of the working directory
+    os.makedirs(os.path.join(args.work_dir, 'data'), exist_ok=True)
+    os.chdir(args.work_dir)
+    logging.getLogger('scraper').setLevel(logging.WARNING)
+    from scraper import SchoolScraper
+
+    schools = generate_schools(args.schools, args.seed)
+    write_corpus('tmp', schools)
+    logger.info(f"Generated {len(schools)} synthetic schools into {os.path.join(args.work_dir, 'tmp')}")
+
+    results = {
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'schools': args.schools,
+        'latency_ms': args.latency,
+        'jitter_ms': args.jitter,
+        'error_rate': args.error_rate,
+    }
+    scraper = SchoolScraper(use_local=True)
+    results['list'] = benchmark_list(scraper, schools, args.repeat)
+    logger.info(
+        f"List page: {results['list']['page_bytes']} bytes parsed in {results['list']['seconds']} s, "
+        f"{results['list']['schools_per_second']} schools/s"
+    )
+    results['details'] = benchmark_details(scraper, schools, args.repeat)
+    logger.info(f"Detail pages: {results['details']['pages_per_second']} pages/s")
+    for name, variant in results['details']['variants'].items():
+        logger.info(f"\t{name}: {variant['pages']} pages, median {variant['median_ms']} ms")
+
+    if not args.skip_scraping:
+        portal = start_portal(args.port, args.schools, args.seed, args.latency, args.jitter, args.error_rate)
+        try:
+            results['scraping'] = benchmark_scraping(threads, args.port)
+        finally:
+            portal.terminate()
+            portal.wait()
+
+    output_file = os.path.join('data', 'benchmark.json')
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=4)
+    logger.info(f"Saved results to {os.path.join(args.work_dir, output_file)}")
@@ -0,0 +1,141 @@
+import os
+import logging
+import argparse
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from synthetic_pages import detail_page, generate_schools, list_page
+
+logger = logging.getLogger(__name__)
+
+
+class PortalHandler(BaseHTTPRequestHandler):
+    """
+    Answer the list and detail requests of the scraper like the education
+    portal, with the synthetic pages of the server schools.
+    """
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        if not urlsplit(self.path).path.endswith('consulta01.asp'):
+            return self._reply(404, 'Not found')
+        length = int(self.headers.get('Content-Length', 0))
+        form = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode('utf-8')).items()}
+        self._delay()
+
+        # The % wildcard of the province and régimen fields matches any value
+        province = form.get('cpro', '%')
+        regime = form.get('cregime', '%')
+        schools = [
+            school for school in self.server.schools
+            if province in ('%', school['provincia']) and regime in ('%', school['rég.'])
+        ]
+        self._reply(200, list_page(schools), 'consulta01')
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if not url.path.endswith('centro.asp'):
+            return self._reply(404, 'Not found')
+        code = parse_qs(url.query).get('codi', [''])[0]
+        self._delay()
+        school = self.server.by_code.get(code)
+        if school is None:
+            return self._reply(404, 'Not found', 'centro')
+        self._reply(200, detail_page(school), 'centro')
+
+    def _delay(self):
+        """Wait the latency of the server, with its jitter."""
+        if self.server.latency:
+            with self.server.lock:
+                delay = max(self.server.random.gauss(self.server.latency, self.server.jitter), 0)
+            time.sleep(delay / 1000)
+
+    def _reply(self, status: int, body: str, page: str = None) -> None:
+        with self.server.lock:
+            failed = status == 200 and self.server.random.random() < self.server.error_rate
+            if page:
+                self.server.stats[page] = self.server.stats.get(page, 0) + 1
+        if failed:
+            status, body = 500, 'Internal server error'
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+def create_server(host: str, port: int, schools: int, seed: int = 0, latency: float = 0,
+                  jitter: float = 0, error_rate: float = 0) -> ThreadingHTTPServer:
+    """
+    Create a local stand-in of the education portal, to be run with serve_forever.
+
+    Args:
+        host (str): Address to listen on
+        port (int): Port to listen on
+        schools (int): Number of synthetic schools
+        seed (int): Seed of the schools, latencies and errors
+        latency (float): Mean milliseconds added to every response
+        jitter (float): Standard deviation in milliseconds of the added latency
+        error_rate (float): Share of the requests answered with a 500 error
+
+    Returns:
+        ThreadingHTTPServer: The server
+    """
+    server = ThreadingHTTPServer((host, port), PortalHandler)
+    server.daemon_threads = True
+    server.schools = generate_schools(schools, seed)
+    server.by_code = {school['código']: school for school in server.schools}
+    server.latency = latency
+    server.jitter = jitter
+    server.error_rate = error_rate
+    server.random = random.Random(seed)
+    server.lock = threading.Lock()
+    server.stats = {}
+    return server
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Local stand-in of the education portal with synthetic schools')
+    parser.add_argument('--host', type=str, default='127.0.0.1',
+                        help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=int(os.getenv('FAKE_PORTAL_PORT', 8080)),
+                        help='Port to listen on (default: 8080)')
+    parser.add_argument('--schools', type=int, default=2000,
+                        help='Number of synthetic schools (default: 2000)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the schools, latencies and errors (default: 0)')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='Mean milliseconds added to every response (default: 0)')
+    parser.add_argument('--jitter', type=float, default=0,
+                        help='Standard deviation in milliseconds of the added latency (default: 0)')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='Share of the requests answered with a 500 error (default: 0)')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        level=os.getenv('LOG_LEVEL', 'INFO'),
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    )
+    args = parse_args()
+    server = create_server(args.host, args.port, args.schools, args.seed, args.latency, args.jitter, args.error_rate)
+    logger.info(
+        f"Serving {args.schools} synthetic schools on http://{args.host}:{args.port}/consulta01.asp "
+        f"and /centro.asp with {args.latency} ms latency"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
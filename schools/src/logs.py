@@ -0,0 +1,198 @@
+"""
+Logging shared by the main process and the pool workers.
+
+Every process sends its records through a queue to a listener thread of the
+main process, which is the only one writing to the console and the log
+file, so the lines of the workers don't interleave nor contend for the
+stream. The records can be written as text or as JSON lines.
+
+The messages about every item of a hot loop go through sampled loggers (see
+`get_sampled_logger`), which let through the first ones of each call site
+and then one of every `sampling["every"]`, so logging them stays bounded
+even at DEBUG.
+
+The same module is copied in the postcodes, traveltimes and schools apps.
+Only the constants of the app, before `sampling`, differ between the copies,
+which `check_shared.py` at the root of the repository checks.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import os
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+DATE_FORMAT = None
+# Log file of the app, None to only log to the console
+LOG_FILE = "./logs/scraper.log"
+
+# Libraries only logged from WARNING
+QUIET_LOGGERS = ("requests", "urllib3", "requests_cache")
+
+# Records kept per call site by the sampled loggers: the first `head` ones
+# and then one of every `every`
+sampling = {"head": 10, "every": 100}
+
+# Queue of the records of all the processes and the listener writing them,
+# set by `setup_logging`
+log_queue = None
+listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format the records as JSON lines, with the extra fields of the record.
+    """
+
+    RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "name": record.name,
+            "process": record.processName,
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in self.RESERVED})
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Let through the first `sampling["head"]` records of every call site and
+    then one of every `sampling["every"]`, counted in each process.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.counts = {}
+
+    def filter(self, record):
+        key = (record.pathname, record.lineno)
+        count = self.counts[key] = self.counts.get(key, 0) + 1
+        head, every = sampling["head"], sampling["every"]
+        if every <= 1 or count <= head:
+            return True
+        if (count - head) % every:
+            return False
+        record.msg = f"{record.getMessage()} (1 of {every} similar messages)"
+        record.args = None
+        record.sampled = every
+        return True
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    Send the records to a SimpleQueue, written right away instead of by a
+    feeder thread, so no record is lost when the pool terminates a worker.
+    """
+
+    def enqueue(self, record):
+        self.queue.put(record)
+
+
+class QueueListener(logging.handlers.QueueListener):
+    """
+    Write the records of a SimpleQueue to the handlers from a thread.
+    """
+
+    def dequeue(self, block):
+        return self.queue.get()
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+def get_sampled_logger(name):
+    """
+    Get a logger for the messages of every item of a hot loop, which only
+    lets through a sample of them.
+    """
+    sampled = logging.getLogger(name)
+    if not any(isinstance(f, SamplingFilter) for f in sampled.filters):
+        sampled.addFilter(SamplingFilter())
+    return sampled
+
+
+def attach(queue, level):
+    """
+    Replace the handlers of the root logger with one sending the records to
+    the queue, and quiet the chatty libraries.
+    """
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(QueueHandler(queue))
+    root.setLevel(level)
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+
+def setup_logging(level=logging.INFO, json_format=False, sample_every=None, file=None):
+    """
+    Set up the logging of the main process, writing the records of every
+    process to the console, and to `file` if given, from a listener thread.
+    `level` is a level number or name, and `sample_every` overrides
+    `sampling["every"]`.
+    """
+    global log_queue, listener
+
+    formatter = JsonFormatter() if json_format else logging.Formatter(LOG_FORMAT, datefmt=DATE_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if file:
+        os.makedirs(os.path.dirname(file) or ".", exist_ok=True)
+        handlers.append(logging.FileHandler(file))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    stop_logging()
+    # The queue is shared with the workers of any start method, and a lock
+    # created in the fork context can't be sent to a forkserver worker
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        log_queue = multiprocessing.get_context("forkserver").SimpleQueue()
+    else:
+        log_queue = multiprocessing.SimpleQueue()
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    if sample_every is not None:
+        sampling["every"] = sample_every
+    attach(log_queue, level)
+
+
+def stop_logging():
+    """
+    Write the records left in the queue and stop the listener.
+    """
+    global listener
+
+    if listener:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+        listener = None
+
+
+def worker_config():
+    """
+    Get the arguments of `init_worker_logging` for the pool initializers.
+    """
+    return log_queue, logging.getLogger().level, dict(sampling)
+
+
+def init_worker_logging(queue, level, worker_sampling):
+    """
+    Send the records of a pool worker to the queue of the main process, for
+    the workers that don't inherit the setup of the main process.
+    """
+    sampling.update(worker_sampling)
+    if queue is not None:
+        attach(queue, level)
+    else:
+        logging.basicConfig(level=level, format=LOG_FORMAT, datefmt=DATE_FORMAT)
+
+
+atexit.register(stop_logging)
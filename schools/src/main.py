@@ -1,20 +1,10 @@
 import os
 import logging
 import argparse
+from typing import List
+from logs import LOG_FILE, setup_logging
 from scraper import SchoolScraper
 
-# Create logs directory if it doesn't exist
-os.makedirs('logs', exist_ok=True)
-
-# Configure logging
-logging.basicConfig(
-    level=os.getenv('LOG_LEVEL', 'INFO'),
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/scraper.log'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 def setup_directories() -> None:
@@ -38,21 +28,24 @@ def setup_directories() -> None:
         logger.error(f"Failed to create directories: {str(e)}")
         raise
 
-def setup_logging():
-    """Configure logging based on environment variables."""
-    log_level = os.getenv('LOG_LEVEL', 'INFO')
-    log_file = os.getenv('LOG_FILE', './logs/scraper.log')
-    
-    # Configure logging
-    logging.basicConfig(
-        level=getattr(logging, log_level.upper()),
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_file),
-            logging.StreamHandler()
-        ]
-    )
-    return logging.getLogger(__name__)
+def read_school_codes(path: str) -> List[str]:
+    """
+    Read school codes from a file.
+
+    Args:
+        path (str): File with the codes separated by new lines, spaces or
+            commas. Lines starting with # are ignored.
+
+    Returns:
+        List[str]: The school codes
+    """
+    codes = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip().startswith('#'):
+                continue
+            codes.extend(code for code in line.replace(',', ' ').split() if code)
+    return codes
 
 def parse_args():
     DEFAULT_SUBSET = os.getenv('SCHOOL_SUBSET', 0)
@@ -64,6 +57,8 @@ def parse_args():
                       help='Use local files from tmp/ directory instead of making HTTP requests')
     parser.add_argument('--school-codes', type=str, nargs='+',
                       help='List of school codes to scrape (e.g., "03012591 03012592")')
+    parser.add_argument('--school-codes-file', type=str,
+                      help='File with the school codes to scrape, one per line')
     parser.add_argument('--subset', type=int, default=DEFAULT_SUBSET,
                       help=f"Number of schools to scrape ({DEFAULT_SUBSET} for all schools)")
     parser.add_argument('--threads', type=int, default=DEFAULT_THREADS,
@@ -86,17 +81,24 @@ def main() -> None:
     
     Environment Variables:
         LOCAL_MODE: Set to '1' to enable local mode
+        LOG_LEVEL: Logging level
+        LOG_FILE: Log file, empty to only log to the console
+        LOG_FORMAT: TEXT or JSON lines
+        LOG_SAMPLE: Messages about single schools logged after the first ones, one of every LOG_SAMPLE
         Other variables are defined in the .env file
     
     Raises:
         Exception: If any error occurs during the scraping process
     """
-    try:
-        # Disable debug logging from some external libraries
-        logging.getLogger("requests_cache").setLevel(logging.WARNING)
-        logging.getLogger("urllib3").setLevel(logging.WARNING)
-        logging.getLogger("requests").setLevel(logging.WARNING)
+    # Log from the workers through the main process
+    setup_logging(
+        os.getenv('LOG_LEVEL', 'INFO').upper(),
+        json_format=os.getenv('LOG_FORMAT', 'TEXT').upper() == 'JSON',
+        sample_every=int(os.getenv('LOG_SAMPLE', 100)),
+        file=os.getenv('LOG_FILE', LOG_FILE),
+    )
 
+    try:
         # Setup directories
         setup_directories()
         
@@ -112,9 +114,12 @@ def main() -> None:
         
         # Run scraper
         logger.info("Starting school scraping process")
-        if args.school_codes:
-            logger.info(f"Scraping specific schools: {args.school_codes}")
-            schools_data = scraper.scrape_specific_schools(args.school_codes)
+        school_codes = list(args.school_codes or [])
+        if args.school_codes_file:
+            school_codes += read_school_codes(args.school_codes_file)
+        if school_codes:
+            logger.info(f"Scraping {len(school_codes)} specific schools")
+            schools_data = scraper.scrape_specific_schools(school_codes, threads=args.threads)
         else:
             schools_data = scraper.scrape_schools(subset=args.subset, threads=args.threads)
         logger.info(f"Successfully scraped {len(schools_data)} schools")
@@ -0,0 +1,305 @@
+"""
+Run report shared by the entry points, with the wall and CPU time, peak
+memory, I/O bytes, items processed and cache hit ratios of every stage of a
+run, written as JSON.
+
+The CPU time, memory and I/O of a stage include the pool workers, read from
+`/proc` for the main process and all its descendants: the CPU seconds of the
+live processes plus the ones of the children each of them reaped, like the
+workers reaped by the forkserver, the bytes of every read and write (files,
+pipes and sockets), and the peak of the resident memory sampled in a
+thread. The wall and CPU time of the tasks run by the workers can also be
+added per kind of task, running them through `timed`.
+
+Without `/proc`, like on macOS, the CPU seconds and peak memory come from
+`resource.getrusage` for the main process and its reaped children only, and
+the I/O bytes are None. Without `resource`, like on Windows, only the CPU
+seconds of the main process are measured.
+
+The same module is copied in the postcodes, traveltimes and schools apps,
+keep the copies identical. `check_shared.py` at the root of the repository
+checks it.
+"""
+
+import json
+import logging
+import os
+import platform
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logger = logging.getLogger("report")
+
+# Seconds between the samples of the memory of the processes of a stage
+RSS_INTERVAL = 0.1
+
+# Whether the processes can be read from /proc, Linux only
+PROC = os.path.isdir("/proc/self")
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if PROC else None
+
+
+def process_tree(pid):
+    """
+    Ids of a process and all its descendants, the workers of the pools and
+    the ones forked from the forkserver included, read from /proc.
+    """
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                parent = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, []))
+    return tree
+
+
+def process_tree_rss(pid):
+    """
+    Resident memory in bytes of a process and all its descendants, the
+    workers of the pool included, read from /proc in a single pass. Without
+    /proc, the peak memory of the process plus the one of its largest reaped
+    child, from getrusage.
+    """
+    if not PROC:
+        if resource is None:
+            return 0
+        # ru_maxrss is in kilobytes, but in bytes on macOS
+        unit = 1 if sys.platform == "darwin" else 1024
+        return sum(resource.getrusage(who).ru_maxrss * unit for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+
+    children = {}
+    rss = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(entry))
+        rss[int(entry)] = int(fields[21]) * resource.getpagesize()
+
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        total += rss.get(current, 0)
+        pending.extend(children.get(current, []))
+    return total
+
+
+def process_tree_usage(pid):
+    """
+    CPU seconds and bytes read and written by a process and its live
+    descendants, plus the CPU seconds of the children any of them already
+    reaped. The bytes are the ones of every read and write, files, pipes and
+    sockets. Without /proc, the CPU seconds of the process and its reaped
+    children, and None bytes.
+    """
+    if not PROC:
+        if resource is None:
+            return {"cpu_seconds": time.process_time(), "read_bytes": None, "written_bytes": None}
+        cpu = sum(
+            usage.ru_utime + usage.ru_stime
+            for usage in (resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN))
+        )
+        return {"cpu_seconds": cpu, "read_bytes": None, "written_bytes": None}
+
+    usage = {"cpu_seconds": 0.0, "read_bytes": 0, "written_bytes": 0}
+    for current in process_tree(pid):
+        try:
+            with open(f"/proc/{current}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            # utime and stime, plus cutime and cstime of its reaped children
+            usage["cpu_seconds"] += sum(int(field) for field in fields[11:15]) / CLOCK_TICKS
+            with open(f"/proc/{current}/io") as f:
+                io = dict(line.split(": ") for line in f.read().splitlines())
+            usage["read_bytes"] += int(io["rchar"])
+            usage["written_bytes"] += int(io["wchar"])
+        except (OSError, IndexError, KeyError, ValueError):
+            continue
+    return usage
+
+
+class PeakRSS:
+    """
+    Sample the memory of the process tree in a thread while a stage runs.
+    """
+
+    def __init__(self):
+        self.peak = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+
+    def sample(self):
+        while not self.stopped.wait(RSS_INTERVAL):
+            self.peak = max(self.peak, process_tree_rss(os.getpid()))
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+        self.peak = max(self.peak, process_tree_rss(os.getpid()))
+
+
+def timed(func, arg):
+    """
+    Run a task in a worker and return its result with its wall and CPU
+    seconds, for the tasks of the stages that overlap.
+    """
+    start, start_cpu = time.perf_counter(), time.process_time()
+    result = func(arg)
+    return result, time.perf_counter() - start, time.process_time() - start_cpu
+
+
+class Stage:
+    """
+    Measurements of a stage of a run, filled in by RunReport.stage and the
+    items, cache lookups and tasks counted by the stage.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.caches = {}
+        self.tasks = {}
+        self.measures = {}
+        # Set by RunReport.begin
+        self.start = None
+        self.usage = None
+        self.peak = None
+
+    def cache(self, name, hits, lookups):
+        """
+        Count the lookups of a cache and how many of them were hits.
+        """
+        cache = self.caches.setdefault(name, {"hits": 0, "lookups": 0})
+        cache["hits"] += hits
+        cache["lookups"] += lookups
+
+    def task(self, kind, wall, cpu):
+        """
+        Add the wall and CPU seconds of a task run by a worker.
+        """
+        task = self.tasks.setdefault(kind, {"count": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0})
+        task["count"] += 1
+        task["wall_seconds"] += wall
+        task["cpu_seconds"] += cpu
+
+    def as_dict(self):
+        wall = self.measures["wall_seconds"]
+        return {
+            "name": self.name,
+            **self.measures,
+            "items": self.items,
+            "items_per_second": round(self.items / wall, 1) if wall else None,
+            "caches": {
+                name: {**cache, "hit_ratio": round(cache["hits"] / cache["lookups"], 4) if cache["lookups"] else None}
+                for name, cache in self.caches.items()
+            },
+            "tasks": {
+                kind: {key: round(value, 3) if isinstance(value, float) else value for key, value in task.items()}
+                for kind, task in self.tasks.items()
+            },
+        }
+
+
+class RunReport:
+    """
+    Report of a run with the wall and CPU time, peak memory, I/O bytes,
+    items and cache hit ratios of each of its stages. The CPU time, memory
+    and I/O include the workers of the pools, read from /proc.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.started = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.start = time.perf_counter()
+        self.stages = []
+
+    def begin(self, name):
+        """
+        Start measuring a stage, until `end` is called with it.
+        """
+        stage = Stage(name)
+        stage.start = time.perf_counter()
+        stage.usage = process_tree_usage(os.getpid())
+        stage.peak = PeakRSS()
+        stage.peak.__enter__()
+        return stage
+
+    def end(self, stage):
+        """
+        Finish measuring a stage and add it to the report.
+        """
+        stage.peak.__exit__(None, None, None)
+        usage = process_tree_usage(os.getpid())
+        stage.measures = {
+            "wall_seconds": round(time.perf_counter() - stage.start, 3),
+            "cpu_seconds": round(usage["cpu_seconds"] - stage.usage["cpu_seconds"], 3),
+            "peak_rss_mb": round(stage.peak.peak / 2**20, 1),
+        }
+        for key in ("read_bytes", "written_bytes"):
+            # None without /proc
+            stage.measures[key] = usage[key] - stage.usage[key] if usage[key] is not None else None
+        self.stages.append(stage)
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Measure the stage run in the block, which can count its items,
+        caches and tasks in the yielded Stage.
+        """
+        stage = self.begin(name)
+        try:
+            yield stage
+        finally:
+            self.end(stage)
+
+    def as_dict(self):
+        stages = [stage.as_dict() for stage in self.stages]
+        return {
+            "app": self.app,
+            "started": self.started,
+            "finished": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "wall_seconds": round(time.perf_counter() - self.start, 3),
+            "cpu_seconds": round(sum(stage["cpu_seconds"] for stage in stages), 3),
+            "peak_rss_mb": max((stage["peak_rss_mb"] for stage in stages), default=0),
+            "read_bytes": sum(stage["read_bytes"] for stage in stages) if PROC else None,
+            "written_bytes": sum(stage["written_bytes"] for stage in stages) if PROC else None,
+            "machine": {"cpus": os.cpu_count(), "python": platform.python_version()},
+            "stages": stages,
+        }
+
+    def write(self, path):
+        """
+        Write the report as JSON and log a line per stage.
+        """
+        report = self.as_dict()
+        with open(path, "w") as f:
+            json.dump(report, f, indent=4)
+        for stage in report["stages"]:
+            logger.info(
+                f"{stage['name']}: {stage['wall_seconds']} s, {stage['cpu_seconds']} s CPU, "
+                f"peak {stage['peak_rss_mb']} MB, {stage['items']} items"
+            )
+        logger.info(f"Run report written to {path}")
@@ -5,15 +5,22 @@ import requests
 from bs4 import BeautifulSoup
 import pandas as pd
 from pathlib import Path
+import ast
 import json
 import time
 
 from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
 
 import requests_cache
 from requests_cache.backends.sqlite import SQLiteCache
 
+from logs import get_sampled_logger, init_worker_logging, worker_config
+from report import RunReport
+
 logger = logging.getLogger(__name__)
+# Logger for the messages about every school, sampled
+school_logger = get_sampled_logger(f'{__name__}.schools')
 
 # Define a requests cache backend as a SQLite database in the data folder
 requests_backend = SQLiteCache('data/school_scraper_cache.sqlite')
@@ -58,6 +65,8 @@ class SchoolScraper:
             MAX_RETRIES: Maximum number of retries
             OUTPUT_DIR: Directory for output files
             REQUEST_DELAY: Delay between requests
+            LIST_PROVINCES: Comma separated province codes the school list is split by
+            LIST_REGIMES: Comma separated régimen codes the school list is also split by
         """
         self.use_local = use_local
         self.base_url = os.getenv('CONSULTABASE_URL', 'https://ceice.gva.es/abc/i_guiadecentros/es/consulta01.asp')
@@ -67,14 +76,21 @@ class SchoolScraper:
         self.max_retries = int(os.getenv('MAX_RETRIES', '3'))
         self.output_dir = os.getenv('OUTPUT_DIR', './data')
         self.request_delay = float(os.getenv('REQUEST_DELAY', '1.0'))
+        # The school list is queried per province and régimen, % for all of them
+        self.list_provinces = [p.strip() for p in os.getenv('LIST_PROVINCES', '03,12,46').split(',') if p.strip()] or ['%']
+        self.list_regimes = [r.strip() for r in os.getenv('LIST_REGIMES', '').split(',') if r.strip()] or ['%']
     
-    def _get_page_content(self) -> str:
+    def _get_page_content(self, province: str = '%', regime: str = '%') -> str:
         """
         Get the page content either from local file or URL.
         
         In local mode, reads from a local HTML file.
         In normal mode, makes a POST request to the education portal.
         
+        Args:
+            province (str): Province code to list the schools of, % for all
+            regime (str): Régimen code to list the schools of, % for all
+
         Returns:
             str: The HTML content of the page
             
@@ -100,13 +116,13 @@ class SchoolScraper:
                 logger.info(f"Fetching page from {self.base_url}")
                 payload = {
                     "opcion": "on",
-                    "cpro": "%",
-                    "cregime": "%",
+                    "cpro": province,
+                    "cregime": regime,
                     "ter1": "",
                     "tipo_consulta": "F_DENO_LOCALIDAD(A.COD_PROVINCIA, A.COD_MUNI, A.COD_ECOL, A.COD_ESIN, NULL,1)",
                     "tipo_consulta2": "F_DENO_LOCALIDAD(A.COD_PROVINCIA, A.COD_MUNI, A.COD_ECOL, A.COD_ESIN, NULL,2)",
-                    "prov": "%",
-                    "reg": "%",
+                    "prov": province,
+                    "reg": regime,
                     "t": "3",
                     "aceptar": "Buscar"
                 }
@@ -136,19 +152,17 @@ class SchoolScraper:
                 if not response.text.strip():
                     raise ValueError("Received empty response")
                 
-                # Write the content in the tmp folder
+                # Write the content in the tmp folder, a file per shard
                 os.makedirs('tmp', exist_ok=True)
-                with open('tmp/consulta01.html', 'w', encoding='utf-8') as f:
+                local_file = 'tmp/consulta01.html'
+                if (province, regime) != ('%', '%'):
+                    local_file = f"tmp/consulta01_{province.replace('%', 'all')}_{regime.replace('%', 'all')}.html"
+                with open(local_file, 'w', encoding='utf-8') as f:
                     f.write(response.text)
-                    logger.debug("Saved page content to tmp/consulta01.html")
+                    logger.debug(f"Saved page content to {local_file}")
 
-                
-                # Check if the content contains the expected table structure
-                soup = BeautifulSoup(response.text, 'lxml')
-                if not soup.find('table'):
-                    raise ValueError("Page content does not contain expected table structure")
-                
-                logger.info("Successfully fetched and validated page content")
+                # The table structure is checked when the page is parsed
+                logger.info(f"Successfully fetched page content for province {province} and régimen {regime}")
                 return response.text
                 
             except requests.exceptions.RequestException as e:
@@ -170,7 +184,7 @@ class SchoolScraper:
         """
         if 'código' in school:
             try:
-                logger.debug(f"Fetching details for school: {school.get('centro', 'Unknown')}, code: {school['código']}")
+                school_logger.debug('Fetching details for school: %s, code: %s', school.get('centro', 'Unknown'), school['código'])
                 school_details = self._extract_school_data(school['código'])
                 result = school.copy()
                 result.update(school_details)
@@ -190,7 +204,7 @@ class SchoolScraper:
                     if any(char.isdigit() for char in localidad):
                         muni_parts = localidad.split(' - ')
                         if len(muni_parts) < 2:
-                            logger.warning(f"Unexpected format for localidad: {localidad}")
+                            school_logger.warning('Unexpected format for localidad: %s', localidad)
                             result['muni'] = localidad
                             result['cp'] = ''
                         else:
@@ -220,21 +234,89 @@ class SchoolScraper:
                 return sorted_result 
                     
             except Exception as e:
-                logger.error(f"Failed to fetch details for school {school.get('código')} - {school.get('centro', 'Unknown')}: {str(e)}")
                 # Print also the stack trace
-                logger.exception(e)
+                school_logger.exception(
+                    'Failed to fetch details for school %s - %s: %s', school.get('código'), school.get('centro', 'Unknown'), e
+                )
                 return None
 
+    def _parse_list(self, html_content: str) -> List[Dict]:
+        """
+        Parse a page of the school list.
+
+        Args:
+            html_content (str): The HTML content of the page
+
+        Returns:
+            List[Dict]: List of dictionaries containing basic school information
+
+        Raises:
+            ValueError: If the page doesn't have the schools table
+        """
+        # Parse with BeautifulSoup
+        soup = BeautifulSoup(html_content, 'lxml')
+        
+        # Find the outer table
+        outer_table = soup.find('table')
+        if not outer_table:
+            raise ValueError("No outer table found on the page")
+        
+        # Find all inner tables
+        inner_tables = outer_table.find_all('table')
+        if not inner_tables:
+            raise ValueError("No inner tables found")
+        
+        # Get the first inner table (the one we want)
+        target_table = inner_tables[0]
+        logger.info("Found target table for school data")
+        
+        # Extract data from the table
+        return self._extract_table_data(target_table)
+
+    def _get_shard(self, province: str, regime: str) -> Optional[List[Dict]]:
+        """
+        Fetch and parse the school list of a province and régimen, retrying
+        the failed requests.
+
+        Args:
+            province (str): Province code to list the schools of, % for all
+            regime (str): Régimen code to list the schools of, % for all
+
+        Returns:
+            Optional[List[Dict]]: The schools of the shard, or None if it could not be fetched
+        """
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                schools = self._parse_list(self._get_page_content(province, regime))
+                logger.info(f"Found {len(schools)} schools for province {province} and régimen {regime}")
+                return schools
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logger.warning(
+                    f"Attempt {attempt} of {self.max_retries} to list the schools for province {province} "
+                    f"and régimen {regime} failed: {str(e)}"
+                )
+                if attempt < self.max_retries and not self.use_local:
+                    time.sleep(self.request_delay)
+        logger.error(f"Failed to list the schools for province {province} and régimen {regime}")
+        return None
+
     def scrape_schools(self, subset: int = 0, threads: int = 1) -> List[Dict]:
         """
         Main method to scrape school data.
         
         This method:
-        1. Fetches the initial page with the list of schools
-        2. Extracts basic information for each school
-        3. Fetches and extracts detailed information for each school
+        1. Fetches the lists of schools of every province and régimen in parallel
+        2. Extracts basic information for each school, dropping duplicated codes
+        3. Fetches and extracts detailed information for the schools of each
+           list as soon as it arrives, while the other lists are fetched
         4. Saves the collected data
 
+        The time, memory, I/O and cache hits of the scraping and saving stages
+        are written to schools.report.json in the output directory.
+
+        A list that fails after the retries is skipped, so the schools of the
+        rest are still scraped.
+
         Args:
             subset (int): Number of schools to scrape (0 for all schools)
             threads (int): Number of threads to use for scraping (default: 1)
@@ -245,52 +327,86 @@ class SchoolScraper:
         Raises:
             Exception: If any error occurs during the scraping process
         """
+        report = RunReport('schools')
         try:
-            # Get page content
-            logger.info("Fetching page content...")
-            html_content = self._get_page_content()
-            
-            # Parse with BeautifulSoup
-            soup = BeautifulSoup(html_content, 'lxml')
-            
-            # Find the outer table
-            outer_table = soup.find('table')
-            if not outer_table:
-                raise ValueError("No outer table found on the page")
-            
-            # Find all inner tables
-            inner_tables = outer_table.find_all('table')
-            if not inner_tables:
-                raise ValueError("No inner tables found")
-            
-            # Get the first inner table (the one we want)
-            target_table = inner_tables[0]
-            logger.info("Found target table for school data")
-            
-            # Extract data from the table
-            schools_data = self._extract_table_data(target_table)
-            
+            # The local mode has a single page with all the schools
+            shards = [(province, regime) for province in self.list_provinces for regime in self.list_regimes]
+            if self.use_local:
+                shards = [('%', '%')]
+            logger.info(f"Fetching the school lists of {len(shards)} provinces and régimens...")
+
+            # Close the connections of the shared session before forking the
+            # workers, or they would read the responses from the same sockets.
+            # The workers are forked before the threads fetching the lists start
+            requests_session.close()
+
             # Extract detailed information for each school using a multiprocessing pool
-            with Pool(processes=threads) as pool:
-                # Retrieving only a subset of schools if specified
+            # The workers send their logs to the main process
+            pool = Pool(processes=threads, initializer=init_worker_logging, initargs=worker_config())
+            with pool, ThreadPool(len(shards)) as list_pool, report.stage('scrape') as stage:
+                seen = set()
+                pending = []
+                failed = []
+                total = 0
+                logger.info(f"Processing the schools in parallel with {threads} threads")
+                for index, shard_schools in list_pool.imap_unordered(
+                    lambda shard: (shard[0], self._get_shard(*shard[1])), enumerate(shards)
+                ):
+                    if shard_schools is None:
+                        failed.append(shards[index])
+                        continue
+
+                    # Drop the schools already listed by another shard
+                    new_schools = []
+                    for school in shard_schools:
+                        code = school.get('código')
+                        if code in seen:
+                            continue
+                        seen.add(code)
+                        new_schools.append(school)
+
+                    # Retrieving only a subset of schools if specified
+                    if subset > 0:
+                        new_schools = new_schools[:max(subset - total, 0)]
+                    total += len(new_schools)
+
+                    # Count the detail pages already in the requests cache
+                    if not self.use_local:
+                        cached = sum(
+                            requests_session.cache.contains(url=self.detail_url_template.format(school['código']))
+                            for school in new_schools
+                        )
+                        stage.cache('detail_pages', cached, len(new_schools))
+
+                    # Start processing the schools of the shard right away
+                    logger.info(f"Processing {len(new_schools)} new schools, {total} in total")
+                    pending.append((index, new_schools, pool.map_async(self._process_school, new_schools)))
+
+                if failed:
+                    logger.error(f"Failed to list the schools of {len(failed)} of {len(shards)} shards: {failed}")
+                if len(failed) == len(shards):
+                    raise ValueError("No school list could be fetched")
                 if subset > 0:
-                    schools_data = schools_data[:subset]
-                    logger.warning(f"⚠  Only processingc {len(schools_data)} schools")
-                
-                # Use map to process each school in parallel
-                logger.info(f"Processing {len(schools_data)} schools in parallel with {threads} threads")
-                results = pool.map(self._process_school, schools_data)
+                    logger.warning(f"⚠  Only processingc {total} schools")
+
+                # Keep the order of the shards in the results
+                pending.sort(key=lambda item: item[0])
+                schools_data = [school for _, shard_schools, _ in pending for school in shard_schools]
+                results = [result for _, _, processing in pending for result in processing.get()]
+                stage.items = sum(1 for r in results if r is not None)
 
-            
             # Save the data
             final_results = [r for r in results if r is not None]
             if not final_results:
                 logger.warning("No valid data to save")
                 return []
             logger.info(f"Saving data for {len(final_results)} schools")
-            self._save_data(final_results)
-            self._save_metadata(final_results)
-            
+            with report.stage('save') as stage:
+                self._save_data(final_results)
+                self._save_metadata(final_results)
+                stage.items = len(final_results)
+            report.write(os.path.join(self.output_dir, 'schools.report.json'))
+
             return schools_data
             
         except Exception as e:
@@ -328,7 +444,7 @@ class SchoolScraper:
                 # Extract cells
                 cells = row.find_all('td')
                 if len(cells) != len(field_names):
-                    logger.warning(f"Row has {len(cells)} cells, expected {len(field_names)}")
+                    school_logger.warning('Row has %d cells, expected %d', len(cells), len(field_names))
                     continue
                 
                 # Create school data dictionary using field names
@@ -340,21 +456,41 @@ class SchoolScraper:
                 #logger.debug(f"Extracted data for school: {school_data.get('centro', 'Unknown')}")
                 
             except Exception as e:
-                logger.error(f"Error extracting data from row: {str(e)}")
+                school_logger.error('Error extracting data from row: %s', e)
                 continue
         
         logger.info(f"Successfully extracted data for {len(schools_data)} schools")
         return schools_data
     
+    @staticmethod
+    def _output_formats() -> List[str]:
+        """
+        Get the formats the data is saved in.
+
+        Environment Variables:
+            OUTPUT_FORMAT: Comma separated formats to save the data (CSV, JSON, PARQUET), default JSON
+
+        Returns:
+            List[str]: The upper case output formats
+
+        Raises:
+            ValueError: If an output format is not supported
+        """
+        output_formats = [f.strip().upper() for f in os.getenv('OUTPUT_FORMAT', 'JSON').split(',') if f.strip()]
+        unsupported = [f for f in output_formats if f not in ('CSV', 'JSON', 'PARQUET')]
+        if unsupported or not output_formats:
+            raise ValueError(f"Unsupported output format: {', '.join(unsupported)}. Supported formats are CSV, JSON and PARQUET")
+        return output_formats
+
     def _save_data(self, data: List[Dict]) -> None:
         """
-        Save the scraped data to a file.
+        Save the scraped data to one or more files.
         
         Args:
             data (List[Dict]): List of dictionaries containing school data
             
         Environment Variables:
-            OUTPUT_FORMAT: Format to save the data (CSV or JSON)
+            OUTPUT_FORMAT: Comma separated formats to save the data (CSV, JSON, PARQUET)
             ENCODING: File encoding to use
             
         Raises:
@@ -363,56 +499,138 @@ class SchoolScraper:
         """
         os.makedirs(self.output_dir, exist_ok=True)
         
-        # Get output format from environment variable, default to CSV
-        output_format = os.getenv('OUTPUT_FORMAT', 'CSV').upper()
+        output_formats = self._output_formats()
         # Get encoding from environment variable, default to utf-8
         encoding = os.getenv('ENCODING', 'utf-8')
-        
-        logger.info(f"Using output format: {output_format}")
+
+        logger.info(f"Using output formats: {', '.join(output_formats)}")
         logger.info(f"Using encoding: {encoding}")
         
-        if output_format == 'CSV':
+        if 'CSV' in output_formats:
             output_file = os.path.join(self.output_dir, 'schools.csv')
             # Convert to DataFrame and save
             df = pd.DataFrame(data)
             df.to_csv(output_file, index=False, encoding=encoding)
             logger.info(f"Saved data to {output_file} in CSV format with {encoding} encoding")
-        elif output_format == 'JSON':
+        if 'JSON' in output_formats:
             output_file = os.path.join(self.output_dir, 'schools.json')
-            
-            # Clean and optimize data
-            optimized_data = []
-            for school in data:
-                # Remove empty values and detail_url
-                cleaned_school = {
-                    k: v for k, v in school.items() 
-                    if v and k != 'detail_url' and v != [] and v != {}
-                }
-                
-                # Optimize arrays removing empty properties
-                if 'inst' in cleaned_school:
-                    cleaned_school['inst'] = [i for i in cleaned_school['inst'] if i]
-                if 'horario' in cleaned_school:
-                    cleaned_school['horario'] = [h for h in cleaned_school['horario'] if h]
-                if 'info' in cleaned_school:
-                    cleaned_school['info'] = [i for i in cleaned_school['info'] if i]
-                
-                # Optimize nested structures
-                if 'niveles' in cleaned_school:
-                    cleaned_school['niveles'] = [
-                        {k: v for k, v in level.items() if v}
-                        for level in cleaned_school['niveles']
-                    ]
-                
-                optimized_data.append(cleaned_school)
-            
-            # Save as JSON with minimal whitespace
-            with open(output_file, 'w', encoding=encoding) as f:
-                indent = None if len(optimized_data) > 100 else 4
-                json.dump(optimized_data, f, ensure_ascii=False, separators=(',', ':'), indent=indent)
+            self._save_json(data, output_file, encoding)
             logger.info(f"Saved optimized data to {output_file} in JSON format with {encoding} encoding")
-        else:
-            raise ValueError(f"Unsupported output format: {output_format}. Supported formats are CSV and JSON")
+        if 'PARQUET' in output_formats:
+            self._save_parquet(data)
+
+    @staticmethod
+    def _clean_school(school: Dict) -> Dict:
+        """
+        Remove empty values from a school record for the compact JSON output.
+
+        Args:
+            school (Dict): Dictionary containing school data
+
+        Returns:
+            Dict: A new dictionary without empty values, empty list items or detail_url
+        """
+        cleaned_school = {}
+        for k, v in school.items():
+            if not v or k == 'detail_url':
+                continue
+            if k in ('inst', 'horario', 'info'):
+                v = [i for i in v if i]
+            elif k == 'niveles':
+                v = [{lk: lv for lk, lv in level.items() if lv} for level in v]
+            cleaned_school[k] = v
+        return cleaned_school
+
+    def _save_json(self, data: List[Dict], output_file: str, encoding: str) -> None:
+        """
+        Stream the schools into a JSON array, cleaning and writing one record at a time.
+
+        Small outputs (up to 100 schools) are indented to keep them readable.
+
+        Args:
+            data (List[Dict]): List of dictionaries containing school data
+            output_file (str): Path of the JSON file
+            encoding (str): File encoding to use
+        """
+        indent = None if len(data) > 100 else 4
+        with open(output_file, 'w', encoding=encoding) as f:
+            f.write('[')
+            for index, school in enumerate(data):
+                record = json.dumps(self._clean_school(school), ensure_ascii=False, separators=(',', ':'), indent=indent)
+                if indent:
+                    record = '\n' + '\n'.join(' ' * indent + line for line in record.split('\n'))
+                f.write((',' if index else '') + record)
+            f.write('\n]' if indent and data else ']')
+
+    @staticmethod
+    def _to_number(value, cast=int):
+        """Convert a scraped string into a number, returning None when it is not numeric."""
+        try:
+            return cast(str(value).strip().replace(',', '.'))
+        except (TypeError, ValueError):
+            return None
+
+    def _save_parquet(self, data: List[Dict]) -> None:
+        """
+        Save the scraped data as normalized Parquet tables.
+
+        The nested fields are split into child tables keyed by the school code:
+        - schools.parquet: one row per school with the scalar fields
+        - schools_levels.parquet: one row per authorized level (niveles)
+        - schools_facilities.parquet: one row per facility (inst)
+        - schools_schedule.parquet: one row per schedule item (horario)
+        - schools_info.parquet: one row per additional information item (info)
+
+        Args:
+            data (List[Dict]): List of dictionaries containing school data
+
+        Raises:
+            ImportError: If pyarrow is not installed
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        nested_fields = {'niveles', 'inst', 'horario', 'info', 'detail_url'}
+        scalar_fields = sorted({k for school in data for k in school.keys() if k not in nested_fields})
+
+        schools = {field: [] for field in scalar_fields}
+        levels = {'codigo': [], 'nivel': [], 'uni_auto': [], 'pues_auto': [], 'uni_act': [], 'pues_act': []}
+        children = {
+            'inst': ('facilities', {'codigo': [], 'position': [], 'inst': []}),
+            'horario': ('schedule', {'codigo': [], 'position': [], 'horario': []}),
+            'info': ('info', {'codigo': [], 'position': [], 'info': []}),
+        }
+
+        for school in data:
+            codigo = school.get('codigo')
+            for field in scalar_fields:
+                value = school.get(field)
+                if field in ('lat', 'long'):
+                    value = self._to_number(value, float)
+                elif value is not None:
+                    value = str(value)
+                schools[field].append(value)
+
+            for level in school.get('niveles') or []:
+                levels['codigo'].append(codigo)
+                levels['nivel'].append(level.get('nivel'))
+                for key in ('uni_auto', 'pues_auto', 'uni_act', 'pues_act'):
+                    levels[key].append(self._to_number(level.get(key)))
+
+            for field, (_, table) in children.items():
+                for position, item in enumerate(i for i in school.get(field) or [] if i):
+                    table['codigo'].append(codigo)
+                    table['position'].append(position)
+                    table[field].append(item)
+
+        tables = {'schools': schools, 'schools_levels': levels}
+        for name, table in children.values():
+            tables[f'schools_{name}'] = table
+
+        for name, columns in tables.items():
+            output_file = os.path.join(self.output_dir, f'{name}.parquet')
+            pq.write_table(pa.table(columns), output_file, compression='zstd')
+            logger.info(f"Saved {len(next(iter(columns.values()), []))} rows to {output_file} in Parquet format")
 
     def _save_metadata(self, data: List[Dict]) -> None:
         """
@@ -452,7 +670,7 @@ class SchoolScraper:
         """
         try:
             if self.use_local:
-                logger.info("Local mode enabled, using local file")
+                school_logger.debug('Local mode enabled, using local file')
 
                 # Check if the local file exists
                 local_file = Path(f'tmp/centro_{school_code}.html')
@@ -466,7 +684,7 @@ class SchoolScraper:
                 
                 # Get encoding from environment variable, default to utf-8
                 encoding = os.getenv('ENCODING', 'utf-8')
-                logger.info(f"Using encoding: {encoding}")
+                school_logger.debug('Using encoding: %s', encoding)
                 
                 with open(local_file, 'r', encoding=encoding) as f:
                     html_content = f.read()
@@ -493,7 +711,7 @@ class SchoolScraper:
                 os.makedirs('tmp', exist_ok=True)
                 with open(f'tmp/centro_{school_code}.html', 'w', encoding='utf-8') as f:
                     f.write(html_content)
-                logger.debug(f"Saved detail page to tmp/centro_{school_code}.html")
+                school_logger.debug('Saved detail page to tmp/centro_%s.html', school_code)
             
             # Parse the detail page
             soup = BeautifulSoup(html_content, 'lxml')
@@ -558,7 +776,7 @@ class SchoolScraper:
                                     long_cell = long_row.find_all('td')[index]
                                     details['long'] = long_cell.text.strip().replace(',', '.')
                 else:
-                    logger.warning("No contact details div found")
+                    school_logger.warning('No contact details div found for school %s', school_code)
                 
                 # Extract coordinates
 
@@ -646,59 +864,153 @@ class SchoolScraper:
                         details['info'] = [item.text.strip() for item in info_items if item.text.strip()]
                 
             except Exception as e:
-                logger.warning(f"Error extracting specific field: {str(e)}")
-                logger.exception(e)
+                school_logger.warning('Error extracting specific field: %s', e, exc_info=True)
                 # Continue with what we have extracted so far
             
-            logger.debug(f"Extracted {len(details)} details from school page")
+            school_logger.debug('Extracted %d details from school page', len(details))
             return details
             
         except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to fetch school details: {str(e)}")
+            school_logger.error('Failed to fetch school details: %s', e)
             raise
         except Exception as e:
-            logger.error(f"Error extracting school details: {str(e)}")
+            school_logger.error('Error extracting school details: %s', e)
             raise 
 
-    def scrape_specific_schools(self, school_codes: List[str]) -> List[Dict]:
+    def _load_saved_schools(self) -> List[Dict]:
         """
-        Scrape data for specific schools by their codes.
-        
+        Load the schools saved by a previous run, from the output the data is
+        saved to, so merging into it doesn't drop the schools of another
+        format. With several output formats, the first saved one of JSON,
+        PARQUET and CSV is read.
+
+        Returns:
+            List[Dict]: The saved schools, empty if none of the output files exists
+        """
+        output_formats = self._output_formats()
+        encoding = os.getenv('ENCODING', 'utf-8')
+        for output_format in ('JSON', 'PARQUET', 'CSV'):
+            if output_format not in output_formats:
+                continue
+            output_file = os.path.join(self.output_dir, f'schools.{output_format.lower()}')
+            if not os.path.exists(output_file):
+                continue
+            logger.info(f"Merging the schools into {output_file}")
+            if output_format == 'JSON':
+                with open(output_file, encoding=encoding) as f:
+                    return json.load(f)
+            if output_format == 'PARQUET':
+                return self._load_parquet()
+            return self._load_csv(output_file, encoding)
+
+        logger.warning(f"No saved schools in {self.output_dir} to merge the schools into, only the scraped schools will be saved")
+        return []
+
+    @staticmethod
+    def _load_csv(output_file: str, encoding: str) -> List[Dict]:
+        """
+        Load the schools saved as CSV, where the nested fields are written as
+        their Python representation.
+
+        Args:
+            output_file (str): Path of the CSV file
+            encoding (str): File encoding to use
+
+        Returns:
+            List[Dict]: The saved schools
+        """
+        df = pd.read_csv(output_file, dtype=str, keep_default_na=False, encoding=encoding)
+        schools = df.to_dict(orient='records')
+        for school in schools:
+            for field in ('niveles', 'inst', 'horario', 'info'):
+                if school.get(field, '').startswith('['):
+                    school[field] = ast.literal_eval(school[field])
+        return schools
+
+    def _load_parquet(self) -> List[Dict]:
+        """
+        Load the schools saved as normalized Parquet tables, nesting the rows
+        of the child tables back into their schools.
+
+        Returns:
+            List[Dict]: The saved schools
+
+        Raises:
+            ImportError: If pyarrow is not installed
+        """
+        import pyarrow.parquet as pq
+
+        def read(name):
+            output_file = os.path.join(self.output_dir, f'{name}.parquet')
+            return pq.read_table(output_file).to_pylist() if os.path.exists(output_file) else []
+
+        schools = {}
+        for row in read('schools'):
+            schools[row['codigo']] = {
+                k: v if v is None or k in ('lat', 'long') else str(v) for k, v in row.items()
+            }
+
+        for row in read('schools_levels'):
+            school = schools.get(row.pop('codigo'))
+            if school is not None:
+                level = {k: '' if v is None else str(v) for k, v in row.items()}
+                school.setdefault('niveles', []).append(level)
+
+        for name, field in (('facilities', 'inst'), ('schedule', 'horario'), ('info', 'info')):
+            for row in sorted(read(f'schools_{name}'), key=lambda row: row['position']):
+                school = schools.get(row['codigo'])
+                if school is not None:
+                    school.setdefault(field, []).append(row[field])
+
+        return list(schools.values())
+
+    def scrape_specific_schools(self, school_codes: List[str], threads: int = 1) -> List[Dict]:
+        """
+        Scrape data for specific schools by their codes and merge it into the
+        saved data.
+
+        The detail page of every school is fetched once, in parallel, and the
+        scraped schools replace the ones with the same code in the saved
+        output, or are appended to it. The schools that fail keep their saved data.
+
         Args:
             school_codes (List[str]): List of school codes to scrape
+            threads (int): Number of threads to use for scraping (default: 1)
             
         Returns:
-            List[Dict]: List of dictionaries containing school data
+            List[Dict]: List of dictionaries containing the scraped school data
             
         Raises:
             Exception: If any error occurs during the scraping process
         """
         try:
-            schools_data = []
-            
-            for school_code in school_codes:
-                try:
-                    logger.info(f"Fetching details for school code: {school_code}")
-                    school_details = self._extract_school_data(school_code)
-                    
-                    # Add the school code to the details
-                    school_details['código'] = school_code
+            # Drop the repeated codes, keeping their order
+            school_codes = list(dict.fromkeys(school_codes))
+
+            # Close the connections of the shared session before forking the workers
+            requests_session.close()
+
+            # _process_school fetches the details page of each code once
+            with Pool(processes=threads, initializer=init_worker_logging, initargs=worker_config()) as pool:
+                logger.info(f"Processing {len(school_codes)} schools in parallel with {threads} threads")
+                results = pool.map(self._process_school, [{'código': code} for code in school_codes])
+
+            schools_data = [result for result in results if result is not None]
+            failed = [code for code, result in zip(school_codes, results) if result is None]
+            if failed:
+                logger.error(f"Failed to fetch details for {len(failed)} schools: {', '.join(failed)}")
+
+            # Merge into the saved schools in place. The fields only shown in
+            # the list, like denGenEs and cp, are kept from the saved schools
+            merged = {school.get('codigo'): school for school in self._load_saved_schools()}
+            updated = sum(1 for school in schools_data if school['codigo'] in merged)
+            for school in schools_data:
+                merged[school['codigo']] = {**merged.get(school['codigo'], {}), **school}
+            logger.info(f"Updated {updated} schools and added {len(schools_data) - updated}, {len(merged)} in total")
 
-                    # Enrich the details
-                    school_details = self._process_school(school_details)
-                    
-                    schools_data.append(school_details)
-                    
-                    # Add delay between requests if not in local mode
-                    if not self.use_local:
-                        time.sleep(self.request_delay)
-                        
-                except Exception as e:
-                    logger.error(f"Failed to fetch details for school code {school_code}: {str(e)}")
-                    continue
-            
             # Save the data
-            self._save_data(schools_data)
+            self._save_data(list(merged.values()))
+            self._save_metadata(list(merged.values()))
             
             return schools_data
             
@@ -0,0 +1,226 @@
+import os
+import random
+from html import escape
+from typing import Dict, List
+
+# Province codes of the portal and a few towns of each one
+PROVINCES = {
+    '03': [('03001', 'ALICANTE'), ('03201', 'ELCHE'), ('03300', 'ORIHUELA'), ('03700', 'DÉNIA'), ('03801', 'ALCOY')],
+    '12': [('12001', 'CASTELLÓN DE LA PLANA'), ('12500', 'VINARÒS'), ('12540', 'VILA-REAL'), ('12600', 'LA VALL D\'UIXÓ')],
+    '46': [('46001', 'VALÈNCIA'), ('46100', 'BURJASSOT'), ('46600', 'ALZIRA'), ('46700', 'GANDIA'), ('46800', 'XÀTIVA')],
+}
+
+# Régimen of the schools, as shown in the list and sent in the cregime field
+REGIMES = ['PÚB.', 'PRIV.', 'CONC.']
+
+LEVELS = [
+    'EDUCACIÓN INFANTIL 1er CICLO',
+    'EDUCACIÓN INFANTIL 2º CICLO',
+    'EDUCACIÓN PRIMARIA',
+    'EDUCACIÓN SECUNDARIA OBLIGATORIA',
+    'BACHILLERATO CIENCIAS Y TECNOLOGÍA',
+    'BACHILLERATO HUMANIDADES Y CIENCIAS SOCIALES',
+    'CICLO FORMATIVO GRADO MEDIO',
+]
+
+FACILITIES = ['Comedor', 'Gimnasio', 'Biblioteca', 'Ascensor', 'Transporte', 'Aula de informática', 'Patio cubierto']
+
+SCHEDULE = [
+    'Jornada continua de mañana',
+    'Horario de entrada: 9:00 h.',
+    'Horario de salida: 14:00 h.',
+    'Jornada partida de tarde',
+    'Comedor escolar de 14:00 a 15:30',
+    'Actividades extraescolares',
+]
+
+# Columns of the levels table of the variants, the portal shows 5 columns
+# for most schools and fewer for some of them
+LEVEL_COLUMNS = [5, 5, 5, 3, 2]
+
+
+def generate_schools(count: int, seed: int = 0) -> List[Dict]:
+    """
+    Generate the synthetic schools of the portal, covering the variants of the
+    detail pages handled by the parser.
+
+    Args:
+        count (int): Number of schools
+        seed (int): Seed of the random generator
+
+    Returns:
+        List[Dict]: Schools with their list fields and the variant of their detail page
+    """
+    rng = random.Random(seed)
+    schools = []
+    codes = set()
+    while len(schools) < count:
+        province = rng.choice(list(PROVINCES))
+        code = f"{province}{rng.randint(0, 999999):06d}"
+        if code in codes:
+            continue
+        codes.add(code)
+        cp, town = rng.choice(PROVINCES[province])
+        kind = rng.choice(['CEIP', 'IES', 'CC', 'EI', 'CIPFP'])
+        schools.append({
+            'código': code,
+            'centro': f"{kind} {town.title()} {len(schools) + 1}",
+            'rég.': rng.choice(REGIMES),
+            'localidad': f"{cp} - {town}",
+            'dirección': f"CALLE {rng.choice(['MAYOR', 'NUEVA', 'DEL MAR', 'SAN VICENTE'])}, {rng.randint(1, 120)}",
+            'teléfono': f"96{rng.randint(0, 9999999):07d}",
+            'provincia': province,
+            'lat': round(rng.uniform(37.9, 40.7), 6),
+            'long': round(rng.uniform(-1.5, 0.5), 6),
+            'variant': {
+                'level_columns': rng.choice(LEVEL_COLUMNS),
+                'levels': rng.randint(1, len(LEVELS)),
+                'facilities': rng.randint(0, len(FACILITIES)),
+                'contact': rng.random() > 0.03,
+                'schedule': rng.random() > 0.2,
+                'info': rng.random() > 0.3,
+                'other_tables': rng.randint(0, 2),
+            },
+        })
+    return schools
+
+
+def boilerplate(padding: int) -> str:
+    """
+    Menus and scripts of the portal pages, which make most of their weight.
+
+    Args:
+        padding (int): Number of menu links
+
+    Returns:
+        str: HTML of the navigation and scripts
+    """
+    links = ''.join(
+        f'<li><a href="/abc/i_guiadecentros/es/pagina{i}.asp"><img src="/img/menu{i % 7}.gif" alt=""> Sección {i}</a></li>'
+        for i in range(padding)
+    )
+    script = 'function menu(i) { document.getElementById("m" + i).style.display = "block"; }\n' * (padding // 10)
+    return f'<div id="menu"><ul>{links}</ul></div><script type="text/javascript">{script}</script>'
+
+
+def list_page(schools: List[Dict], padding: int = 50) -> str:
+    """
+    Render the results page of consulta01.asp with the schools.
+
+    Args:
+        schools (List[Dict]): Schools to list
+        padding (int): Number of menu links of the page
+
+    Returns:
+        str: HTML of the page
+    """
+    fields = ['código', 'centro', 'rég.', 'localidad', 'dirección', 'teléfono']
+    header = ''.join(f'<td class="cabecera">{field.upper()}</td>' for field in fields)
+    rows = ''.join(
+        '<tr>' + ''.join(f'<td>{escape(school[field])}</td>' for field in fields) + '</tr>'
+        for school in schools
+    )
+    # The last row has the total, with fewer cells than the header
+    total = f'<tr><td colspan="{len(fields)}">Total: {len(schools)} centros</td></tr>'
+    return (
+        '<html><head><meta charset="utf-8"><title>Guía de centros docentes</title></head><body>'
+        f'{boilerplate(padding)}'
+        '<table width="100%"><tr><td>'
+        f'<table class="listado"><tr>{header}</tr>{rows}{total}</table>'
+        '</td></tr></table></body></html>'
+    )
+
+
+def detail_page(school: Dict, padding: int = 150) -> str:
+    """
+    Render the centro.asp page of a school, with the sections of its variant.
+
+    Args:
+        school (Dict): School generated by generate_schools
+        padding (int): Number of menu links of the page
+
+    Returns:
+        str: HTML of the page
+    """
+    variant = school['variant']
+    rng = random.Random(school['código'])
+    town = school['localidad'].split(' - ')[1]
+    parts = [
+        '<html><head><meta charset="utf-8"><title>Guía de centros docentes</title></head><body>',
+        boilerplate(padding),
+        '<table width="100%">',
+        f'<tr><td bgcolor="#EBEBEB" colspan="2"><span class="Estilo1">{escape(school["centro"])}\n</span></td></tr>',
+        f'<tr><td bgcolor="#EBEBEB">Código: {school["código"]}</td>'
+        f'<td bgcolor="#EBEBEB">Régimen:&nbsp;{school["rég."]}</td></tr>',
+        f'<tr><td bgcolor="#EBEBEB">CIF: Q{rng.randint(0, 9999999):07d}H</td></tr>',
+        '</table>',
+    ]
+
+    if variant['contact']:
+        lat = str(school['lat']).replace('.', ',')
+        long = str(school['long']).replace('.', ',')
+        parts.append(
+            '<div class="nivelCentro">'
+            '<table><tr><td>Datos generales</td></tr></table>'
+            '<table><tr><td><img src="/img/centro.gif" alt=""></td></tr></table>'
+            '<table>'
+            f'<tr><td>Dirección:</td><td>{escape(school["dirección"])}</td>'
+            f'<td>Teléfono:</td><td>{school["teléfono"]}</td></tr>'
+            f'<tr><td>Localidad:</td><td>{escape(town)}</td><td>Comarca:</td><td>COMARCA {school["provincia"]}</td></tr>'
+            f'<tr><td>E-correo:</td><td>{school["código"]}@edu.gva.es</td><td>Titular:</td><td>GENERALITAT VALENCIANA</td></tr>'
+            '<tr><td>Lat:</td><td>Long:</td></tr>'
+            f'<tr><td>{lat}</td><td>{long}</td></tr>'
+            '</table></div>'
+        )
+
+    facilities = rng.sample(FACILITIES, variant['facilities'])
+    parts.append('<div class="instalaciones">' + ''.join(
+        f'<img src="/img/inst{i}.gif" title="{escape(facility)}">' for i, facility in enumerate(facilities)
+    ) + '</div>')
+
+    # Other tables with the same class before the levels one
+    for i in range(variant['other_tables']):
+        parts.append(
+            '<table class="fondos"><tr><th>Enseñanza</th><th>Turno</th></tr>'
+            f'<tr><td>Enseñanza {i}</td><td>Mañana</td></tr></table>'
+        )
+
+    columns = variant['level_columns']
+    headers = ['Nivel educativo', 'Unidades autorizadas', 'Puestos autorizados', 'Unidades activas', 'Puestos activos']
+    rows = ''
+    for level in LEVELS[:variant['levels']]:
+        values = [escape(level)] + [str(rng.randint(1, 30)) for _ in range(columns - 1)]
+        rows += '<tr>' + ''.join(f'<td>{value}</td>' for value in values) + '</tr>'
+    parts.append(
+        '<table class="fondos"><tr>'
+        + ''.join(f'<th>{header}</th>' for header in headers[:columns])
+        + f'</tr>{rows}</table>'
+    )
+
+    if variant['schedule']:
+        parts.append('<div id="secc152"><ul>' + ''.join(f'<li>{item}</li>' for item in SCHEDULE) + '</ul></div>')
+    if variant['info']:
+        parts.append(
+            '<div id="secc16"><table>'
+            '<tr><td>Centro bilingüe</td></tr><tr><td></td></tr><tr><td>Programa de acogida</td></tr>'
+            '</table></div>'
+        )
+    parts.append('</body></html>')
+    return ''.join(parts)
+
+
+def write_corpus(directory: str, schools: List[Dict]) -> None:
+    """
+    Write the pages of the schools as the local mode of the scraper expects
+    them: consulta01.html and centro_<código>.html.
+
+    Args:
+        directory (str): Folder of the pages, tmp/ for the local mode
+        schools (List[Dict]): Schools generated by generate_schools
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'consulta01.html'), 'w', encoding='utf-8') as f:
+        f.write(list_page(schools))
+    for school in schools:
+        with open(os.path.join(directory, f"centro_{school['código']}.html"), 'w', encoding='utf-8') as f:
+            f.write(detail_page(school))
@@ -0,0 +1,305 @@
+"""
+This is a script that clips the OSM PBF file of the region to the area
+where the travel times are computed, before preparing it for OSRM.
+
+The area is the convex hull, or the bounding box, of the postcode centroids
+and the school coordinates, when the schools file is available, grown by a
+buffer so the routes leaving the area and coming back are still found. The
+ways inside it are then filtered to the ones the OSRM profiles can use: with
+only the driving profile, the roads a car can drive on.
+
+The clipped file is written as `data/<region>-clipped.osm.pbf`, and the clip
+polygon and the filters next to it as `data/<region>-clipped.clip.json`,
+which `prepare.sh` stores in `data/travel_times_osm_pbf.metadata.json`.
+Both extracts are done with `osmium`.
+"""
+
+import logging
+import os
+import csv
+import argparse
+import json
+import shutil
+import subprocess
+import time
+
+import numpy as np
+from scipy.spatial import ConvexHull
+
+# Earth radius in kilometers
+EARTH_RADIUS = 6371.0
+
+# Number of vertices of the circles approximating the buffer of the points
+BUFFER_VERTICES = 32
+
+# Ways kept for each profile, as osmium tags-filter expressions. The nodes
+# of the ways, with their barriers and signals, are kept with them
+DRIVING_FILTERS = [
+    "w/highway=motorway,motorway_link,trunk,trunk_link,primary,primary_link,secondary,secondary_link,"
+    "tertiary,tertiary_link,unclassified,residential,living_street,service,road",
+    "w/route=ferry",
+    "r/type=restriction",
+]
+ALL_FILTERS = [
+    "w/highway",
+    "w/route=ferry",
+    "w/railway=platform",
+    "w/public_transport=platform",
+    "w/man_made=pier",
+    "r/type=restriction",
+]
+
+# Define arguments with argparse
+parser = argparse.ArgumentParser(
+    description="Clip the OSM PBF file to the area of the postcodes and schools."
+)
+
+defaults = {
+    "loglevel": os.environ.get("LOGLEVEL", "INFO"),
+    "region": os.environ.get("REGION", "valencia"),
+    "postcodes": os.environ.get("INPUT", "data/postcodes.csv"),
+    "schools": os.environ.get("SCHOOLS", "data/schools.json"),
+    "lat": os.environ.get("LAT_FIELD", "lat"),
+    "lon": os.environ.get("LON_FIELD", "lon"),
+    "buffer": float(os.environ.get("CLIP_BUFFER", 10)),
+    "shape": os.environ.get("CLIP_SHAPE", "hull"),
+    "profiles": os.environ.get("PROFILES", "driving"),
+}
+
+parser.add_argument(
+    "--loglevel",
+    "-l",
+    choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+    metavar="LOGLEVEL",
+    default=defaults["loglevel"],
+    type=str,
+    help=f"Logging level for the script. Options: DEBUG, INFO, WARNING, ERROR, CRITICAL. Default {defaults['loglevel']}.",
+)
+parser.add_argument(
+    "--region",
+    default=defaults["region"],
+    type=str,
+    help=f"Geofabrik region of the OSM PBF file, read from data/<region>-latest.osm.pbf. Default {defaults['region']}.",
+)
+parser.add_argument(
+    "--postcodes",
+    default=defaults["postcodes"],
+    type=str,
+    help=f"Path to the postcodes CSV file produced by the postcodes app. Default {defaults['postcodes']}.",
+)
+parser.add_argument(
+    "--schools",
+    default=defaults["schools"],
+    type=str,
+    help=f"Path to the schools JSON file produced by the schools app, skipped if it doesn't exist. Default {defaults['schools']}.",
+)
+parser.add_argument(
+    "--lat",
+    default=defaults["lat"],
+    type=str,
+    help=f"Field in the postcodes CSV file that contains the latitude coordinates. Default {defaults['lat']}.",
+)
+parser.add_argument(
+    "--lon",
+    default=defaults["lon"],
+    type=str,
+    help=f"Field in the postcodes CSV file that contains the longitude coordinates. Default {defaults['lon']}.",
+)
+parser.add_argument(
+    "--buffer",
+    default=defaults["buffer"],
+    type=float,
+    help=f"Distance in kilometers the area is grown around the points. Default {defaults['buffer']}.",
+)
+parser.add_argument(
+    "--shape",
+    choices=["hull", "bbox"],
+    default=defaults["shape"],
+    type=str,
+    help=f"Clip to the convex hull or to the bounding box of the points. Default {defaults['shape']}.",
+)
+parser.add_argument(
+    "--profiles",
+    default=defaults["profiles"],
+    type=str,
+    help=f"Comma separated OSRM profiles the file is prepared for. Only the driving profile keeps just the drivable ways. Default {defaults['profiles']}.",
+)
+
+logger = logging.getLogger("clip_pbf")
+
+
+def read_points(postcodes_path, schools_path, lat_field, lon_field):
+    """
+    Read the lat/lon of the postcode centroids and of the schools, skipping
+    the ones without valid coordinates. Returns a (N, 2) array of lat/lon and
+    the number of points of each file.
+    """
+    points = []
+    with open(postcodes_path, "r") as csvfile:
+        for row in csv.DictReader(csvfile):
+            try:
+                points.append((float(row[lat_field]), float(row[lon_field])))
+            except (KeyError, ValueError):
+                continue
+    counts = {"postcodes": len(points), "schools": 0}
+
+    if os.path.exists(schools_path):
+        with open(schools_path, "r", encoding="utf-8") as f:
+            for school in json.load(f):
+                try:
+                    points.append((float(school["lat"]), float(school["long"])))
+                except (KeyError, TypeError, ValueError):
+                    continue
+        counts["schools"] = len(points) - counts["postcodes"]
+    else:
+        logger.warning(f"Schools file {schools_path} does not exist, clipping to the postcodes only.")
+
+    return np.array(points, dtype=np.float64).reshape(-1, 2), counts
+
+
+def project(coords, lat0):
+    """
+    Project lat/lon pairs into an equirectangular plane in kilometers around
+    the reference latitude `lat0`, accurate enough at a regional scale.
+    """
+    return np.column_stack(
+        (
+            np.radians(coords[:, 1]) * np.cos(np.radians(lat0)) * EARTH_RADIUS,
+            np.radians(coords[:, 0]) * EARTH_RADIUS,
+        )
+    )
+
+
+def unproject(xy, lat0):
+    """
+    Inverse of `project`, returning lon/lat pairs as GeoJSON expects them.
+    """
+    return np.column_stack(
+        (
+            np.degrees(xy[:, 0] / (np.cos(np.radians(lat0)) * EARTH_RADIUS)),
+            np.degrees(xy[:, 1] / EARTH_RADIUS),
+        )
+    )
+
+
+def clip_polygon(points, buffer, shape="hull"):
+    """
+    Polygon around the lat/lon points grown by `buffer` kilometers, as a
+    closed counterclockwise ring of lon/lat pairs, and its area in km2. The
+    buffer of the hull is the hull of circles around its vertices.
+    """
+    lat0 = float(np.mean(points[:, 0]))
+    xy = project(points, lat0)
+    if shape == "bbox":
+        (x0, y0), (x1, y1) = xy.min(axis=0) - buffer, xy.max(axis=0) + buffer
+        ring = np.array([(x0, y0), (x1, y0), (x1, y1), (x0, y1)])
+    else:
+        # The points are grown before the hull, so a few points or points
+        # in a line still have an area
+        angles = np.linspace(0, 2 * np.pi, BUFFER_VERTICES, endpoint=False)
+        circle = np.column_stack((np.cos(angles), np.sin(angles))) * max(buffer, 1e-3)
+        grown = (xy[:, None, :] + circle[None, :, :]).reshape(-1, 2)
+        ring = grown[ConvexHull(grown).vertices]
+
+    x, y = ring[:, 0], ring[:, 1]
+    area = 0.5 * abs(np.dot(x, np.roll(y, 1)) - np.dot(y, np.roll(x, 1)))
+    coordinates = np.round(unproject(ring, lat0), 6).tolist()
+    return coordinates + coordinates[:1], float(area)
+
+
+def osmium(*arguments):
+    """
+    Run an osmium command, logging its output.
+    """
+    command = ["osmium", *arguments]
+    logger.debug(f"Running {' '.join(command)}")
+    result = subprocess.run(command, capture_output=True, text=True)
+    for line in (result.stdout + result.stderr).splitlines():
+        logger.debug(line)
+    if result.returncode != 0:
+        raise RuntimeError(f"osmium {arguments[0]} failed: {result.stderr.strip()}")
+
+
+if __name__ == "__main__":
+    # Parse the arguments
+    args = parser.parse_args()
+
+    # Set up basic logging
+    logging.basicConfig(
+        level=args.loglevel.upper(),
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%H:%M:%S",
+    )
+    logger.info("Starting OSM PBF clipping...")
+
+    source = f"data/{args.region}-latest.osm.pbf"
+    output = f"data/{args.region}-clipped.osm.pbf"
+    polygon_file = output.replace(".osm.pbf", ".geojson")
+    clip_file = output.replace(".osm.pbf", ".clip.json")
+    for path in (source, args.postcodes):
+        if not os.path.exists(path):
+            logger.error(f"Input file {path} does not exist.")
+            exit(1)
+    if shutil.which("osmium") is None:
+        logger.error("The osmium command is not available, install osmium-tool.")
+        exit(1)
+
+    profiles = [p.strip() for p in args.profiles.split(",") if p.strip()]
+    if not profiles:
+        logger.error(f"Invalid profiles: {args.profiles}.")
+        exit(1)
+    filters = DRIVING_FILTERS if profiles == ["driving"] else ALL_FILTERS
+
+    # Compute the area to clip
+    points, counts = read_points(args.postcodes, args.schools, args.lat, args.lon)
+    logger.info(f"Read {counts['postcodes']} postcodes and {counts['schools']} schools with valid coordinates.")
+    if len(points) == 0:
+        logger.error("No valid coordinates found in the input files.")
+        exit(1)
+    ring, area = clip_polygon(points, args.buffer, args.shape)
+    polygon = {"type": "Polygon", "coordinates": [ring]}
+    with open(polygon_file, "w") as f:
+        json.dump(polygon, f)
+    logger.info(f"Clipping to a {args.shape} of {len(ring) - 1} vertices and {area:.0f} km2 with a {args.buffer} km buffer.")
+
+    # Clip the file keeping the ways crossing the polygon whole, and filter
+    # the ways of the profiles, through a temporary file
+    extract = output.replace(".osm.pbf", ".extract.osm.pbf")
+    start = time.monotonic()
+    try:
+        osmium("extract", "--polygon", polygon_file, "--strategy", "smart", "--set-bounds", "--overwrite", "--output", extract, source)
+        osmium("tags-filter", "--overwrite", "--output", output, extract, *filters)
+    except RuntimeError as e:
+        logger.error(str(e))
+        exit(1)
+    finally:
+        if os.path.exists(extract):
+            os.remove(extract)
+    logger.info(f"Clipped in {time.monotonic() - start:.1f} seconds.")
+
+    source_size = os.path.getsize(source)
+    size = os.path.getsize(output)
+    logger.info(f"Written {output}: {size / 2**20:.1f} MB, {size / source_size:.1%} of {source}.")
+
+    # Store the clip next to the clipped file, for the metadata of prepare.sh
+    with open(clip_file, "w") as f:
+        json.dump(
+            {
+                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "source": os.path.basename(source),
+                "source_size": source_size,
+                "points": counts,
+                "shape": args.shape,
+                "buffer_km": args.buffer,
+                "area_km2": round(area, 1),
+                "profiles": profiles,
+                "filters": filters,
+                "polygon": polygon,
+            },
+            f,
+            indent=4,
+        )
+    logger.info(f"Clip written to {clip_file}.")
+    logger.info("Finished OSM PBF clipping.")
+
+    exit(0)
@@ -0,0 +1,216 @@
+"""
+Balancing of the OSRM requests across several `osrm-routed` endpoints.
+
+Every request goes to the healthy endpoint with the least outstanding
+requests, counted in shared memory so the balancing holds across the pool
+workers. An endpoint that fails with a connection error, a timeout, or a
+server error is marked as down for a while and the request is retried on
+another one, so in-flight work is not lost when an endpoint dies.
+
+Host names that resolve to several addresses, like a service scaled with
+`docker compose up --scale`, are expanded to one endpoint per address.
+
+Each OSRM dataset is built for one profile, so runs with several profiles
+take the endpoints of each profile with a `profile=` prefix.
+"""
+
+import logging
+import multiprocessing
+import socket
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+from requests_cache import create_key
+
+logger = logging.getLogger("endpoints")
+
+
+def resolve(url):
+    """
+    Expand an URL whose host resolves to several addresses into one URL per
+    address. URLs that don't resolve are returned as they are.
+    """
+    parts = urlsplit(url)
+    try:
+        infos = socket.getaddrinfo(parts.hostname, parts.port or 80, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError):
+        return [url]
+    addresses = sorted({info[4][0] for info in infos})
+    if len(addresses) < 2:
+        return [url]
+    port = f":{parts.port}" if parts.port else ""
+    return [
+        urlunsplit(parts._replace(netloc=f"[{address}]{port}" if ":" in address else f"{address}{port}"))
+        for address in addresses
+    ]
+
+
+def base_url(url):
+    """
+    Scheme and host part of an URL.
+    """
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class Endpoints:
+    """
+    Set of OSRM endpoints shared by the pool workers. It must be created
+    before the pool and passed to the workers with the initializer.
+    """
+
+    def __init__(self, urls, timeout=60, retry_after=30, cache_url=None):
+        self.urls = [url.rstrip("/") for url in urls]
+        # Base URL used in the cache keys whatever endpoint serves a request
+        self.cache_url = base_url(cache_url or self.urls[0])
+        self.timeout = timeout
+        self.retry_after = retry_after
+        # Outstanding requests, time until an endpoint is considered down,
+        # and requests served per endpoint, all guarded by the same lock
+        self.outstanding = multiprocessing.Array("i", len(self.urls))
+        self.down_until = multiprocessing.Array("d", len(self.urls), lock=False)
+        self.served = multiprocessing.Array("i", len(self.urls), lock=False)
+
+    @classmethod
+    def from_option(cls, option, **kwargs):
+        """
+        Build the endpoints from a comma separated list of URLs, expanding
+        the host names that resolve to several addresses.
+        """
+        options = [url.strip() for url in option.split(",") if url.strip()]
+        urls = []
+        for url in options:
+            urls.extend(u for u in resolve(url) if u not in urls)
+        return cls(urls, cache_url=options[0], **kwargs)
+
+    def __len__(self):
+        return len(self.urls)
+
+    def acquire(self, exclude=()):
+        """
+        Pick the healthy endpoint with the least outstanding requests, or the
+        one that has been down for longer when none is healthy.
+        """
+        now = time.time()
+        with self.outstanding.get_lock():
+            candidates = [i for i in range(len(self.urls)) if i not in exclude]
+            healthy = [i for i in candidates if self.down_until[i] <= now]
+            if healthy:
+                chosen = min(healthy, key=lambda i: self.outstanding[i])
+            else:
+                chosen = min(candidates, key=lambda i: self.down_until[i])
+            self.outstanding[chosen] += 1
+        return chosen
+
+    def release(self, i):
+        with self.outstanding.get_lock():
+            self.outstanding[i] -= 1
+
+    def mark_down(self, i):
+        with self.outstanding.get_lock():
+            self.down_until[i] = time.time() + self.retry_after
+
+    def get(self, session, path):
+        """
+        Send a GET request for `path` to the best endpoint, failing over to
+        the other endpoints on connection errors, timeouts, and server
+        errors. Raises the last error when every endpoint failed.
+        """
+        tried = set()
+        while True:
+            i = self.acquire(exclude=tried)
+            try:
+                response = session.get(self.urls[i] + path, timeout=self.timeout)
+                if response.status_code < 500:
+                    if not getattr(response, "from_cache", False):
+                        with self.outstanding.get_lock():
+                            self.served[i] += 1
+                    return response
+                error = requests.exceptions.HTTPError(
+                    f"{response.status_code} Server Error for {self.urls[i]}", response=response
+                )
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = e
+            finally:
+                self.release(i)
+
+            self.mark_down(i)
+            tried.add(i)
+            logger.warning(f"OSRM endpoint {self.urls[i]} failed, marked as down: {error}")
+            if len(tried) == len(self.urls):
+                raise error
+
+    def check(self, path):
+        """
+        Health check every endpoint with a GET request for `path`, marking as
+        down the ones that don't answer. Returns the healthy URLs.
+        """
+        healthy = []
+        for i, url in enumerate(self.urls):
+            try:
+                requests.get(url + path, timeout=self.timeout).raise_for_status()
+                healthy.append(url)
+            except requests.exceptions.RequestException as e:
+                logger.warning(f"OSRM endpoint {url} is not healthy: {e}")
+                self.mark_down(i)
+        return healthy
+
+    def normalize(self, url):
+        """
+        URL as used in the cache keys, the same whatever endpoint it was sent
+        to, or None if it was not sent to any of them.
+        """
+        for endpoint in self.urls:
+            if url.startswith(endpoint + "/"):
+                return self.cache_url + url[len(base_url(endpoint)):]
+        return None
+
+    def stats(self):
+        """
+        Number of requests served by each endpoint.
+        """
+        return {url: self.served[i] for i, url in enumerate(self.urls)}
+
+
+def split_profiles(option, profiles):
+    """
+    Split a comma separated list of URLs into the URLs of each profile.
+    URLs can be prefixed with `profile=`, and the ones without prefix are
+    used for the first profile. Raises ValueError when a profile has no URL
+    or a prefix is not one of the profiles.
+    """
+    urls = {profile: [] for profile in profiles}
+    for url in option.split(","):
+        url = url.strip()
+        if not url:
+            continue
+        profile, _, prefixed = url.partition("=")
+        if prefixed and "://" not in profile:
+            if profile not in urls:
+                raise ValueError(f"Unknown profile {profile} in {url}")
+            urls[profile].append(prefixed)
+        else:
+            urls[profiles[0]].append(url)
+    missing = [profile for profile, found in urls.items() if not found]
+    if missing:
+        raise ValueError(f"No OSRM URL for the profiles {', '.join(missing)}")
+    return {profile: ",".join(found) for profile, found in urls.items()}
+
+
+def cache_key_fn(endpoints):
+    """
+    Build a requests-cache key function that ignores which of the endpoints
+    served a request, so the cache is shared by all of them.
+    """
+
+    def cache_key(request, **kwargs):
+        for e in endpoints:
+            url = e.normalize(request.url)
+            if url:
+                request = request.copy()
+                request.url = url
+                break
+        return create_key(request, **kwargs)
+
+    return cache_key
@@ -0,0 +1,160 @@
+"""
+Exports of the travel time matrices (see `matrix.py`) to the CSV and JSON
+files, and stats of the results.
+
+Everything is streamed over the rows of the memory-mapped matrices, so the
+memory used doesn't depend on the number of pairs.
+"""
+
+import csv
+import json
+import logging
+import math
+from collections import Counter
+
+import numpy as np
+
+from logs import get_sampled_logger
+from matrix import BOUNDED, NO_ROUTE, NOT_COMPUTED
+
+logger = logging.getLogger("exports")
+# Logger for the messages about every result, sampled
+result_logger = get_sampled_logger("exports.results")
+
+VALUES = ["from_time", "from_dist", "to_time", "to_dist"]
+
+
+def write_csv(path, profiles, profile_pairs, bounded=False):
+    """
+    Write the pairs of every profile, iterators of result tuples in the same
+    order, to a CSV file. The values of the first profile use the plain
+    column names and the rest are prefixed by the profile name. With
+    `bounded`, the tuples have a trailing `bounded` value (see
+    `matrix.iter_pairs`), written in a `bounded` column of each profile.
+    Returns the number of rows.
+    """
+    values = VALUES + ["bounded"] if bounded else VALUES
+    fieldnames = ["cp_from", "cp_to"] + values
+    for profile in profiles[1:]:
+        fieldnames += [f"{profile}_{value}" for value in values]
+
+    rows = 0
+    with open(path, "w", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(fieldnames)
+        for pair_results in zip(*profile_pairs):
+            row = list(pair_results[0])
+            for result in pair_results[1:]:
+                row += result[2:]
+            writer.writerow(row)
+            rows += 1
+    return rows
+
+
+def write_json(path, time_matrix, dist_matrix, ids, flags=None):
+    """
+    Write a JSON file with a dictionary of postal codes and the sorted
+    `"destination,time,distance"` strings to all the other postal codes,
+    formatted like `json.dump(..., indent=4)` but written a row at a time.
+    With the `flags` matrix, the upper bounds of the landmarks end with
+    `",bounded"`, and have no distance.
+    """
+    with open(path, "w") as f:
+        f.write("{")
+        first = True
+        for i, postcode in enumerate(ids):
+            times = np.asarray(time_matrix[i])
+            dists = np.asarray(dist_matrix[i])
+            bounded = np.asarray(flags[i]) == BOUNDED if flags is not None else np.zeros(len(ids), dtype=bool)
+            computed = np.flatnonzero(times != NOT_COMPUTED)
+            computed = computed[computed != i]
+            if len(computed) == 0:
+                continue
+            entries = sorted(
+                ",".join(
+                    [
+                        str(int(ids[j])),
+                        "None" if duration == NO_ROUTE else str(duration),
+                        "None" if distance in (NO_ROUTE, NOT_COMPUTED) else str(distance),
+                    ]
+                    + (["bounded"] if is_bounded else [])
+                )
+                for j, duration, distance, is_bounded in zip(
+                    computed.tolist(), times[computed].tolist(), dists[computed].tolist(), bounded[computed].tolist()
+                )
+            )
+            f.write("\n" if first else ",\n")
+            f.write(f"    {json.dumps(str(int(postcode)))}: [\n        ")
+            f.write(",\n        ".join(json.dumps(entry) for entry in entries))
+            f.write("\n    ]")
+            first = False
+        f.write("}" if first else "\n}")
+
+
+def _histogram_stats(histogram, max_records):
+    """
+    Stats of a histogram of differences, matching the ones computed over
+    the sorted list of differences.
+    """
+    count = sum(histogram.values())
+    if count == 0:
+        return {"avg": 0, "max": 0, "max_record": [], "stddev": 0, "p95": 0, "p99": 0}
+
+    avg = sum(value * n for value, n in histogram.items()) / count
+    stddev = 0
+    if count > 1:
+        stddev = math.sqrt(sum(n * (value - avg) ** 2 for value, n in histogram.items()) / (count - 1))
+
+    def percentile(pct):
+        rank = int(count * pct)
+        seen = 0
+        for value in sorted(histogram):
+            seen += histogram[value]
+            if seen > rank:
+                return value
+        return max(histogram)
+
+    return {
+        "avg": round(avg, 2),
+        "max": max(histogram),
+        "max_record": max_records,
+        "stddev": round(stddev, 2),
+        "p95": percentile(0.95),
+        "p99": percentile(0.99),
+    }
+
+
+def diff_stats(results):
+    """
+    Stats of the differences between the forward and backward travel times
+    and distances of the results, computed with histograms in a single pass.
+    The results with a trailing `bounded` value set (see
+    `matrix.iter_pairs`) are counted but left out of the stats, as their
+    values are landmark upper bounds. Returns the number of results and the
+    time and distance stats.
+    """
+    count = 0
+    histograms = {"time": Counter(), "dist": Counter()}
+    max_records = {"time": [], "dist": []}
+    maxima = {"time": -1, "dist": -1}
+    for result in results:
+        count += 1
+        originId, destId, from_time, from_dist, to_time, to_dist, *bounded = result
+        if bounded and bounded[0]:
+            continue
+        if from_time is None or to_time is None:
+            result_logger.error("Invalid result for %s to %s.", originId, destId)
+            continue
+        for key, diff in (("time", abs(from_time - to_time)), ("dist", abs(from_dist - to_dist))):
+            histograms[key][diff] += 1
+            if diff > maxima[key]:
+                maxima[key] = diff
+                max_records[key] = [result]
+            elif diff == maxima[key]:
+                max_records[key].append(result)
+
+    return (
+        count,
+        _histogram_stats(histograms["time"], max_records["time"]),
+        _histogram_stats(histograms["dist"], max_records["dist"]),
+    )
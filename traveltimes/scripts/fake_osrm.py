@@ -0,0 +1,282 @@
+"""
+This is a local stand-in for `osrm-routed` to benchmark and test the travel
+times client without a routing graph nor network access. It answers the
+`/route`, `/table` and `/nearest` services of any profile with the same
+JSON structure as OSRM.
+
+The distances are the great circle distance between the coordinates times
+a detour factor derived from a hash of the ordered pair, so they are
+deterministic, asymmetric like real routes, and the same across restarts.
+The durations divide them by a speed per profile. A latency with some
+jitter can be added to every response, and a share of the requests can
+fail with a server error to exercise the retries and error handling.
+
+The counts of the requests served are available at `/stats`.
+"""
+
+import logging
+import os
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Define arguments with argparse
+parser = argparse.ArgumentParser(description="Fake OSRM API server with synthetic travel times.")
+
+defaults = {
+    "loglevel": os.environ.get("LOGLEVEL", "INFO"),
+    "host": os.environ.get("FAKE_OSRM_HOST", "127.0.0.1"),
+    "port": int(os.environ.get("FAKE_OSRM_PORT", 5000)),
+    "latency": float(os.environ.get("FAKE_OSRM_LATENCY", 0)),
+    "jitter": float(os.environ.get("FAKE_OSRM_JITTER", 0)),
+    "error_rate": float(os.environ.get("FAKE_OSRM_ERROR_RATE", 0)),
+    "seed": 0,
+}
+
+parser.add_argument(
+    "--loglevel",
+    "-l",
+    choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+    metavar="LOGLEVEL",
+    default=defaults["loglevel"],
+    type=str,
+    help=f"Logging level for the script. Options: DEBUG, INFO, WARNING, ERROR, CRITICAL. Default {defaults['loglevel']}.",
+)
+parser.add_argument(
+    "--host",
+    default=defaults["host"],
+    type=str,
+    help=f"Address to listen on. Default {defaults['host']}.",
+)
+parser.add_argument(
+    "--port",
+    default=defaults["port"],
+    type=int,
+    help=f"Port to listen on. Default {defaults['port']}.",
+)
+parser.add_argument(
+    "--latency",
+    default=defaults["latency"],
+    type=float,
+    help=f"Mean milliseconds added to every response. Default {defaults['latency']}.",
+)
+parser.add_argument(
+    "--jitter",
+    default=defaults["jitter"],
+    type=float,
+    help=f"Standard deviation in milliseconds of the added latency. Default {defaults['jitter']}.",
+)
+parser.add_argument(
+    "--error-rate",
+    default=defaults["error_rate"],
+    type=float,
+    help=f"Share of the requests answered with a 500 error, between 0 and 1. Default {defaults['error_rate']}.",
+)
+parser.add_argument(
+    "--seed",
+    default=defaults["seed"],
+    type=int,
+    help=f"Seed for the latencies and the errors. Default {defaults['seed']}.",
+)
+
+logger = logging.getLogger("fake_osrm")
+
+# Speed in meters per second of each profile, the rest use driving
+SPEEDS = {
+    "driving": 13.9,
+    "car": 13.9,
+    "cycling": 4.2,
+    "bicycle": 4.2,
+    "walking": 1.4,
+    "foot": 1.4,
+}
+
+EARTH_RADIUS = 6371000
+
+
+def distance(origin, destination):
+    """
+    Synthetic road distance in meters from an origin to a destination
+    `(lon, lat)`: the great circle distance times a detour factor between
+    1.2 and 1.6 hashed from the ordered pair.
+    """
+    lon1, lat1, lon2, lat2 = map(math.radians, (*origin, *destination))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    straight = 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+    key = f"{origin[0]:.6f},{origin[1]:.6f};{destination[0]:.6f},{destination[1]:.6f}"
+    return straight * (1.2 + (zlib.crc32(key.encode()) % 1000) / 2500)
+
+
+def duration(origin, destination, profile):
+    return distance(origin, destination) / SPEEDS.get(profile, SPEEDS["driving"])
+
+
+def waypoint(coordinate):
+    """
+    Waypoint of a coordinate, snapped to itself, with a hint derived from it.
+    """
+    return {
+        "hint": f"{zlib.crc32(f'{coordinate[0]:.6f},{coordinate[1]:.6f}'.encode()):08x}",
+        "distance": 0.0,
+        "name": "",
+        "location": [round(coordinate[0], 6), round(coordinate[1], 6)],
+    }
+
+
+def indexes(value, size):
+    """
+    Indexes of the `sources` or `destinations` parameter of a table request.
+    """
+    if not value or value == "all":
+        return list(range(size))
+    return [int(i) for i in value.split(";")]
+
+
+def answer(service, profile, coordinates, query):
+    """
+    Status and body of the response of a service.
+    """
+    if service == "route":
+        if len(coordinates) < 2:
+            return 400, {"code": "InvalidQuery", "message": "Query string malformed"}
+        legs = [
+            (distance(a, b), duration(a, b, profile))
+            for a, b in zip(coordinates, coordinates[1:])
+        ]
+        total_distance = sum(leg[0] for leg in legs)
+        total_duration = sum(leg[1] for leg in legs)
+        return 200, {
+            "code": "Ok",
+            "routes": [
+                {
+                    "distance": round(total_distance, 1),
+                    "duration": round(total_duration, 1),
+                    "weight": round(total_duration, 1),
+                    "weight_name": "routability",
+                    "legs": [
+                        {"distance": round(d, 1), "duration": round(t, 1), "summary": "", "steps": []}
+                        for d, t in legs
+                    ],
+                }
+            ],
+            "waypoints": [waypoint(c) for c in coordinates],
+        }
+    if service == "table":
+        sources = indexes(query.get("sources", [""])[0], len(coordinates))
+        destinations = indexes(query.get("destinations", [""])[0], len(coordinates))
+        annotations = query.get("annotations", ["duration"])[0].split(",")
+        body = {
+            "code": "Ok",
+            "sources": [waypoint(coordinates[i]) for i in sources],
+            "destinations": [waypoint(coordinates[j]) for j in destinations],
+        }
+        if "duration" in annotations:
+            body["durations"] = [
+                [round(duration(coordinates[i], coordinates[j], profile), 1) if i != j else 0.0 for j in destinations]
+                for i in sources
+            ]
+        if "distance" in annotations:
+            body["distances"] = [
+                [round(distance(coordinates[i], coordinates[j]), 1) if i != j else 0.0 for j in destinations]
+                for i in sources
+            ]
+        return 200, body
+    if service == "nearest":
+        number = int(query.get("number", ["1"])[0])
+        return 200, {"code": "Ok", "waypoints": [waypoint(coordinates[0])] * number}
+    return 400, {"code": "InvalidService", "message": f"Service {service} not found!"}
+
+
+class Handler(BaseHTTPRequestHandler):
+    # Keep-alive connections, as osrm-routed, sending the headers and the
+    # body without waiting for the ACK of the previous segment
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        url = urlsplit(self.path)
+        if url.path == "/stats":
+            with server.lock:
+                stats = dict(server.stats)
+            return self.reply(200, stats)
+
+        # Paths are /{service}/v1/{profile}/{coordinates}
+        parts = url.path.split("/")
+        try:
+            service, profile = parts[1], parts[3]
+            coordinates = [tuple(map(float, c.split(","))) for c in parts[4].split(";")]
+        except (IndexError, ValueError):
+            return self.reply(400, {"code": "InvalidUrl", "message": f"URL string malformed close to position 1: {self.path}"})
+
+        with server.lock:
+            delay = max(server.random.gauss(server.latency, server.jitter), 0) / 1000 if server.latency else 0
+            failed = server.random.random() < server.error_rate
+        if delay:
+            time.sleep(delay)
+
+        if failed:
+            status, body = 500, {"code": "InternalError", "message": "Injected error"}
+        else:
+            status, body = answer(service, profile, coordinates, parse_qs(url.query))
+        with server.lock:
+            server.stats[service] = server.stats.get(service, 0) + 1
+            if status != 200:
+                server.stats["errors"] = server.stats.get("errors", 0) + 1
+        self.reply(status, body)
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug("%s %s", self.address_string(), format % args)
+
+
+def create_server(host, port, latency=0, jitter=0, error_rate=0, seed=0):
+    """
+    Create the server, to be run with `serve_forever`.
+    """
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.jitter = jitter
+    server.error_rate = error_rate
+    server.random = random.Random(seed)
+    server.lock = threading.Lock()
+    server.stats = {}
+    return server
+
+
+if __name__ == "__main__":
+    # Parse the arguments
+    args = parser.parse_args()
+
+    # Set up basic logging
+    logging.basicConfig(
+        level=args.loglevel.upper(),
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%H:%M:%S",
+    )
+
+    server = create_server(args.host, args.port, args.latency, args.jitter, args.error_rate, args.seed)
+    logger.info(
+        f"Fake OSRM API listening on {args.host}:{args.port} with {args.latency} ms latency, "
+        f"{args.jitter} ms jitter and {args.error_rate:.1%} errors."
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,116 @@
+"""
+OSRM snapping hints for the postcode coordinates.
+
+OSRM snaps every coordinate of a request to the nearest road segment, which
+for this workload means snapping the same few hundred postcodes again for
+every route. The `/nearest` service returns a `hint` per coordinate that can
+be sent back with the `hints=` parameter of `/route` and `/table` to skip
+the snapping.
+
+Hints are only valid for the graph they were computed on, so they are
+persisted in a JSON file together with the md5 of the OSM PBF file the graph
+was built from (see `prepare.sh`), and discarded when it changes.
+"""
+
+import json
+import logging
+import os
+import time
+from multiprocessing.pool import ThreadPool
+
+import requests
+
+from logs import get_sampled_logger
+
+logger = logging.getLogger("hints")
+# Logger for the messages about every postcode, sampled
+postcode_logger = get_sampled_logger("hints.postcodes")
+
+GRAPH_METADATA = "data/travel_times_osm_pbf.metadata.json"
+
+
+def graph_md5(metadata_path=GRAPH_METADATA):
+    """
+    Return the md5 of the OSM PBF file the OSRM graph was built from, or
+    None if the metadata written by `prepare.sh` is not available.
+    """
+    try:
+        with open(metadata_path, "r") as f:
+            return json.load(f).get("md5")
+    except (OSError, ValueError):
+        return None
+
+
+def load_hints(path, md5):
+    """
+    Load the hints stored at `path` as a dict of postcode id to hint. Returns
+    an empty dict when the file is missing or was computed for another graph.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        stored = json.load(f)
+    if stored.get("md5") != md5:
+        logger.info(f"Discarding the hints in {path}, computed for another graph.")
+        return {}
+    return stored.get("hints", {})
+
+
+def save_hints(path, md5, hints):
+    """
+    Persist the hints for the graph with the given md5.
+    """
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "md5": md5,
+                "hints": hints,
+            },
+            f,
+            indent=4,
+        )
+
+
+def fetch_hint(endpoints, lon, lat, session, profile="driving"):
+    """
+    Snap a coordinate with the OSRM `/nearest` service and return its hint,
+    or None if it could not be snapped.
+    """
+    path = f"/nearest/v1/{profile}/{lon},{lat}?number=1"
+    try:
+        response = endpoints.get(session, path)
+        response.raise_for_status()
+        waypoints = response.json().get("waypoints", [])
+    except (requests.exceptions.RequestException, ValueError) as e:
+        postcode_logger.warning("Error snapping %s,%s: %s", lon, lat, e)
+        return None
+    if not waypoints or not waypoints[0].get("hint"):
+        postcode_logger.warning("No road found near %s,%s.", lon, lat)
+        return None
+    return waypoints[0]["hint"]
+
+
+def prefetch_hints(endpoints, ids, coordinates, path, md5, threads=1, profile="driving"):
+    """
+    Return the hints of the postcodes as a list aligned with `ids`, using
+    the ones stored at `path` for the current graph and fetching the missing
+    ones from OSRM. Postcodes that can't be snapped get an empty hint, which
+    OSRM treats as a coordinate to snap.
+    """
+    hints = load_hints(path, md5)
+    missing = [i for i, postcode in enumerate(ids) if postcode not in hints]
+    if missing:
+        logger.info(f"Fetching OSRM hints for {len(missing)} postcodes...")
+        session = requests.Session()
+        with ThreadPool(threads) as pool:
+            fetched = pool.starmap(
+                fetch_hint,
+                [(endpoints, *coordinates[i].tolist(), session, profile) for i in missing],
+            )
+        for i, hint in zip(missing, fetched):
+            if hint:
+                hints[ids[i]] = hint
+        save_hints(path, md5, hints)
+        logger.info(f"Hints written to {path}.")
+    return [hints.get(postcode, "") for postcode in ids]
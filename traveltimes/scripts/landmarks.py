@@ -0,0 +1,223 @@
+"""
+Landmark bounds to avoid routing the pairs whose exact value doesn't matter.
+
+Every location is routed exactly to and from a few landmark locations,
+spread over the map by farthest point sampling. By the triangle inequality
+of the shortest paths, for any landmark L the travel time from i to j is
+bounded by
+
+    max(t(i, L) - t(j, L), t(L, j) - t(L, i)) <= t(i, j) <= t(i, L) + t(L, j)
+
+and the best bounds over all the landmarks are computed with NumPy for a
+block of origins against every destination at once.
+
+The consumers of the matrix compare the travel times with a few thresholds,
+like 15, 30 or 45 minutes, so a pair only needs to be routed when a
+threshold falls between its bounds. Otherwise the bounds already tell on
+which side of every threshold it is, and the upper bounds are stored
+instead, flagged as bounded (see `matrix.py`). They are only meaningful
+against those thresholds, which are stored with them.
+
+The distances of the bounded pairs are not stored: OSRM returns the
+distance of the fastest route, which is not a shortest path metric, so the
+triangle inequality doesn't bound it.
+"""
+
+import logging
+
+import numpy as np
+
+from matrix import BOUNDED, DTYPE, NOT_COMPUTED
+from pairs import plan_from_pairs, unit_vectors
+
+logger = logging.getLogger("landmarks")
+
+# Minutes added to the bounds for the rounding of the routed values
+SLACK = 1
+
+# Values of the (origins, landmarks, destinations) arrays of a block
+BLOCK_VALUES = 1 << 22
+
+
+def pick_landmarks(coordinates, k):
+    """
+    Pick `k` landmarks from a (N, 2) array of (lon, lat) coordinates by
+    farthest point sampling, starting from the farthest one from the center.
+    Returns their sorted indexes.
+    """
+    vectors = unit_vectors(coordinates)
+    k = min(k, len(vectors))
+    if k == 0:
+        return np.array([], dtype=np.int64)
+    chosen = [int(np.argmin(vectors @ vectors.mean(axis=0)))]
+    distances = np.linalg.norm(vectors - vectors[chosen[0]], axis=1)
+    while len(chosen) < k:
+        farthest = int(np.argmax(distances))
+        chosen.append(farthest)
+        distances = np.minimum(distances, np.linalg.norm(vectors - vectors[farthest], axis=1))
+    return np.array(sorted(chosen), dtype=np.int64)
+
+
+def landmark_plan(n, landmarks):
+    """
+    Plan with the pairs between every location and the landmarks.
+    """
+    rows = np.repeat(landmarks, n)
+    cols = np.tile(np.arange(n), len(landmarks))
+    return plan_from_pairs(n, rows, cols)
+
+
+def landmark_values(matrix, representatives, landmarks):
+    """
+    Values of a postcode matrix from every location to the landmarks, as a
+    (N, K) array, and from the landmarks to every location, as a (K, N)
+    array, with NaN where there is no value.
+    """
+    landmark_rows = representatives[landmarks]
+    to_landmarks = np.asarray(matrix[np.ix_(representatives, landmark_rows)], dtype=np.float64)
+    from_landmarks = np.asarray(matrix[np.ix_(landmark_rows, representatives)], dtype=np.float64)
+    to_landmarks[to_landmarks < 0] = np.nan
+    from_landmarks[from_landmarks < 0] = np.nan
+    return to_landmarks, from_landmarks
+
+
+def bounds(to_landmarks, from_landmarks, rows):
+    """
+    Lower and upper bounds of the values from the locations in `rows` to
+    every location and back, as four (len(rows), N) arrays. Upper bounds are
+    infinite and lower bounds 0 when no landmark has both values.
+    """
+    # t(i, L) and t(L, i) of the origins, t(j, L) and t(L, j) of the rest
+    to_rows = to_landmarks[rows][:, :, None]
+    from_rows = from_landmarks[:, rows].T[:, :, None]
+    to_all = to_landmarks.T[None]
+    from_all = from_landmarks[None]
+
+    # fmin and fmax skip the landmarks without a value
+    upper_forward = np.fmin.reduce(to_rows + from_all, axis=1)
+    upper_backward = np.fmin.reduce(to_all + from_rows, axis=1)
+    lower_forward = np.fmax.reduce(np.fmax(to_rows - to_all, from_all - from_rows), axis=1)
+    lower_backward = -np.fmin.reduce(np.fmin(to_rows - to_all, from_all - from_rows), axis=1)
+
+    for upper in (upper_forward, upper_backward):
+        upper[np.isnan(upper)] = np.inf
+    for lower in (lower_forward, lower_backward):
+        np.maximum(np.nan_to_num(lower, nan=0.0), 0, out=lower)
+    return lower_forward, upper_forward, lower_backward, upper_backward
+
+
+def undecided(lower, upper, thresholds):
+    """
+    Mask of the pairs that must be routed to compare them with the
+    thresholds: the ones with a threshold between their bounds, given that
+    consumers check `time <= threshold`, or without an upper bound.
+    """
+    mask = ~np.isfinite(upper)
+    for threshold in thresholds:
+        mask |= (lower - SLACK <= threshold) & (threshold < upper + SLACK)
+    return mask
+
+
+def _write_bounds(time_matrix, dist_matrix, flags, origins, columns, values):
+    """
+    Write the upper bounds of the travel times from the postcodes `origins`
+    to the postcodes `columns` and back, as `(forward_time, backward_time)`
+    arrays aligned with `columns`, flagged as bounded. Their distances are
+    written as `NOT_COMPUTED`.
+    """
+    limit = np.iinfo(DTYPE).max
+    forward_time, backward_time = (np.minimum(value, limit).astype(DTYPE) for value in values)
+    for p in origins:
+        time_matrix[p, columns] = forward_time
+        dist_matrix[p, columns] = NOT_COMPUTED
+        time_matrix[columns, p] = backward_time
+        dist_matrix[columns, p] = NOT_COMPUTED
+        flags[p, columns] = BOUNDED
+        flags[columns, p] = BOUNDED
+
+
+def bound_pairs(matrices, flags, locations, landmarks, thresholds, plan=None):
+    """
+    Split the location pairs of the plan, or every pair, that are not in the
+    postcode matrices yet into the ones to route and the ones decided by the
+    landmark bounds of every profile. The upper bounds of the travel times
+    of the latter are written to the matrices of each profile, flagged as
+    bounded.
+
+    Args:
+        matrices: dict of profile to its (time, dist) postcode matrices,
+            with the pairs to the landmarks already routed.
+        flags: dict of profile to its postcode flags matrix.
+        thresholds: travel times in minutes to decide the pairs against.
+
+    Returns the plan of location pairs to route and the number of location
+    pairs that were bounded.
+    """
+    n = locations.size
+    representatives = locations.representatives
+    location_of = locations.location_of
+    members = locations.members()
+
+    values = {
+        profile: landmark_values(time_matrix, representatives, landmarks)
+        for profile, (time_matrix, _) in matrices.items()
+    }
+    first_time = next(iter(matrices.values()))[0]
+    block = max(1, BLOCK_VALUES // max(len(landmarks) * n, 1))
+
+    route_rows, route_cols = [], []
+    bounded = 0
+    for r0 in range(0, n, block):
+        rows = np.arange(r0, min(r0 + block, n))
+
+        # Pairs after the origin, in the plan, and not routed yet
+        candidates = np.zeros((len(rows), n), dtype=bool)
+        for k, i in enumerate(rows.tolist()):
+            if plan is None:
+                candidates[k, i + 1 :] = True
+            else:
+                candidates[k, plan.destinations(i)] = True
+        candidates &= np.asarray(first_time[representatives[rows]])[:, representatives] == NOT_COMPUTED
+        if not candidates.any():
+            continue
+
+        # A pair is routed when it is undecided in any profile
+        route = np.zeros_like(candidates)
+        upper = {}
+        for profile, (to_time, from_time) in values.items():
+            lower_forward, upper_forward, lower_backward, upper_backward = bounds(to_time, from_time, rows)
+            route |= undecided(lower_forward, upper_forward, thresholds)
+            route |= undecided(lower_backward, upper_backward, thresholds)
+            upper[profile] = (upper_forward, upper_backward)
+        route &= candidates
+        keep = candidates & ~route
+
+        k, j = np.nonzero(route)
+        route_rows.append(rows[k])
+        route_cols.append(j)
+        bounded += int(keep.sum())
+
+        # Fan the bounds of the kept pairs out to their postcodes
+        for k, i in enumerate(rows.tolist()):
+            columns = np.flatnonzero(keep[k][location_of])
+            if len(columns) == 0:
+                continue
+            destinations = location_of[columns]
+            for profile, (time_matrix, dist_matrix) in matrices.items():
+                _write_bounds(
+                    time_matrix,
+                    dist_matrix,
+                    flags[profile],
+                    members[i],
+                    columns,
+                    [value[k, destinations] for value in upper[profile]],
+                )
+        logger.debug(f"Bounded the pairs of {rows[-1] + 1} of {n} locations.")
+
+    empty = np.array([], dtype=np.int64)
+    exact = plan_from_pairs(
+        n,
+        np.concatenate(route_rows) if route_rows else empty,
+        np.concatenate(route_cols) if route_cols else empty,
+    )
+    return exact, bounded
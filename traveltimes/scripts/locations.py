@@ -0,0 +1,110 @@
+"""
+Deduplication of the postcode coordinates before routing.
+
+Several postcodes can share the same centroid, or have centroids a few
+meters apart, for example small postcodes that share a town's single
+cluster. Routing each of them separately sends the same requests again, so
+the postcodes are collapsed into unique locations, only the pairs of
+locations are routed, and the results are fanned out back to the postcodes.
+
+Each location is represented by the coordinates of its first postcode, so
+its routes and hints are the ones of a real postcode.
+"""
+
+import logging
+from typing import NamedTuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from pairs import EARTH_RADIUS_KM, unit_vectors
+
+logger = logging.getLogger("locations")
+
+
+class Locations(NamedTuple):
+    """
+    Unique locations of a list of postcodes.
+    """
+
+    # Location index of every postcode
+    location_of: np.ndarray
+    # Index of the postcode representing every location
+    representatives: np.ndarray
+
+    @property
+    def size(self):
+        return len(self.representatives)
+
+    def members(self):
+        """
+        List with the sorted postcode indexes of every location.
+        """
+        members = [[] for _ in range(self.size)]
+        for i, location in enumerate(self.location_of.tolist()):
+            members[location].append(i)
+        return members
+
+
+def collapse(coordinates, tolerance=0):
+    """
+    Collapse a (N, 2) array of (lon, lat) coordinates into unique locations,
+    merging the ones closer than `tolerance` meters, chained through their
+    neighbours. With no tolerance only identical coordinates are merged.
+    """
+    n = len(coordinates)
+    parent = np.arange(n)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    if tolerance > 0:
+        chord = 2 * np.sin(tolerance / 1000 / (2 * EARTH_RADIUS_KM))
+        pairs = cKDTree(unit_vectors(coordinates)).query_pairs(chord, output_type="ndarray")
+    else:
+        _, first, inverse = np.unique(coordinates, axis=0, return_index=True, return_inverse=True)
+        pairs = np.column_stack((first[inverse.ravel()], np.arange(n)))
+
+    # Union the pairs, keeping the lowest index as the root of each set
+    for i, j in pairs.tolist():
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    roots = np.array([find(i) for i in range(n)], dtype=np.int64)
+    representatives, location_of = np.unique(roots, return_inverse=True)
+    return Locations(location_of.astype(np.int32), representatives)
+
+
+def fan_out(results, ids, locations, same_location=True):
+    """
+    Expand the results between locations, as tuples of representative ids
+    `(from, to, from_time, from_dist, to_time, to_dist)`, into the results
+    between every pair of their postcodes, sorted like the postcode ids.
+    With `same_location`, the results between postcodes in the same location
+    are added with a travel time and distance of 0.
+    """
+    location_index = {ids[r]: location for location, r in enumerate(locations.representatives.tolist())}
+    members = locations.members()
+
+    fanned = []
+    for originId, destId, from_time, from_dist, to_time, to_dist in results:
+        origin_members = members[location_index[originId]]
+        dest_members = members[location_index[destId]]
+        for a in origin_members:
+            for b in dest_members:
+                if a < b:
+                    fanned.append((a, b, from_time, from_dist, to_time, to_dist))
+                else:
+                    fanned.append((b, a, to_time, to_dist, from_time, from_dist))
+
+    for location_members in members if same_location else []:
+        for k, a in enumerate(location_members):
+            for b in location_members[k + 1 :]:
+                fanned.append((a, b, 0, 0, 0, 0))
+
+    fanned.sort(key=lambda result: (result[0], result[1]))
+    return [(ids[a], ids[b], *values) for a, b, *values in fanned]
@@ -0,0 +1,200 @@
+"""
+Binary travel time matrices stored as NumPy `.npy` files so they can be
+memory-mapped instead of parsed.
+
+A matrix folder contains:
+
+* `ids.json`: the postcode ids, in the order of the rows and columns
+* `time.npy`: (N, N) int16 matrix with the travel time in minutes from the
+  row postcode to the column postcode
+* `dist.npy`: (N, N) int16 matrix with the distance in kilometers
+* `flags.npy`: optional (N, N) int8 matrix telling whether each value was
+  routed (`EXACT`) or is an upper bound (`BOUNDED`, see `landmarks.py`).
+  Without it every value was routed. The travel times CSV files of these
+  runs have a `bounded` column, 1 for the pairs with upper bounds.
+* `bounds.json`: the thresholds the upper bounds were decided against,
+  next to `flags.npy`. A bounded travel time is only on the right side of
+  these thresholds, so consumers must compare it with one of them.
+  Bounded pairs have no distance, stored as `NOT_COMPUTED`.
+
+Pairs that were not selected for routing are stored as `NOT_COMPUTED`, and
+pairs where the routing engine found no route as `NO_ROUTE`, so consumers
+can tell them apart from real values with a `>= 0` check.
+"""
+
+import json
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger("matrix")
+
+NOT_COMPUTED = -1
+NO_ROUTE = -2
+DTYPE = np.int16
+
+# Values of the flags matrix, 0 for the pairs not computed
+EXACT = 1
+BOUNDED = 2
+
+
+def create_matrix(path, ids):
+    """
+    Create an empty matrix folder for the given ids and return the writable
+    memory-mapped time and distance matrices, with `NOT_COMPUTED` everywhere
+    but the diagonal.
+    """
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "ids.json"), "w") as f:
+        json.dump(list(ids), f)
+
+    matrices = []
+    for name in ("time", "dist"):
+        matrix = np.lib.format.open_memmap(
+            os.path.join(path, f"{name}.npy"),
+            mode="w+",
+            dtype=DTYPE,
+            shape=(len(ids), len(ids)),
+        )
+        matrix[:] = NOT_COMPUTED
+        np.fill_diagonal(matrix, 0)
+        matrices.append(matrix)
+
+    # Flags of a previous run don't apply to the new matrices
+    for name in ("flags.npy", "bounds.json"):
+        if os.path.exists(os.path.join(path, name)):
+            os.remove(os.path.join(path, name))
+    return matrices
+
+
+def create_flags(path, n, thresholds):
+    """
+    Create the flags matrix of a matrix folder with no flags set and return
+    it memory-mapped, storing the thresholds the bounds are decided against.
+    """
+    with open(os.path.join(path, "bounds.json"), "w") as f:
+        json.dump({"thresholds": sorted(thresholds)}, f)
+    flags_path = os.path.join(path, "flags.npy")
+    flags = np.lib.format.open_memmap(flags_path, mode="w+", dtype=np.int8, shape=(n, n))
+    flags[:] = 0
+    return flags
+
+
+def open_flags(path, mode="r"):
+    """
+    Memory-map the flags matrix of a matrix folder, or return None if every
+    value was routed.
+    """
+    flags_path = os.path.join(path, "flags.npy")
+    if not os.path.exists(flags_path):
+        return None
+    return np.load(flags_path, mmap_mode=mode)
+
+
+def read_thresholds(path):
+    """
+    Thresholds in minutes the upper bounds of a matrix folder were decided
+    against, or None if every value was routed.
+    """
+    bounds_path = os.path.join(path, "bounds.json")
+    if not os.path.exists(os.path.join(path, "flags.npy")) or not os.path.exists(bounds_path):
+        return None
+    with open(bounds_path, "r") as f:
+        return json.load(f)["thresholds"]
+
+
+def mark_exact(time_matrix, flags, block=1024):
+    """
+    Flag as exact the computed values that are not flagged yet, a block of
+    rows at a time. Returns the number of values flagged.
+    """
+    marked = 0
+    for r0 in range(0, len(flags), block):
+        r1 = min(r0 + block, len(flags))
+        rows = flags[r0:r1]
+        exact = (np.asarray(time_matrix[r0:r1]) != NOT_COMPUTED) & (rows == 0)
+        rows[exact] = EXACT
+        marked += int(exact.sum())
+    flags.flush()
+    return marked
+
+
+def open_matrix(path, mode="r"):
+    """
+    Memory-map a matrix folder. Returns the ids and the time and distance
+    matrices.
+    """
+    with open(os.path.join(path, "ids.json"), "r") as f:
+        ids = json.load(f)
+    time_matrix = np.load(os.path.join(path, "time.npy"), mmap_mode=mode)
+    dist_matrix = np.load(os.path.join(path, "dist.npy"), mmap_mode=mode)
+    return ids, time_matrix, dist_matrix
+
+
+def fill(time_matrix, dist_matrix, index, results, flags=None):
+    """
+    Fill the time and distance matrices with travel time results as
+    `(from, to, from_time, from_dist, to_time, to_dist)` tuples, where the
+    values are None when there is no route. `index` maps the postcode ids to
+    their row. Results with a trailing `bounded` value set the `flags`
+    matrix, if given. Returns the number of values filled.
+    """
+    values = 0
+    for originId, destId, from_time, from_dist, to_time, to_dist, *bounded in results:
+        i = index.get(originId)
+        j = index.get(destId)
+        if i is None or j is None:
+            continue
+        for a, b, duration, distance in ((i, j, from_time, from_dist), (j, i, to_time, to_dist)):
+            if flags is not None:
+                flags[a, b] = BOUNDED if bounded and bounded[0] else EXACT
+            if duration is None or distance is None:
+                time_matrix[a, b] = NO_ROUTE
+                dist_matrix[a, b] = NO_ROUTE
+            else:
+                time_matrix[a, b] = duration
+                dist_matrix[a, b] = distance
+                values += 1
+    return values
+
+
+def iter_pairs(time_matrix, dist_matrix, ids, block=1024, flags=None):
+    """
+    Iterate over the computed pairs of a matrix, with the origin before the
+    destination in the ids order, as `(from, to, from_time, from_dist,
+    to_time, to_dist)` tuples with None for the pairs without route and for
+    the distances of the bounded pairs. With the `flags` matrix, the tuples
+    have a trailing `bounded` value, 1 when any of the directions is an
+    upper bound. Rows are read in blocks, so memory depends on the block
+    size and not on N².
+    """
+    n = len(ids)
+    for r0 in range(0, n, block):
+        r1 = min(r0 + block, n)
+        forward_time = np.asarray(time_matrix[r0:r1])
+        forward_dist = np.asarray(dist_matrix[r0:r1])
+        backward_time = np.asarray(time_matrix[:, r0:r1]).T
+        backward_dist = np.asarray(dist_matrix[:, r0:r1]).T
+        if flags is not None:
+            bounded_rows = (np.asarray(flags[r0:r1]) == BOUNDED) | (np.asarray(flags[:, r0:r1]).T == BOUNDED)
+        for k in range(r1 - r0):
+            i = r0 + k
+            computed = np.flatnonzero(forward_time[k, i + 1 :] != NOT_COMPUTED) + i + 1
+            columns = (
+                forward_time[k, computed],
+                forward_dist[k, computed],
+                backward_time[k, computed],
+                backward_dist[k, computed],
+            )
+            bounded = bounded_rows[k, computed].astype(int).tolist() if flags is not None else None
+            for position, (j, *values) in enumerate(zip(computed.tolist(), *(c.tolist() for c in columns))):
+                if NO_ROUTE in values:
+                    values = [None] * 4
+                elif NOT_COMPUTED in values:
+                    # The distances of the bounded pairs
+                    values = [None if value == NOT_COMPUTED else value for value in values]
+                if bounded is None:
+                    yield (ids[i], ids[j], *values)
+                else:
+                    yield (ids[i], ids[j], *values, bounded[position])
@@ -0,0 +1,235 @@
+"""
+Live throughput and progress telemetry of the travel times runs.
+
+The pool workers count their OSRM requests, latencies, errors and cache hits
+in a `TaskMetrics` and send the counts over a queue about once a second. A
+thread of the main process aggregates them, logs the progress and writes it
+to a Prometheus textfile (for the node exporter textfile collector) every
+interval, so throughput regressions show up while the run goes on. The
+totals are also summarized in the metadata file at the end.
+"""
+
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from planner import format_duration
+
+logger = logging.getLogger("metrics")
+
+# Upper bounds in seconds of the request latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Seconds between the counts sent by a worker
+FLUSH_INTERVAL = 1
+
+
+class TaskMetrics:
+    """
+    Counts of a worker, sent to the main process with `flush`.
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.last_flush = time.monotonic()
+        self.reset()
+
+    def reset(self):
+        self.pairs = 0
+        # Requests, errors, cache hits and latencies of the sent requests
+        # per profile
+        self.profiles = {}
+
+    def record(self, profile, latency, error=False, cached=False):
+        counts = self.profiles.setdefault(profile, [0, 0, 0, []])
+        counts[0] += 1
+        counts[1] += error
+        counts[2] += cached
+        if not cached:
+            counts[3].append(latency)
+
+    def pair(self):
+        """
+        Count a finished pair, flushing the counts every `FLUSH_INTERVAL`.
+        """
+        self.pairs += 1
+        if time.monotonic() - self.last_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if self.queue is not None and (self.pairs or self.profiles):
+            self.queue.put((self.pairs, self.profiles))
+        self.last_flush = time.monotonic()
+        self.reset()
+
+
+class Metrics:
+    """
+    Aggregation of the counts of the workers. The queue must be passed to
+    the workers when the pool is created.
+    """
+
+    def __init__(self, path=None, interval=10):
+        self.path = path
+        self.interval = interval
+        self.queue = multiprocessing.Queue()
+        self.expected = 0
+        self.pairs = 0
+        self.requests = {}
+        self.errors = {}
+        self.cached = {}
+        self.histograms = {}
+        self.latency_sum = {}
+        # Latencies and pairs since the last report
+        self.window = []
+        self.window_pairs = 0
+        self.window_started = None
+        self.started = None
+        self.thread = None
+
+    def expect(self, pairs):
+        """
+        Add pairs to route to the progress.
+        """
+        self.expected += pairs
+
+    def start(self):
+        self.started = self.window_started = time.monotonic()
+        self.thread = threading.Thread(target=self._collect, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop collecting once the workers finished, with a last report.
+        """
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+        self.report()
+
+    def _collect(self):
+        next_report = time.monotonic() + self.interval
+        while True:
+            try:
+                message = self.queue.get(timeout=max(next_report - time.monotonic(), 0.01))
+            except queue.Empty:
+                message = ()
+            if message is None:
+                return
+            if message:
+                self._add(*message)
+            if time.monotonic() >= next_report:
+                self.report()
+                next_report = time.monotonic() + self.interval
+
+    def _add(self, pairs, profiles):
+        self.pairs += pairs
+        self.window_pairs += pairs
+        for profile, (requests, errors, cached, latencies) in profiles.items():
+            self.requests[profile] = self.requests.get(profile, 0) + requests
+            self.errors[profile] = self.errors.get(profile, 0) + errors
+            self.cached[profile] = self.cached.get(profile, 0) + cached
+            histogram = self.histograms.setdefault(profile, np.zeros(len(LATENCY_BUCKETS) + 1, dtype=np.int64))
+            np.add.at(histogram, np.searchsorted(LATENCY_BUCKETS, latencies), 1)
+            self.latency_sum[profile] = self.latency_sum.get(profile, 0.0) + sum(latencies)
+            self.window.extend(latencies)
+
+    def elapsed(self):
+        return time.monotonic() - self.started if self.started else 0.0
+
+    def rate(self):
+        elapsed = self.elapsed()
+        return self.pairs / elapsed if elapsed > 0 else 0.0
+
+    def eta(self):
+        rate = self.rate()
+        return max(self.expected - self.pairs, 0) / rate if rate > 0 else None
+
+    def report(self):
+        """
+        Log the progress since the last report and write the textfile.
+        """
+        requests = sum(self.requests.values())
+        now = time.monotonic()
+        window_rate = self.window_pairs / max(now - self.window_started, 1e-3)
+        p50, p95 = np.percentile(self.window, [50, 95]) * 1000 if self.window else (0, 0)
+        logger.info(
+            f"Progress: {self.pairs} of {self.expected} pairs ({self.pairs / max(self.expected, 1):.1%}), "
+            f"{window_rate:.1f} pairs/s, p50 {p50:.0f} ms, p95 {p95:.0f} ms, "
+            f"{sum(self.errors.values()) / max(requests, 1):.1%} errors, "
+            f"{sum(self.cached.values()) / max(requests, 1):.1%} cached, ETA {format_duration(self.eta())}."
+        )
+        self.window = []
+        self.window_pairs = 0
+        self.window_started = now
+        if self.path:
+            self.write(self.path)
+
+    def write(self, path):
+        """
+        Write the metrics in the Prometheus text format, replacing the file
+        atomically so the collector never reads half of it.
+        """
+        lines = []
+
+        def metric(name, kind, help, samples):
+            lines.append(f"# HELP travel_times_{name} {help}")
+            lines.append(f"# TYPE travel_times_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"travel_times_{name}{labels} {value}")
+
+        metric("pairs_total", "counter", "Pairs routed.", [("", self.pairs)])
+        metric("pairs_expected", "gauge", "Pairs to route in this run.", [("", self.expected)])
+        metric("pairs_per_second", "gauge", "Average pairs routed per second.", [("", round(self.rate(), 3))])
+        eta = self.eta()
+        metric("eta_seconds", "gauge", "Estimated seconds left.", [("", round(eta) if eta is not None else -1)])
+        for name, help, values in (
+            ("requests_total", "OSRM requests sent.", self.requests),
+            ("errors_total", "OSRM requests failed.", self.errors),
+            ("cache_hits_total", "OSRM requests answered by the cache.", self.cached),
+        ):
+            metric(name, "counter", help, [(f'{{profile="{p}"}}', v) for p, v in sorted(values.items())])
+
+        samples = []
+        for profile, histogram in sorted(self.histograms.items()):
+            cumulative = np.cumsum(histogram).tolist()
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), cumulative):
+                samples.append((f'_bucket{{profile="{profile}",le="{bound}"}}', count))
+            samples.append((f'_sum{{profile="{profile}"}}', round(self.latency_sum[profile], 6)))
+            samples.append((f'_count{{profile="{profile}"}}', cumulative[-1]))
+        metric("request_duration_seconds", "histogram", "Latency of the OSRM requests not cached.", samples)
+
+        with open(path + ".tmp", "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(path + ".tmp", path)
+
+    def summary(self):
+        """
+        Totals of the run for the metadata file, with the latency
+        percentiles approximated by the upper bounds of their buckets.
+        """
+        latency = {}
+        for profile, histogram in self.histograms.items():
+            cumulative = np.cumsum(histogram)
+            percentiles = {}
+            for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+                bucket = int(np.searchsorted(cumulative, q * cumulative[-1])) if cumulative[-1] else 0
+                bound = LATENCY_BUCKETS[bucket] if bucket < len(LATENCY_BUCKETS) else None
+                percentiles[name] = bound * 1000 if bound is not None else None
+            latency[profile] = percentiles
+        return {
+            "pairs": self.pairs,
+            "elapsed_seconds": round(self.elapsed(), 1),
+            "pairs_per_second": round(self.rate(), 2),
+            "requests": dict(self.requests),
+            "errors": dict(self.errors),
+            "cache_hits": dict(self.cached),
+            "latency_ms": latency,
+        }
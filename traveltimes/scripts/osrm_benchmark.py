@@ -0,0 +1,314 @@
+"""
+This is a benchmark of `travel_times.py` against local fake OSRM servers
+(see `fake_osrm.py`), so the client can be tuned and checked for
+regressions without the routing engine nor any map data.
+
+It generates a synthetic postcodes file, starts the fake servers with the
+given latency and errors, and runs `travel_times.py` for every number of
+threads, first with an empty requests cache and hints (cold) and then again
+with the cache filled by the first run (warm). For every run it reports the
+end to end runtime, the pairs and requests per second, the requests that
+reached the servers, and the peak memory of the largest process.
+"""
+
+import logging
+import os
+import argparse
+import csv
+import json
+import random
+import shlex
+import subprocess
+import sys
+import time
+from urllib.error import URLError
+from urllib.request import urlopen
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Define arguments with argparse
+parser = argparse.ArgumentParser(description="Benchmark travel_times.py against fake OSRM servers.")
+
+defaults = {
+    "loglevel": os.environ.get("LOGLEVEL", "INFO"),
+    "postcodes": 60,
+    "threads": "1,2,4,8",
+    "servers": 1,
+    "port": 5500,
+    "latency": 2.0,
+    "jitter": 0.5,
+    "error_rate": 0.0,
+    "work_dir": "data/osrm_benchmark",
+    "output": "data/osrm_benchmark.json",
+    "args": "",
+}
+
+parser.add_argument(
+    "--loglevel",
+    "-l",
+    choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+    metavar="LOGLEVEL",
+    default=defaults["loglevel"],
+    type=str,
+    help=f"Logging level for the script. Options: DEBUG, INFO, WARNING, ERROR, CRITICAL. Default {defaults['loglevel']}.",
+)
+parser.add_argument(
+    "--postcodes",
+    default=defaults["postcodes"],
+    type=int,
+    help=f"Number of synthetic postcodes, every pair of them is routed. Default {defaults['postcodes']}.",
+)
+parser.add_argument(
+    "--threads",
+    default=defaults["threads"],
+    type=str,
+    help=f"Comma separated numbers of threads of travel_times.py to run with. Default {defaults['threads']}.",
+)
+parser.add_argument(
+    "--servers",
+    default=defaults["servers"],
+    type=int,
+    help=f"Number of fake OSRM servers the requests are balanced across. Default {defaults['servers']}.",
+)
+parser.add_argument(
+    "--port",
+    default=defaults["port"],
+    type=int,
+    help=f"Port of the first fake OSRM server, the rest use the following ones. Default {defaults['port']}.",
+)
+parser.add_argument(
+    "--latency",
+    default=defaults["latency"],
+    type=float,
+    help=f"Mean milliseconds the fake servers add to every response. Default {defaults['latency']}.",
+)
+parser.add_argument(
+    "--jitter",
+    default=defaults["jitter"],
+    type=float,
+    help=f"Standard deviation in milliseconds of the added latency. Default {defaults['jitter']}.",
+)
+parser.add_argument(
+    "--error-rate",
+    default=defaults["error_rate"],
+    type=float,
+    help=f"Share of the requests the fake servers fail with a server error. Default {defaults['error_rate']}.",
+)
+parser.add_argument(
+    "--work-dir",
+    default=defaults["work_dir"],
+    type=str,
+    help=f"Folder where the runs read and write their data, cache included. Default {defaults['work_dir']}.",
+)
+parser.add_argument(
+    "--output",
+    default=defaults["output"],
+    type=str,
+    help=f"Path to the JSON file with the results. Default {defaults['output']}.",
+)
+parser.add_argument(
+    "--args",
+    default=defaults["args"],
+    type=str,
+    help='Extra arguments for travel_times.py, like "--radius 20 --tile-size 50".',
+)
+parser.add_argument(
+    "--seed",
+    default=0,
+    type=int,
+    help="Seed for the synthetic postcodes and the fake servers. Default 0.",
+)
+
+logger = logging.getLogger("osrm_benchmark")
+
+
+def write_postcodes(path, size, seed=0):
+    """
+    Write a postcodes file with `size` random locations around Valencia.
+    """
+    rng = random.Random(seed)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["codigo_postal", "lat", "lon"])
+        for i in range(size):
+            writer.writerow([f"{46000 + i:05d}", round(rng.uniform(39.2, 39.8), 6), round(rng.uniform(-0.8, -0.2), 6)])
+
+
+def start_servers(count, port, latency, jitter, error_rate, seed):
+    """
+    Start the fake OSRM servers and wait until they answer. Returns the
+    processes and their URLs.
+    """
+    processes, urls = [], []
+    for i in range(count):
+        processes.append(
+            subprocess.Popen(
+                [
+                    sys.executable,
+                    os.path.join(SCRIPTS_DIR, "fake_osrm.py"),
+                    "--port", str(port + i),
+                    "--latency", str(latency),
+                    "--jitter", str(jitter),
+                    "--error-rate", str(error_rate),
+                    "--seed", str(seed + i),
+                    "--loglevel", "WARNING",
+                ]
+            )
+        )
+        urls.append(f"http://127.0.0.1:{port + i}")
+    for url in urls:
+        for _ in range(100):
+            try:
+                server_stats(url)
+                break
+            except (URLError, OSError):
+                time.sleep(0.1)
+        else:
+            stop_servers(processes)
+            raise RuntimeError(f"Fake OSRM server {url} didn't start.")
+    return processes, urls
+
+
+def stop_servers(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait()
+
+
+def server_stats(url):
+    with urlopen(f"{url}/stats", timeout=5) as response:
+        return json.load(response)
+
+
+def served(urls):
+    """
+    Requests served by the fake servers so far, per service.
+    """
+    totals = {}
+    for url in urls:
+        for service, count in server_stats(url).items():
+            totals[service] = totals.get(service, 0) + count
+    return totals
+
+
+def run_travel_times(work_dir, urls, threads, extra_args):
+    """
+    Run `travel_times.py` in the working folder. Returns the exit code, the
+    wall time in seconds and the peak memory of the largest process in MB.
+    """
+    command = [
+        sys.executable,
+        os.path.join(SCRIPTS_DIR, "travel_times.py"),
+        "--force",
+        "--loglevel", "WARNING",
+        "--threads", str(threads),
+        "--osrm", ",".join(urls),
+        "--input", "data/postcodes.csv",
+        "--output", "data/travel_times.csv",
+        "--metrics", "",
+        *extra_args,
+    ]
+    logger.debug(f"Running {' '.join(command)}")
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=work_dir)
+    # The resource usage of this child and its finished pool workers
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    return os.waitstatus_to_exitcode(status), elapsed, usage.ru_maxrss / 1024
+
+
+def clear_cache(work_dir):
+    """
+    Remove the requests cache and the hints of the previous runs.
+    """
+    data_dir = os.path.join(work_dir, "data")
+    for name in os.listdir(data_dir):
+        if name.startswith("travel_times_cache.sqlite") or name.startswith("travel_times_osrm_hints"):
+            os.remove(os.path.join(data_dir, name))
+
+
+if __name__ == "__main__":
+    # Parse the arguments
+    args = parser.parse_args()
+
+    # Set up basic logging
+    logging.basicConfig(
+        level=args.loglevel.upper(),
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%H:%M:%S",
+    )
+
+    try:
+        threads = [int(t) for t in args.threads.split(",") if t.strip()]
+    except ValueError:
+        logger.error(f"Invalid threads: {args.threads}.")
+        exit(1)
+    extra_args = shlex.split(args.args)
+
+    os.makedirs(os.path.join(args.work_dir, "data"), exist_ok=True)
+    write_postcodes(os.path.join(args.work_dir, "data", "postcodes.csv"), args.postcodes, args.seed)
+    logger.info(f"Benchmarking {args.postcodes} postcodes, {args.postcodes * (args.postcodes - 1) // 2} pairs.")
+
+    processes, urls = start_servers(args.servers, args.port, args.latency, args.jitter, args.error_rate, args.seed)
+    logger.info(
+        f"Started {len(urls)} fake OSRM servers with {args.latency} ms latency, {args.jitter} ms jitter "
+        f"and {args.error_rate:.1%} errors."
+    )
+
+    runs = []
+    try:
+        for count in threads:
+            for cache in ("cold", "warm"):
+                if cache == "cold":
+                    clear_cache(args.work_dir)
+                before = served(urls)
+                code, elapsed, peak = run_travel_times(args.work_dir, urls, count, extra_args)
+                after = served(urls)
+                if code != 0:
+                    logger.error(f"travel_times.py failed with {count} threads and a {cache} cache, exit code {code}.")
+                    exit(1)
+
+                with open(os.path.join(args.work_dir, "data", "travel_times.metadata.json")) as f:
+                    metrics = json.load(f)["metrics"]
+                requests_sent = sum(metrics["requests"].values())
+                run = {
+                    "threads": count,
+                    "cache": cache,
+                    "elapsed_seconds": round(elapsed, 3),
+                    "pairs": metrics["pairs"],
+                    "pairs_per_second": round(metrics["pairs"] / elapsed, 1),
+                    "requests": requests_sent,
+                    "requests_per_second": round(requests_sent / elapsed, 1),
+                    "cache_hits": sum(metrics["cache_hits"].values()),
+                    "errors": sum(metrics["errors"].values()),
+                    "served": {service: after.get(service, 0) - before.get(service, 0) for service in after},
+                    "peak_rss_mb": round(peak, 1),
+                }
+                runs.append(run)
+                logger.info(
+                    f"{count} threads, {cache} cache: {run['elapsed_seconds']:.2f} s, "
+                    f"{run['requests_per_second']:.0f} requests/s, {run['pairs_per_second']:.0f} pairs/s, "
+                    f"{run['cache_hits']} cached, {run['served'].get('route', 0)} routed by the servers, "
+                    f"{run['errors']} errors, peak {run['peak_rss_mb']:.0f} MB."
+                )
+    finally:
+        stop_servers(processes)
+
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "timestamp": time.strftime('%Y-%m-%d %H:%M:%S'),
+                "postcodes": args.postcodes,
+                "servers": args.servers,
+                "latency_ms": args.latency,
+                "jitter_ms": args.jitter,
+                "error_rate": args.error_rate,
+                "args": extra_args,
+                "runs": runs,
+            },
+            f,
+            indent=4,
+        )
+    logger.info(f"Results written to {args.output}.")
+    exit(0)
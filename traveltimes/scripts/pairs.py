@@ -0,0 +1,165 @@
+"""
+Selection of the postcode pairs to route.
+
+A plan is stored in CSR form: the destinations of the origin `i` are
+`indices[indptr[i]:indptr[i + 1]]`, always sorted and greater than `i`, as
+each unordered pair is routed forward and backward at once.
+
+Without limits every pair is selected. Large runs can skip building that
+dense plan and route the pairs of `np.arange(n)` instead (see
+`tile_tasks`). With a radius and/or a number of
+nearest neighbours, only the pairs within the straight line radius or among
+the K nearest postcodes of either end are kept, found with a KD-tree over
+the coordinates projected on the unit sphere.
+"""
+
+import logging
+from typing import NamedTuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+logger = logging.getLogger("pairs")
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+class Plan(NamedTuple):
+    """
+    Pairs to route in CSR form.
+    """
+
+    indptr: np.ndarray
+    indices: np.ndarray
+
+    @property
+    def size(self):
+        return len(self.indices)
+
+    def destinations(self, origin):
+        return self.indices[self.indptr[origin] : self.indptr[origin + 1]]
+
+
+def haversine(lon1, lat1, lon2, lat2):
+    """
+    Vectorized great circle distance in kilometers between coordinates in
+    degrees.
+    """
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def unit_vectors(coordinates):
+    """
+    Project (lon, lat) pairs in degrees on the unit sphere, where the
+    euclidean (chord) distance grows with the great circle distance.
+    """
+    lon = np.radians(coordinates[:, 0])
+    lat = np.radians(coordinates[:, 1])
+    return np.column_stack(
+        (np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat))
+    )
+
+
+def plan_from_pairs(n, rows, cols):
+    """
+    Build a plan from arrays of origin and destination indexes, keeping each
+    unordered pair once with the origin lower than the destination.
+    """
+    rows, cols = np.minimum(rows, cols), np.maximum(rows, cols)
+    keep = rows != cols
+    codes = np.unique(rows[keep].astype(np.int64) * n + cols[keep])
+    rows, cols = codes // n, codes % n
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return Plan(indptr, cols.astype(np.int32))
+
+
+def dense_plan(n):
+    """
+    Plan with every pair.
+    """
+    rows, cols = np.triu_indices(n, 1)
+    return plan_from_pairs(n, rows, cols)
+
+
+def select_pairs(coordinates, radius=0, nearest=0):
+    """
+    Select the pairs to route from a (N, 2) array of (lon, lat) coordinates.
+
+    Args:
+        radius: keep the pairs closer than this straight line distance in
+            kilometers. 0 for no radius.
+        nearest: keep the pairs where one end is among the K nearest
+            postcodes of the other. 0 for no nearest neighbours.
+
+    When both are set a pair is kept if it meets any of them. When none is
+    set every pair is kept.
+    """
+    n = len(coordinates)
+    if not radius and not nearest:
+        return dense_plan(n)
+
+    tree = cKDTree(unit_vectors(coordinates))
+    rows, cols = [], []
+
+    if radius:
+        # Chord length on the unit sphere for the radius
+        chord = 2 * np.sin(radius / (2 * EARTH_RADIUS_KM))
+        pairs = tree.query_pairs(chord, output_type="ndarray")
+        # Double check the distance with the haversine formula
+        distances = haversine(
+            coordinates[pairs[:, 0], 0],
+            coordinates[pairs[:, 0], 1],
+            coordinates[pairs[:, 1], 0],
+            coordinates[pairs[:, 1], 1],
+        )
+        pairs = pairs[distances <= radius]
+        rows.append(pairs[:, 0])
+        cols.append(pairs[:, 1])
+        logger.debug(f"Found {len(pairs)} pairs within {radius} km.")
+
+    if nearest:
+        k = min(nearest + 1, n)
+        _, neighbours = tree.query(tree.data, k=k)
+        neighbours = neighbours.reshape(n, k)
+        rows.append(np.repeat(np.arange(n), k))
+        cols.append(neighbours.ravel())
+        logger.debug(f"Found the {nearest} nearest postcodes of {n} postcodes.")
+
+    return plan_from_pairs(n, np.concatenate(rows), np.concatenate(cols))
+
+
+def tile_tasks(plan, n, rows, cols):
+    """
+    Worker tasks `(origin, start, stop)` to route the pairs of the plan with
+    the origin in the range `rows` and the destination in the range `cols`,
+    where `start:stop` is a range of `plan.indices`. With no plan every pair
+    is routed and the ranges are of `np.arange(n)`.
+    """
+    tasks = []
+    for origin in range(rows.start, min(rows.stop, n)):
+        if plan is None:
+            start, stop = max(origin + 1, cols.start), min(cols.stop, n)
+        else:
+            destinations = plan.destinations(origin)
+            offset = int(plan.indptr[origin])
+            start = offset + int(np.searchsorted(destinations, cols.start))
+            stop = offset + int(np.searchsorted(destinations, cols.stop))
+        if stop > start:
+            tasks.append((origin, start, stop))
+    return tasks
+
+
+def origins(plan, n):
+    """
+    Indexes of the origins with at least one destination in the plan, or in
+    every pair when there is no plan.
+    """
+    if plan is None:
+        return np.arange(max(n - 1, 0))
+    return np.flatnonzero(np.diff(plan.indptr))
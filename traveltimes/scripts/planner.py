@@ -0,0 +1,187 @@
+"""
+Cost estimate of a travel times run before starting it.
+
+With `--plan`, `travel_times.py` builds the same pair plan as a run and,
+instead of routing it, estimates for every profile:
+
+* which part of the requests is already in the requests cache, looking up
+  the cache keys of a sample of the pairs in bulk
+* the latency and throughput of its OSRM servers, sending a few hundred live
+  requests at each concurrency setting
+* the requests left to send and the time they would take at each setting
+"""
+
+import logging
+import time
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+import requests
+
+from logs import get_sampled_logger
+
+logger = logging.getLogger("planner")
+# Logger for the messages about every measured request, sampled
+request_logger = get_sampled_logger("planner.requests")
+
+# Pairs whose cache keys are looked up to estimate the cache hit ratio
+COVERAGE_SAMPLE = 100000
+
+# Cache keys per SQLite query
+BATCH = 500
+
+
+def route_path(profile, origin, destination):
+    """
+    Path of the OSRM `/route` request between two `(lon, lat, hint)`
+    tuples, with the hints when any of them is known.
+    """
+    originLon, originLat, originHint = origin
+    destLon, destLat, destHint = destination
+    path = f"/route/v1/{profile}/{originLon},{originLat};{destLon},{destLat}?overview=false"
+    if originHint or destHint:
+        path += f"&hints={originHint};{destHint}"
+    return path
+
+
+def format_duration(seconds):
+    """
+    Format a number of seconds as `[Nd ]HH:MM:SS`, or unknown for None.
+    """
+    if seconds is None:
+        return "unknown"
+    days, rest = divmod(int(seconds), 86400)
+    return (f"{days}d " if days else "") + time.strftime("%H:%M:%S", time.gmtime(rest))
+
+
+def pair_offsets(plan, n):
+    """
+    Offset of the first pair of every origin in the list of pairs of the
+    plan, or of every pair when there is no plan, as an array of n + 1.
+    """
+    if plan is not None:
+        return plan.indptr
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.arange(n - 1, -1, -1), out=offsets[1:])
+    return offsets
+
+
+def sample_pairs(plan, n, size, last_origin=None, seed=0):
+    """
+    Random sample of up to `size` pairs of the plan, or of every pair, with
+    the origin before `last_origin`. Returns the number of pairs and the
+    sorted origin and destination arrays of the sample, every pair when there
+    are fewer than `size`.
+    """
+    offsets = pair_offsets(plan, n)
+    total = int(offsets[n if last_origin is None else last_origin])
+    if total <= size:
+        picked = np.arange(total, dtype=np.int64)
+    else:
+        picked = np.sort(np.random.default_rng(seed).choice(total, size, replace=False))
+    origins = np.searchsorted(offsets, picked, side="right") - 1
+    if plan is None:
+        destinations = origins + 1 + (picked - offsets[origins])
+    else:
+        destinations = plan.indices[picked].astype(np.int64)
+    return total, origins, destinations
+
+
+def cached_urls(session, urls):
+    """
+    Mask of the URLs with a response in the cache of a CachedSession, with
+    the cache keys looked up in batches.
+    """
+    keys = [session.cache.create_key(requests.Request("GET", url).prepare()) for url in urls]
+    responses = session.cache.responses
+    found = set()
+    with responses.connection() as con:
+        for start in range(0, len(keys), BATCH):
+            batch = keys[start : start + BATCH]
+            marks = ",".join("?" * len(batch))
+            found.update(
+                row[0]
+                for row in con.execute(f"SELECT key FROM {responses.table_name} WHERE key IN ({marks})", batch)
+            )
+    return np.array([key in found for key in keys], dtype=bool)
+
+
+def measure(endpoints, paths, concurrency):
+    """
+    Send the paths to the endpoints from `concurrency` threads, without the
+    cache. Returns the latencies in seconds of the successful requests, the
+    number of errors, and the elapsed time.
+    """
+    session = requests.Session()
+
+    def send(path):
+        start = time.perf_counter()
+        try:
+            endpoints.get(session, path).raise_for_status()
+        except requests.exceptions.RequestException as e:
+            request_logger.debug("Error measuring %s: %s", path, e)
+            return None
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPool(concurrency) as pool:
+        latencies = pool.map(send, paths)
+    elapsed = time.perf_counter() - start
+    return [latency for latency in latencies if latency is not None], latencies.count(None), elapsed
+
+
+def estimate(session, endpoints, profile, coordinates, hints, pairs, sample, concurrencies, live=200):
+    """
+    Estimate the cost of routing the pairs of a profile.
+
+    Args:
+        session: CachedSession of the run, to look up the cache keys.
+        pairs: number of pairs to route.
+        sample: (origins, destinations) arrays of sampled pairs.
+        concurrencies: numbers of parallel requests to measure.
+        live: number of live requests sent at each concurrency.
+
+    Returns a dict with the cache hit ratio, the projected requests, and the
+    latency, throughput and ETA of every concurrency.
+    """
+    origins, destinations = sample
+
+    def endpoint(i):
+        return (*coordinates[i].tolist(), hints[i])
+
+    # Forward and backward requests of every sampled pair
+    paths = []
+    for origin, destination in zip(origins.tolist(), destinations.tolist()):
+        paths.append(route_path(profile, endpoint(origin), endpoint(destination)))
+        paths.append(route_path(profile, endpoint(destination), endpoint(origin)))
+
+    hit = cached_urls(session, [endpoints.urls[0] + path for path in paths])
+    hit_ratio = float(hit.mean()) if len(paths) else 0.0
+    projected = int(round(2 * pairs * (1 - hit_ratio)))
+
+    # Measure with the requests that are not cached, as the run would send,
+    # spread over the sample
+    missing = [path for path, cached in zip(paths, hit.tolist()) if not cached] or paths
+    missing = missing[:: max(1, len(missing) // max(live, 1))][:live]
+    report = {
+        "endpoints": endpoints.urls,
+        "pairs": pairs,
+        "requests": 2 * pairs,
+        "sampled_requests": len(paths),
+        "cache_hit_ratio": round(hit_ratio, 4),
+        "projected_requests": projected,
+        "concurrency": {},
+    }
+    for concurrency in concurrencies:
+        latencies, errors, elapsed = measure(endpoints, missing, concurrency)
+        throughput = len(latencies) / elapsed if elapsed > 0 else 0
+        percentiles = np.percentile(latencies, [50, 95, 99]) * 1000 if latencies else [0, 0, 0]
+        report["concurrency"][concurrency] = {
+            "requests": len(latencies) + errors,
+            "errors": errors,
+            "latency_ms": {name: round(float(value), 1) for name, value in zip(("p50", "p95", "p99"), percentiles)},
+            "requests_per_second": round(throughput, 1),
+            "eta_seconds": round(projected / throughput) if throughput else None,
+        }
+    return report
+
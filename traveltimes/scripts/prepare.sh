@@ -3,49 +3,85 @@
 set -eu
 
 # Check if a parameter has been passed
-if [ "$#" -ne 1 ]; then
-  echo "Usage: $0 <region>"
+if [ "$#" -lt 1 ] || [ "$#" -gt 2 ]; then
+  echo "Usage: $0 <region> [driving|walking|cycling]"
   exit 1
 fi
 
 REGION=$1
 if [ -z "$REGION" ]; then
-  echo "Usage: $0 <region>"
+  echo "Usage: $0 <region> [driving|walking|cycling]"
   exit 1
 fi
-if [ ! -f "/data/${REGION}-latest.osm.pbf" ]; then
-  echo "OSM PBF file not found: /data/${REGION}-latest.osm.pbf"
+
+# The OSM PBF file is the Geofabrik one or, with OSM_EXTRACT=clipped, the one
+# clipped to the area of the postcodes by clip_pbf.py
+SOURCE=${REGION}-${OSM_EXTRACT:-latest}
+
+# Map the OSRM profile to its Lua profile and dataset name, the driving
+# dataset keeps the name of the OSM PBF file
+PROFILE=${2:-driving}
+case "$PROFILE" in
+  driving)
+    LUA_PROFILE=car
+    DATASET=${SOURCE}
+    OSRM_INFO_FILE="/data/travel_times_osrm.metadata.json"
+    ;;
+  walking)
+    LUA_PROFILE=foot
+    DATASET=${REGION}-${PROFILE}
+    OSRM_INFO_FILE="/data/travel_times_osrm_${PROFILE}.metadata.json"
+    ;;
+  cycling)
+    LUA_PROFILE=bicycle
+    DATASET=${REGION}-${PROFILE}
+    OSRM_INFO_FILE="/data/travel_times_osrm_${PROFILE}.metadata.json"
+    ;;
+  *)
+    echo "Unknown profile: $PROFILE"
+    exit 1
+    ;;
+esac
+if [ ! -f "/data/${SOURCE}.osm.pbf" ]; then
+  echo "OSM PBF file not found: /data/${SOURCE}.osm.pbf"
   exit 1
 fi
-if [ ! -f "/opt/car.lua" ]; then
-  echo "Lua profile not found: /opt/car.lua"
+if [ ! -f "/opt/${LUA_PROFILE}.lua" ]; then
+  echo "Lua profile not found: /opt/${LUA_PROFILE}.lua"
   exit 1
 fi
 
 # Get the timestamp of the OSM PBF file
-OSM_PBF_TIMESTAMP=$(stat -c %y /data/${REGION}-latest.osm.pbf | cut -d'.' -f1)
+OSM_PBF_TIMESTAMP=$(stat -c %y /data/${SOURCE}.osm.pbf | cut -d'.' -f1)
 if [ -z "$OSM_PBF_TIMESTAMP" ]; then
   echo "Failed to get timestamp of the OSM PBF file"
   exit 1
 fi
 
 # Compute the size of the OSM PBF file
-OSM_PBF_SIZE=$(stat -c %s /data/${REGION}-latest.osm.pbf)
+OSM_PBF_SIZE=$(stat -c %s /data/${SOURCE}.osm.pbf)
 
 # Compute md5sum of the OSM PBF file
-OSM_PBF_MD5=$(md5sum /data/${REGION}-latest.osm.pbf | awk '{print $1}')
+OSM_PBF_MD5=$(md5sum /data/${SOURCE}.osm.pbf | awk '{print $1}')
 if [ -z "$OSM_PBF_MD5" ]; then
   echo "Failed to compute md5sum of the OSM PBF file"
   exit 1
 fi
 
+# Add the clip polygon and filters of a clipped file
+CLIP_INFO=""
+if [ "$SOURCE" != "${REGION}-latest" ] && [ -f "/data/${SOURCE}.clip.json" ]; then
+  CLIP_INFO=",
+  \"clip\": $(cat /data/${SOURCE}.clip.json)"
+fi
+
 # Write the OSM PBF file information to a JSON file
 OSM_PBF_INFO_FILE="/data/travel_times_osm_pbf.metadata.json"
 cat <<EOF > $OSM_PBF_INFO_FILE
 {
   "timestamp": "$OSM_PBF_TIMESTAMP",
   "size": $OSM_PBF_SIZE,
-  "md5": "$OSM_PBF_MD5"
+  "md5": "$OSM_PBF_MD5"$CLIP_INFO
 }
 EOF
 if [ ! -f $OSM_PBF_INFO_FILE ]; then
@@ -53,30 +89,36 @@ if [ ! -f $OSM_PBF_INFO_FILE ]; then
   exit 1
 fi
 
+# The OSRM files are named after the input file, so the other profiles
+# extract a link to the OSM PBF file named after their dataset
+if [ "$DATASET" != "${SOURCE}" ]; then
+  ln -sf ${SOURCE}.osm.pbf /data/${DATASET}.osm.pbf
+fi
+
 # Prepare the OSM PBF file for OSRM
-osrm-extract -p /opt/car.lua /data/${REGION}-latest.osm.pbf 
-osrm-partition /data/${REGION}-latest.osrm
-osrm-customize /data/${REGION}-latest.osrm
+osrm-extract -p /opt/${LUA_PROFILE}.lua /data/${DATASET}.osm.pbf
+osrm-partition /data/${DATASET}.osrm
+osrm-customize /data/${DATASET}.osrm
 
 # Check if the OSRM files were created successfully
-OSRM_FILES=$(ls /data/${REGION}-latest.osrm* 2>/dev/null | wc -l)
+OSRM_FILES=$(ls /data/${DATASET}.osrm* 2>/dev/null | wc -l)
 if [ "$OSRM_FILES" -eq 0 ]; then
   echo "Failed to create OSRM files"
   exit 1
 fi
 
 # Get the total size of the OSRM files
-OSRM_FILES_SIZE=$(du -c /data/${REGION}-latest.osrm* | grep total | awk '{print $1}')
+OSRM_FILES_SIZE=$(du -c /data/${DATASET}.osrm* | grep total | awk '{print $1}')
 if [ -z "$OSRM_FILES_SIZE" ]; then
   echo "Failed to compute size of the OSRM files"
   exit 1
 fi
 
 # Store the OSRM results in a JSON file
-OSRM_INFO_FILE="/data/travel_times_osrm.metadata.json"
 cat <<EOF > $OSRM_INFO_FILE
 {
   "timestamp": "$OSM_PBF_TIMESTAMP",
+  "profile": "$PROFILE",
   "files": "$OSRM_FILES",
   "size": "$OSRM_FILES_SIZE"
 }
@@ -0,0 +1,190 @@
+"""
+This is a load test for the query service in `query_service.py`. It sends
+random reachable schools queries from several concurrent clients using
+keep-alive connections and reports the throughput and the latency
+percentiles, both end to end and as measured by the service.
+"""
+
+import logging
+import os
+import argparse
+import json
+import random
+import statistics
+import threading
+import time
+from http.client import HTTPConnection
+from urllib.parse import urlencode
+
+# Define arguments with argparse
+parser = argparse.ArgumentParser(description="Load test the query service.")
+
+defaults = {
+    "loglevel": os.environ.get("LOGLEVEL", "INFO"),
+    "host": os.environ.get("QUERY_HOST", "localhost"),
+    "port": int(os.environ.get("QUERY_PORT", 8000)),
+    "clients": 8,
+    "requests": 2000,
+    "max_times": "10,15,30,45",
+}
+
+parser.add_argument(
+    "--loglevel",
+    "-l",
+    choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+    metavar="LOGLEVEL",
+    default=defaults["loglevel"],
+    type=str,
+    help=f"Logging level for the script. Options: DEBUG, INFO, WARNING, ERROR, CRITICAL. Default {defaults['loglevel']}.",
+)
+parser.add_argument(
+    "--host",
+    default=defaults["host"],
+    type=str,
+    help=f"Host of the query service. Default {defaults['host']}.",
+)
+parser.add_argument(
+    "--port",
+    default=defaults["port"],
+    type=int,
+    help=f"Port of the query service. Default {defaults['port']}.",
+)
+parser.add_argument(
+    "--clients",
+    default=defaults["clients"],
+    type=int,
+    help=f"Number of concurrent clients. Default {defaults['clients']}.",
+)
+parser.add_argument(
+    "--requests",
+    default=defaults["requests"],
+    type=int,
+    help=f"Total number of requests to send. Default {defaults['requests']}.",
+)
+parser.add_argument(
+    "--max-times",
+    default=defaults["max_times"],
+    type=str,
+    help=f"Comma separated max_time values to pick from. Default {defaults['max_times']}.",
+)
+parser.add_argument(
+    "--nivel",
+    action="append",
+    default=[],
+    help="Optional level filter to add to every query. Can be repeated.",
+)
+parser.add_argument(
+    "--reg",
+    action="append",
+    default=[],
+    help="Optional régimen filter to add to every query. Can be repeated.",
+)
+parser.add_argument(
+    "--seed",
+    default=0,
+    type=int,
+    help="Seed for the random queries. Default 0.",
+)
+
+logger = logging.getLogger("query_benchmark")
+
+
+def percentile(values, pct):
+    """
+    Nearest rank percentile of a sorted list.
+    """
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run_client(host, port, queries, latencies, server_latencies, errors):
+    """
+    Send the queries over a single keep-alive connection.
+    """
+    connection = HTTPConnection(host, port)
+    for query in queries:
+        start = time.perf_counter()
+        try:
+            connection.request("GET", f"/reachable?{urlencode(query, doseq=True)}")
+            response = connection.getresponse()
+            body = response.read()
+        except OSError as e:
+            logger.error(f"Request failed: {e}")
+            errors.append(str(e))
+            connection.close()
+            connection = HTTPConnection(host, port)
+            continue
+        latencies.append(time.perf_counter() - start)
+        if response.status != 200:
+            errors.append(response.status)
+            continue
+        server_latencies.append(json.loads(body)["elapsed_ms"] / 1000)
+    connection.close()
+
+
+if __name__ == "__main__":
+    # Parse the arguments
+    args = parser.parse_args()
+
+    # Set up basic logging
+    logging.basicConfig(
+        level=args.loglevel.upper(),
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%H:%M:%S",
+    )
+
+    # Get the postcodes from the service itself to build valid queries
+    connection = HTTPConnection(args.host, args.port)
+    connection.request("GET", "/health")
+    health = json.loads(connection.getresponse().read())
+    connection.request("GET", "/postcodes")
+    postcodes = json.loads(connection.getresponse().read())["postcodes"]
+    connection.close()
+    logger.info(f"Service ready with {health['postcodes']} postcodes and {health['schools']} schools.")
+
+    rng = random.Random(args.seed)
+    max_times = [int(t) for t in args.max_times.split(",")]
+    # With landmark bounds the service only answers their thresholds
+    if health.get("thresholds"):
+        max_times = [t for t in max_times if t in health["thresholds"]] or health["thresholds"]
+        logger.info(f"The travel times have landmark bounds, querying max_time {', '.join(map(str, max_times))}.")
+    queries = [
+        {
+            "cp": rng.choice(postcodes),
+            "max_time": rng.choice(max_times),
+            "nivel": args.nivel,
+            "reg": args.reg,
+        }
+        for _ in range(args.requests)
+    ]
+
+    latencies, server_latencies, errors = [], [], []
+    threads = [
+        threading.Thread(
+            target=run_client,
+            args=(args.host, args.port, queries[i :: args.clients], latencies, server_latencies, errors),
+        )
+        for i in range(args.clients)
+    ]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    server_latencies.sort()
+    logger.info(f"Sent {len(queries)} requests with {args.clients} clients in {elapsed:.2f} seconds.")
+    logger.info(f"Throughput: {len(latencies) / elapsed:.0f} requests/sec, {len(errors)} errors.")
+    for name, values in (("End to end", latencies), ("Service", server_latencies)):
+        logger.info(
+            f"{name} latency: mean {statistics.mean(values) * 1000 if values else 0:.3f} ms, "
+            f"p50 {percentile(values, 50) * 1000:.3f} ms, "
+            f"p95 {percentile(values, 95) * 1000:.3f} ms, "
+            f"p99 {percentile(values, 99) * 1000:.3f} ms."
+        )
+
+    exit(1 if errors else 0)
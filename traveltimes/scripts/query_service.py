@@ -0,0 +1,366 @@
+"""
+This is a small local HTTP service to answer which schools are reachable
+from a postcode within a given number of minutes.
+
+At startup it builds (if missing or outdated) a query index folder with the
+schools of the `schools` app located at the postcodes of the `postcodes`
+app, as NumPy arrays, and memory-maps it with the travel time matrix folder
+written by `travel_times.py`, so every query is a row read plus a few
+vectorized comparisons.
+
+Endpoints:
+
+* `GET /reachable?cp=46001&max_time=15[&nivel=INFANTIL][&reg=PUB]`, where
+  `nivel` and `reg` can be repeated. `nivel` matches any authorized level
+  containing the text, `reg` matches the school régimen. The schools whose
+  travel time is a landmark upper bound instead of a routed value have
+  `bounded` set and no distance. The bounds are only on the right side of
+  the thresholds they were decided against, so with landmark bounds
+  `max_time` must be one of them.
+* `GET /postcodes` with the list of known postcodes
+* `GET /health`, with the thresholds of the landmark bounds, if any
+"""
+
+import logging
+import os
+import argparse
+import json
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+from matrix import BOUNDED, open_flags, open_matrix, read_thresholds
+from schools_index import read_postcodes, read_schools, assign_postcodes
+
+# Define arguments with argparse
+parser = argparse.ArgumentParser(
+    description="Serve postcode to school travel lookups over HTTP."
+)
+
+defaults = {
+    "loglevel": os.environ.get("LOGLEVEL", "INFO"),
+    "schools": os.environ.get("SCHOOLS", "data/schools.json"),
+    "postcodes": os.environ.get("INPUT", "data/postcodes.csv"),
+    "matrix": os.environ.get("MATRIX", "data/travel_times.matrix"),
+    "index": os.environ.get("QUERY_INDEX", "data/query_index"),
+    "id": os.environ.get("ID_FIELD", "codigo_postal"),
+    "lat": os.environ.get("LAT_FIELD", "lat"),
+    "lon": os.environ.get("LON_FIELD", "lon"),
+    "host": os.environ.get("QUERY_HOST", "0.0.0.0"),
+    "port": int(os.environ.get("QUERY_PORT", 8000)),
+}
+
+parser.add_argument(
+    "--loglevel",
+    "-l",
+    choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+    metavar="LOGLEVEL",
+    default=defaults["loglevel"],
+    type=str,
+    help=f"Logging level for the script. Options: DEBUG, INFO, WARNING, ERROR, CRITICAL. Default {defaults['loglevel']}.",
+)
+parser.add_argument(
+    "--schools",
+    default=defaults["schools"],
+    type=str,
+    help=f"Path to the schools JSON file produced by the schools app. Default {defaults['schools']}.",
+)
+parser.add_argument(
+    "--postcodes",
+    default=defaults["postcodes"],
+    type=str,
+    help=f"Path to the postcodes CSV file produced by the postcodes app. Default {defaults['postcodes']}.",
+)
+parser.add_argument(
+    "--matrix",
+    default=defaults["matrix"],
+    type=str,
+    help=f"Path to the travel times matrix folder produced by travel_times.py. Default {defaults['matrix']}.",
+)
+parser.add_argument(
+    "--index",
+    default=defaults["index"],
+    type=str,
+    help=f"Folder where the query index is built and memory-mapped from. Default {defaults['index']}.",
+)
+parser.add_argument(
+    "--id",
+    default=defaults["id"],
+    type=str,
+    help=f"Field in the postcodes CSV file that contains the postcode. Default {defaults['id']}.",
+)
+parser.add_argument(
+    "--lat",
+    default=defaults["lat"],
+    type=str,
+    help=f"Field in the postcodes CSV file that contains the latitude coordinates. Default {defaults['lat']}.",
+)
+parser.add_argument(
+    "--lon",
+    default=defaults["lon"],
+    type=str,
+    help=f"Field in the postcodes CSV file that contains the longitude coordinates. Default {defaults['lon']}.",
+)
+parser.add_argument(
+    "--host",
+    default=defaults["host"],
+    type=str,
+    help=f"Host to listen on. Default {defaults['host']}.",
+)
+parser.add_argument(
+    "--port",
+    default=defaults["port"],
+    type=int,
+    help=f"Port to listen on. Default {defaults['port']}.",
+)
+parser.add_argument(
+    "--build",
+    action="store_true",
+    help="Rebuild the query index even if it is up to date, then exit.",
+)
+
+logger = logging.getLogger("query_service")
+
+
+def build_index(path, schools_path, postcodes_path, matrix_path, id_field, lat_field, lon_field):
+    """
+    Build the query index folder with the located schools as arrays of row
+    in the travel matrix (see `matrix.py`), régimen, and levels.
+    """
+    ids, coords = read_postcodes(postcodes_path, id_field, lat_field, lon_field)
+    matrix_ids, _, _ = open_matrix(matrix_path)
+    matrix_index = {postcode: i for i, postcode in enumerate(matrix_ids)}
+    rows = np.array([matrix_index.get(postcode, -1) for postcode in ids], dtype=np.int64)
+
+    schools = read_schools(schools_path)
+    assigned, _ = assign_postcodes(schools, ids, coords)
+    located = [(s, int(rows[p])) for s, p in zip(schools, assigned) if p >= 0 and rows[p] >= 0]
+    os.makedirs(path, exist_ok=True)
+
+    regimes = sorted({s.get("reg", "") for s, _ in located})
+    levels = sorted({n["nivel"] for s, _ in located for n in s.get("niveles", []) if n.get("nivel")})
+    regime_index = {r: i for i, r in enumerate(regimes)}
+    level_index = {n: i for i, n in enumerate(levels)}
+
+    school_levels = np.zeros((len(located), len(levels)), dtype=bool)
+    for i, (school, _) in enumerate(located):
+        for level in school.get("niveles", []):
+            if level.get("nivel"):
+                school_levels[i, level_index[level["nivel"]]] = True
+
+    np.save(os.path.join(path, "school_postcode.npy"), np.array([p for _, p in located], dtype=np.int32))
+    np.save(os.path.join(path, "school_reg.npy"), np.array([regime_index[s.get("reg", "")] for s, _ in located], dtype=np.int16))
+    np.save(os.path.join(path, "school_levels.npy"), school_levels)
+    with open(os.path.join(path, "schools.json"), "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "codes": [s["codigo"] for s, _ in located],
+                "names": [s.get("deno", "") for s, _ in located],
+                "regimes": regimes,
+                "levels": levels,
+            },
+            f,
+            ensure_ascii=False,
+        )
+    logger.info(f"Built query index with {len(located)} schools at {len(matrix_ids)} postcodes into {path}.")
+
+
+def index_is_outdated(path, *inputs):
+    """
+    Check if the query index is missing or older than any of its inputs.
+    """
+    marker = os.path.join(path, "schools.json")
+    if not os.path.exists(marker):
+        return True
+    built = os.path.getmtime(marker)
+    return any(os.path.getmtime(i) > built for i in inputs)
+
+
+class QueryIndex:
+    """
+    Memory-mapped query index and travel matrix answering reachable schools
+    lookups.
+    """
+
+    def __init__(self, path, matrix_path):
+        self.ids, self.time, self.dist = open_matrix(matrix_path)
+        # Flags of the travel times that are landmark upper bounds, if any
+        self.flags = open_flags(matrix_path)
+        self.thresholds = read_thresholds(matrix_path)
+        self.postcode_index = {postcode: i for i, postcode in enumerate(self.ids)}
+        self.school_postcode = np.load(os.path.join(path, "school_postcode.npy"), mmap_mode="r")
+        self.school_reg = np.load(os.path.join(path, "school_reg.npy"), mmap_mode="r")
+        self.school_levels = np.load(os.path.join(path, "school_levels.npy"), mmap_mode="r")
+        with open(os.path.join(path, "schools.json"), "r", encoding="utf-8") as f:
+            schools = json.load(f)
+        self.codes = schools["codes"]
+        self.names = schools["names"]
+        self.regimes = schools["regimes"]
+        self.levels = schools["levels"]
+        logger.info(f"Loaded query index with {len(self.ids)} postcodes and {len(self.codes)} schools.")
+
+    @lru_cache(maxsize=256)
+    def _filter_mask(self, niveles, regimes):
+        """
+        Boolean mask of the schools matching the levels and régimen filters,
+        cached per combination of filters.
+        """
+        mask = np.ones(len(self.codes), dtype=bool)
+        if regimes:
+            wanted = [i for i, r in enumerate(self.regimes) if r.upper() in regimes]
+            mask &= np.isin(self.school_reg, wanted)
+        if niveles:
+            columns = [i for i, n in enumerate(self.levels) if any(q in n.upper() for q in niveles)]
+            mask &= np.asarray(self.school_levels[:, columns]).any(axis=1)
+        return mask
+
+    def reachable(self, cp, max_time, niveles=(), regimes=()):
+        """
+        Return the schools reachable from the postcode `cp` within `max_time`
+        minutes, sorted by time and distance, with `bounded` set for the
+        times that are landmark upper bounds. Raises KeyError for unknown
+        postcodes, and ValueError when `max_time` is not one of the
+        thresholds of the bounds.
+        """
+        if self.thresholds is not None and max_time not in self.thresholds:
+            raise ValueError(
+                f"max_time must be one of the thresholds of the landmark bounds: {', '.join(map(str, self.thresholds))}"
+            )
+        origin = self.postcode_index[cp]
+        times = self.time[origin][self.school_postcode]
+        dists = self.dist[origin][self.school_postcode]
+
+        mask = (times >= 0) & (times <= max_time)
+        if niveles or regimes:
+            mask &= self._filter_mask(
+                tuple(sorted(n.upper() for n in niveles)),
+                tuple(sorted(r.upper() for r in regimes)),
+            )
+        selected = np.flatnonzero(mask)
+        order = selected[np.lexsort((dists[selected], times[selected]))]
+        if self.flags is not None:
+            bounded = self.flags[origin][self.school_postcode] == BOUNDED
+        else:
+            bounded = np.zeros(len(self.codes), dtype=bool)
+
+        return [
+            {
+                "codigo": self.codes[i],
+                "deno": self.names[i],
+                "reg": self.regimes[self.school_reg[i]],
+                "time": int(times[i]),
+                "dist": None if bounded[i] else int(dists[i]),
+                "bounded": bool(bounded[i]),
+            }
+            for i in order
+        ]
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    HTTP handler for the query service. The index is set on the class
+    before starting the server.
+    """
+
+    index = None
+    protocol_version = "HTTP/1.1"
+    # Headers and body are sent in separate writes, avoid waiting for ACKs
+    disable_nagle_algorithm = True
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/health":
+            self._send_json(
+                200,
+                {
+                    "status": "ok",
+                    "postcodes": len(self.index.ids),
+                    "schools": len(self.index.codes),
+                    "thresholds": self.index.thresholds,
+                },
+            )
+            return
+        if url.path == "/postcodes":
+            self._send_json(200, {"postcodes": self.index.ids})
+            return
+        if url.path != "/reachable":
+            self._send_json(404, {"error": f"Unknown path {url.path}"})
+            return
+
+        params = parse_qs(url.query)
+        try:
+            cp = params["cp"][0]
+            max_time = int(params.get("max_time", ["30"])[0])
+        except (KeyError, ValueError):
+            self._send_json(400, {"error": "Parameters cp and an integer max_time are required"})
+            return
+
+        start = time.perf_counter()
+        try:
+            schools = self.index.reachable(cp, max_time, params.get("nivel", []), params.get("reg", []))
+        except KeyError:
+            self._send_json(404, {"error": f"Unknown postcode {cp}"})
+            return
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        elapsed = time.perf_counter() - start
+
+        self._send_json(
+            200,
+            {
+                "cp": cp,
+                "max_time": max_time,
+                "count": len(schools),
+                "elapsed_ms": round(elapsed * 1000, 3),
+                "schools": schools,
+            },
+        )
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+if __name__ == "__main__":
+    # Parse the arguments
+    args = parser.parse_args()
+
+    # Set up basic logging
+    logging.basicConfig(
+        level=args.loglevel.upper(),
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%H:%M:%S",
+    )
+
+    inputs = (args.schools, args.postcodes, os.path.join(args.matrix, "ids.json"))
+    for path in inputs:
+        if not os.path.exists(path):
+            logger.error(f"Input file {path} does not exist.")
+            exit(1)
+
+    if args.build or index_is_outdated(args.index, *inputs):
+        logger.info("Building the query index...")
+        build_index(args.index, args.schools, args.postcodes, args.matrix, args.id, args.lat, args.lon)
+        if args.build:
+            exit(0)
+
+    QueryHandler.index = QueryIndex(args.index, args.matrix)
+    server = ThreadingHTTPServer((args.host, args.port), QueryHandler)
+    logger.info(f"Serving queries on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Stopping the query service.")
+    finally:
+        server.server_close()
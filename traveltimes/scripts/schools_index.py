@@ -0,0 +1,330 @@
+"""
+This is a script that joins the outputs of the three applications: the
+schools scraped by the `schools` app, the postcode centroids computed by the
+`postcodes` app, and the travel times matrix folder written by
+`travel_times.py`, memory-mapped and read a row at a time.
+
+Every school is assigned to a postcode, using its `cp` field when it is a
+known postcode or the nearest postcode centroid to its coordinates otherwise.
+Then, for each origin postcode, it precomputes the list of reachable schools
+sorted by travel time and grouped in time buckets, and writes it as a compact
+JSON shard per postcode so a lookup is a single file read.
+
+When the travel times were computed with landmark bounds, the schools whose
+travel time is an upper bound instead of a routed value are labelled with a
+trailing `1` in their shard entry, and have no distance. The bounds are only
+on the right side of the thresholds they were decided against, so the
+buckets must be among those thresholds.
+"""
+
+import logging
+import os
+import csv
+import argparse
+import json
+import time
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from matrix import BOUNDED, NOT_COMPUTED, open_flags, open_matrix, read_thresholds
+
+# Define arguments with argparse
+parser = argparse.ArgumentParser(
+    description="Precompute the reachable schools for every postcode."
+)
+
+defaults = {
+    "loglevel": os.environ.get("LOGLEVEL", "INFO"),
+    "schools": os.environ.get("SCHOOLS", "data/schools.json"),
+    "postcodes": os.environ.get("INPUT", "data/postcodes.csv"),
+    "matrix": os.environ.get("MATRIX", "data/travel_times.matrix"),
+    "output": os.environ.get("SCHOOLS_INDEX", "data/schools_index"),
+    "id": os.environ.get("ID_FIELD", "codigo_postal"),
+    "lat": os.environ.get("LAT_FIELD", "lat"),
+    "lon": os.environ.get("LON_FIELD", "lon"),
+    "buckets": os.environ.get("BUCKETS", "5,10,15,20,30,45,60"),
+}
+
+parser.add_argument(
+    "--loglevel",
+    "-l",
+    choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+    metavar="LOGLEVEL",
+    default=defaults["loglevel"],
+    type=str,
+    help=f"Logging level for the script. Options: DEBUG, INFO, WARNING, ERROR, CRITICAL. Default {defaults['loglevel']}.",
+)
+parser.add_argument(
+    "--schools",
+    default=defaults["schools"],
+    type=str,
+    help=f"Path to the schools JSON file produced by the schools app. Default {defaults['schools']}.",
+)
+parser.add_argument(
+    "--postcodes",
+    default=defaults["postcodes"],
+    type=str,
+    help=f"Path to the postcodes CSV file produced by the postcodes app. Default {defaults['postcodes']}.",
+)
+parser.add_argument(
+    "--matrix",
+    default=defaults["matrix"],
+    type=str,
+    help=f"Path to the travel times matrix folder produced by travel_times.py. Default {defaults['matrix']}.",
+)
+parser.add_argument(
+    "--output",
+    default=defaults["output"],
+    type=str,
+    help=f"Folder to write the per postcode shards into. Default {defaults['output']}.",
+)
+parser.add_argument(
+    "--id",
+    default=defaults["id"],
+    type=str,
+    help=f"Field in the postcodes CSV file that contains the postcode. Default {defaults['id']}.",
+)
+parser.add_argument(
+    "--lat",
+    default=defaults["lat"],
+    type=str,
+    help=f"Field in the postcodes CSV file that contains the latitude coordinates. Default {defaults['lat']}.",
+)
+parser.add_argument(
+    "--lon",
+    default=defaults["lon"],
+    type=str,
+    help=f"Field in the postcodes CSV file that contains the longitude coordinates. Default {defaults['lon']}.",
+)
+parser.add_argument(
+    "--buckets",
+    default=defaults["buckets"],
+    type=str,
+    help=f"Comma separated upper bounds in minutes of the travel time buckets. Schools beyond the last one are not indexed. Default {defaults['buckets']}.",
+)
+
+logger = logging.getLogger("schools_index")
+
+
+def read_postcodes(path, id_field, lat_field, lon_field):
+    """
+    Read the postcode centroids, skipping the ones without coordinates
+    and keeping the first row of any duplicated postcode.
+    Returns the sorted list of ids and a (N, 2) array of lat/lon.
+    """
+    postcodes = {}
+    with open(path, "r") as csvfile:
+        for row in csv.DictReader(csvfile):
+            if not (row[id_field] and row[lat_field] and row[lon_field]):
+                continue
+            if row[id_field] in postcodes:
+                logger.debug(f"Duplicated postcode {row[id_field]}, keeping the first one.")
+                continue
+            postcodes[row[id_field]] = (float(row[lat_field]), float(row[lon_field]))
+
+    ids = sorted(postcodes.keys())
+    coords = np.array([postcodes[i] for i in ids], dtype=np.float64).reshape(-1, 2)
+    return ids, coords
+
+
+def project(coords, lat0):
+    """
+    Project lat/lon pairs into an equirectangular plane in kilometers around
+    the reference latitude `lat0`, accurate enough to find the nearest
+    centroid at a regional scale.
+    """
+    return np.column_stack(
+        (
+            np.radians(coords[:, 1]) * np.cos(np.radians(lat0)) * 6371.0,
+            np.radians(coords[:, 0]) * 6371.0,
+        )
+    )
+
+
+def read_schools(path):
+    """
+    Read the schools JSON file, keeping the fields needed for the index.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        schools = json.load(f)
+    logger.info(f"Read {len(schools)} schools from {path}.")
+    return [s for s in schools if s.get("codigo")]
+
+
+def assign_postcodes(schools, ids, coords):
+    """
+    Assign each school to a postcode index. The `cp` field is used when it
+    is a known postcode, otherwise the nearest centroid to the school
+    coordinates is found with a KD-tree. Schools that can't be located
+    are assigned -1.
+    """
+    index = {postcode: i for i, postcode in enumerate(ids)}
+    # The centroids and the schools are projected around the same latitude,
+    # the distances between points of two different planes are skewed
+    lat0 = float(np.mean(coords[:, 0]))
+    tree = cKDTree(project(coords, lat0))
+
+    assigned = np.full(len(schools), -1, dtype=np.int32)
+    methods = {"cp": 0, "nearest": 0, "missing": 0}
+    pending = []
+    for i, school in enumerate(schools):
+        cp = school.get("cp")
+        if cp in index:
+            assigned[i] = index[cp]
+            methods["cp"] += 1
+            continue
+        try:
+            pending.append((i, float(school["lat"]), float(school["long"])))
+        except (KeyError, TypeError, ValueError):
+            logger.warning(f"School {school['codigo']} has no postcode nor coordinates.")
+            methods["missing"] += 1
+
+    if pending:
+        points = np.array([(lat, lon) for _, lat, lon in pending], dtype=np.float64)
+        _, nearest = tree.query(project(points, lat0))
+        for (i, _, _), postcode_index in zip(pending, nearest):
+            assigned[i] = postcode_index
+        methods["nearest"] += len(pending)
+
+    logger.info(
+        f"Assigned schools to postcodes: {methods['cp']} by cp, {methods['nearest']} by nearest centroid, {methods['missing']} missing."
+    )
+    return assigned, methods
+
+
+def open_travel_times(path, ids):
+    """
+    Memory-map the travel times matrix folder and map the postcode ids to
+    its rows, with -1 for the postcodes without travel times. Returns the
+    time and distance matrices, the flags matrix with the landmark upper
+    bounds or None, and the rows.
+    """
+    matrix_ids, times, dists = open_matrix(path)
+    flags = open_flags(path)
+    index = {postcode: i for i, postcode in enumerate(matrix_ids)}
+    rows = np.array([index.get(postcode, -1) for postcode in ids], dtype=np.int64)
+
+    logger.info(
+        f"Opened a {len(matrix_ids)}x{len(matrix_ids)} travel times matrix"
+        f"{' with landmark upper bounds' if flags is not None else ''} from {path}."
+    )
+    missing = int(np.count_nonzero(rows < 0))
+    if missing:
+        logger.warning(f"{missing} postcodes are not in the travel times matrix, their shards are empty.")
+    return times, dists, flags, rows
+
+
+def write_shards(output, ids, schools, assigned, times, dists, rows, buckets, flags=None):
+    """
+    Write a JSON shard per origin postcode with the reachable schools sorted
+    by travel time, distance, and code, grouped by the time buckets. The
+    matrices are read a row at a time, through the `rows` of the postcodes.
+    The entries of the travel times that are landmark upper bounds in
+    `flags` have no distance and end with a `1`.
+    """
+    os.makedirs(output, exist_ok=True)
+    located = np.flatnonzero(assigned >= 0)
+    located = located[rows[assigned[located]] >= 0]
+    codes = np.array([schools[i]["codigo"] for i in located])
+    school_postcodes = rows[assigned[located]]
+    limits = np.array(buckets, dtype=np.int32)
+
+    written = 0
+    for row, postcode in zip(rows.tolist(), ids):
+        # The postcodes without travel times get an empty shard
+        empty = np.full(len(codes), NOT_COMPUTED)
+        school_times = np.asarray(times[row])[school_postcodes] if row >= 0 else empty
+        school_dists = np.asarray(dists[row])[school_postcodes] if row >= 0 else empty
+        reachable = np.flatnonzero((school_times >= 0) & (school_times <= limits[-1]))
+        order = reachable[
+            np.lexsort(
+                (codes[reachable], school_dists[reachable], school_times[reachable])
+            )
+        ]
+        bucket_of = np.searchsorted(limits, school_times[order], side="left")
+        school_bounded = np.asarray(flags[row])[school_postcodes] == BOUNDED if flags is not None else np.zeros(len(codes), dtype=bool)
+
+        shard = {"cp": postcode, "buckets": {}}
+        for bucket, i in zip(bucket_of, order):
+            if school_bounded[i]:
+                entry = [str(codes[i]), int(school_times[i]), None, 1]
+            else:
+                entry = [str(codes[i]), int(school_times[i]), int(school_dists[i])]
+            shard["buckets"].setdefault(str(limits[bucket]), []).append(entry)
+
+        with open(os.path.join(output, f"{postcode}.json"), "w", encoding="utf-8") as f:
+            json.dump(shard, f, ensure_ascii=False, separators=(",", ":"))
+        written += 1
+
+    logger.info(f"Written {written} postcode shards into {output}.")
+    return written
+
+
+if __name__ == "__main__":
+    # Parse the arguments
+    args = parser.parse_args()
+
+    # Set up basic logging
+    logging.basicConfig(
+        level=args.loglevel.upper(),
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%H:%M:%S",
+    )
+    logger.info("Starting schools index computation...")
+
+    for path in (args.schools, args.postcodes, os.path.join(args.matrix, "ids.json")):
+        if not os.path.exists(path):
+            logger.error(f"Input file {path} does not exist.")
+            exit(1)
+
+    try:
+        buckets = sorted({int(b) for b in args.buckets.split(",") if b.strip()})
+    except ValueError:
+        logger.error(f"Invalid buckets: {args.buckets}.")
+        exit(1)
+    if not buckets:
+        logger.error("At least one bucket is needed.")
+        exit(1)
+
+    # The landmark upper bounds are only decided against their thresholds,
+    # a bucket between two of them would get schools beyond it
+    thresholds = read_thresholds(args.matrix)
+    if thresholds is not None and not set(buckets) <= set(thresholds):
+        logger.error(
+            f"The travel times have landmark upper bounds decided against the thresholds {', '.join(map(str, thresholds))}, "
+            f"the buckets must be among them. Use --buckets {','.join(map(str, thresholds))}, or route every pair."
+        )
+        exit(1)
+
+    ids, coords = read_postcodes(args.postcodes, args.id, args.lat, args.lon)
+    logger.info(f"Read {len(ids)} postcodes with valid coordinates.")
+    if len(ids) == 0:
+        logger.error("No valid postcodes found in the input file.")
+        exit(1)
+
+    schools = read_schools(args.schools)
+    assigned, methods = assign_postcodes(schools, ids, coords)
+    times, dists, flags, rows = open_travel_times(args.matrix, ids)
+    written = write_shards(args.output, ids, schools, assigned, times, dists, rows, buckets, flags)
+
+    # Store the index metadata next to the other metadata files
+    metadata_file = args.output.rstrip("/") + ".metadata.json"
+    with open(metadata_file, "w") as f:
+        json.dump(
+            {
+                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "postal_codes": len(ids),
+                "schools": len(schools),
+                "assignment": methods,
+                "buckets": buckets,
+                "thresholds": thresholds or [],
+                "shards": written,
+            },
+            f,
+            indent=4,
+        )
+    logger.info(f"Metadata written to {metadata_file}.")
+    logger.info("Finished schools index computation.")
+
+    exit(0)
@@ -4,27 +4,78 @@ coordinates and sends a request to a local OSRM API server to get the
 duration and distance of the route between a given origin and the rest of
 destinations from the CSV file. It stores the results in a new CSV file with
 the same name as the input file but with a "_results" suffix.
+
+The pairs to route can be limited to the ones within a straight line radius
+and/or among the nearest postcodes (see `pairs.py`). The results are also
+stored as a travel time matrix folder (see `matrix.py`) where the pairs that
+were not selected are marked as not computed.
+
+Before routing, every postcode is snapped once to the road network with the
+OSRM `/nearest` service and the returned hints are sent with the routes so
+OSRM doesn't snap the same coordinates again for every request (see
+`hints.py`). Postcodes sharing the same location are only routed once (see
+`locations.py`).
+
+Several OSRM profiles, like driving, walking and cycling, can be computed in
+a single run sharing the pair plan, each one against its own OSRM servers.
+The first profile is written with the usual columns and file names, and the
+rest with the profile name as a prefix of the columns and a suffix of the
+matrix folders.
+
+The matrices are computed in tiles of origins and destinations, written to
+the memory-mapped matrix folders as they finish, and the CSV and JSON files
+are streamed from them. With `--tile-size` the memory used depends on the
+tile size instead of the number of pairs, and an interrupted run resumes
+from the last finished tile.
+
+With `--landmarks`, every location is only routed to a few landmarks and
+the rest of the pairs are routed only when their landmark bounds don't
+decide them against the `--thresholds` (see `landmarks.py`).
+
+With `--plan`, nothing is routed: the cache coverage, the latency of the
+OSRM servers and the time left are estimated and reported instead (see
+`planner.py`).
 """
 
 import logging
 import os
 import csv
 import argparse
+import itertools
 import json
 import time
+from multiprocessing import Pool, shared_memory
 
+import numpy as np
 import requests
 from requests_cache import SQLiteCache, CachedSession
 
-# Set up a cache for the requests to avoid sending the same request multiple times
-backend = SQLiteCache("data/travel_times_cache.sqlite")
-session = CachedSession(backend=backend)
+from endpoints import Endpoints, cache_key_fn, split_profiles
+from hints import graph_md5, prefetch_hints
+from landmarks import bound_pairs, landmark_plan, pick_landmarks
+from logs import get_sampled_logger, init_worker_logging, setup_logging, worker_config
+from locations import collapse, fan_out
+from exports import diff_stats, write_csv, write_json
+from metrics import Metrics, TaskMetrics
+from matrix import create_flags, create_matrix, fill, iter_pairs, mark_exact, open_flags, open_matrix
+from pairs import origins, select_pairs, tile_tasks
+from report import RunReport
+from planner import COVERAGE_SAMPLE, estimate, format_duration, pair_offsets, route_path, sample_pairs
+
+# Logger for the messages about every request and pair, sampled
+request_logger = get_sampled_logger("travel_times.requests")
+
+# Cache for the requests to avoid sending the same request multiple times,
+# each worker opens its session in init_worker
+CACHE_PATH = "data/travel_times_cache.sqlite"
 
 # Define arguments with argparse
 parser = argparse.ArgumentParser(description="Get travel times from OSRM API.")
 
 defaults = {
     "loglevel": os.environ.get("LOGLEVEL", "INFO"),
+    "log_format": os.environ.get("LOG_FORMAT", "text"),
+    "log_sample": int(os.environ.get("LOG_SAMPLE", 100)),
     "threads": os.environ.get("THREADS", 3),
     "force": os.environ.get("FORCE", "false").lower() == "true",
     "input": os.environ.get("INPUT", "data/postcodes.csv"),
@@ -33,7 +84,20 @@ defaults = {
     "lat": os.environ.get("LAT_FIELD", "lat"),
     "lon": os.environ.get("LON_FIELD", "lon"),
     "osrm": os.environ.get("OSRM_URL", "http://localhost:5000"),
+    "profiles": os.environ.get("PROFILES", "driving"),
+    "timeout": int(os.environ.get("OSRM_TIMEOUT", 60)),
     "subset": os.environ.get("SUBSET", 0),
+    "radius": float(os.environ.get("RADIUS", 0)),
+    "nearest": int(os.environ.get("NEAREST", 0)),
+    "tolerance": float(os.environ.get("TOLERANCE", 0)),
+    "tile_size": int(os.environ.get("TILE_SIZE", 0)),
+    "landmarks": int(os.environ.get("LANDMARKS", 0)),
+    "thresholds": os.environ.get("THRESHOLDS", "15,30,45"),
+    "hints": os.environ.get("HINTS", "data/travel_times_osrm_hints.json"),
+    "plan_requests": int(os.environ.get("PLAN_REQUESTS", 200)),
+    "plan_concurrency": os.environ.get("PLAN_CONCURRENCY", ""),
+    "metrics": os.environ.get("METRICS", "data/travel_times.prom"),
+    "metrics_interval": int(os.environ.get("METRICS_INTERVAL", 10)),
 }
 
 # Logging level for the script
@@ -46,6 +110,20 @@ parser.add_argument(
     type=str,
     help=f"Logging level for the script. Options: DEBUG, INFO, WARNING, ERROR, CRITICAL. Default {defaults['loglevel']}.",
 )
+parser.add_argument(
+    "--log-format",
+    choices=["text", "json"],
+    default=defaults["log_format"],
+    type=str,
+    help=f"Write the log as text or as JSON lines. Default {defaults['log_format']}.",
+)
+parser.add_argument(
+    "--log-sample",
+    metavar="EVERY",
+    default=defaults["log_sample"],
+    type=int,
+    help=f"Log one of every EVERY messages about single requests and pairs after the first ones, 1 to log all of them. Default {defaults['log_sample']}.",
+)
 
 # Number of threads to use for parallel requests
 parser.add_argument(
@@ -106,7 +184,21 @@ parser.add_argument(
     "--osrm",
     default=os.environ.get("OSRM_URL", "http://localhost:5000"),
     type=str,
-    help=f"URL of the OSRM API server. Default {defaults['osrm']}.",
+    help=f"Comma separated URLs of the OSRM API servers. Requests are balanced across them and host names resolving to several addresses are expanded. With several profiles, prefix the URLs of each profile but the first one with its name, like walking=http://osrm-walking:5000. Default {defaults['osrm']}.",
+)
+
+# OSRM profiles to compute
+parser.add_argument(
+    "--profiles",
+    default=defaults["profiles"],
+    type=str,
+    help=f"Comma separated OSRM profiles to compute, like driving,walking,cycling. Default {defaults['profiles']}.",
+)
+parser.add_argument(
+    "--timeout",
+    default=defaults["timeout"],
+    type=int,
+    help=f"Seconds to wait for an OSRM response before failing over to another server. Default {defaults['timeout']}.",
 )
 
 # Get an optional argument for only processing a subset of the data
@@ -117,83 +209,316 @@ parser.add_argument(
     help=f"Optional argument to process only a subset of the data. Default {defaults['subset']}.",
 )
 
+# Pair selection, every pair is routed when both are 0
+parser.add_argument(
+    "--radius",
+    default=defaults["radius"],
+    type=float,
+    help=f"Only route the pairs within this straight line distance in kilometers, 0 for no limit. Default {defaults['radius']}.",
+)
+parser.add_argument(
+    "--nearest",
+    default=defaults["nearest"],
+    type=int,
+    help=f"Only route the pairs where one postcode is among the K nearest of the other, 0 for no limit. Combined with --radius a pair is routed if it meets any of them. Default {defaults['nearest']}.",
+)
+
+# Distance to consider two postcodes at the same location
+parser.add_argument(
+    "--tolerance",
+    default=defaults["tolerance"],
+    type=float,
+    help=f"Route only once the postcodes closer than this distance in meters, 0 to only merge identical coordinates. Default {defaults['tolerance']}.",
+)
+
+# Size of the tiles of the matrix computed at once
+parser.add_argument(
+    "--tile-size",
+    default=defaults["tile_size"],
+    type=int,
+    help=f"Compute the matrix in tiles of this number of origins and destinations, resuming from the finished tiles of a previous run, 0 to compute it at once. Default {defaults['tile_size']}.",
+)
+
+# Landmark bounds, every pair is routed when there are no landmarks
+parser.add_argument(
+    "--landmarks",
+    default=defaults["landmarks"],
+    type=int,
+    help=f"Route every location only to this number of landmarks and store the landmark upper bounds of the pairs they decide against the thresholds, 0 to route every pair. Default {defaults['landmarks']}.",
+)
+parser.add_argument(
+    "--thresholds",
+    default=defaults["thresholds"],
+    type=str,
+    help=f"Comma separated travel times in minutes the landmark bounds are checked against, the pairs with a threshold between their bounds are routed. Default {defaults['thresholds']}.",
+)
+
+# File to persist the OSRM snapping hints of the postcodes
+parser.add_argument(
+    "--hints",
+    default=defaults["hints"],
+    type=str,
+    help=f"Path to the JSON file where the OSRM hints of the postcodes are stored, empty to not use hints. Default {defaults['hints']}.",
+)
+
+# Progress telemetry
+parser.add_argument(
+    "--metrics",
+    default=defaults["metrics"],
+    type=str,
+    help=f"Path to the Prometheus textfile where the progress and throughput metrics are written while running, empty to only log them. Default {defaults['metrics']}.",
+)
+parser.add_argument(
+    "--metrics-interval",
+    default=defaults["metrics_interval"],
+    type=int,
+    help=f"Seconds between the progress reports. Default {defaults['metrics_interval']}.",
+)
 
-def query_osrm(osrm_url, originLon, originLat, destLon, destLat):
-    # Create the URL for the OSRM API request
-    url = f"{osrm_url}/route/v1/driving/{originLon},{originLat};{destLon},{destLat}?overview=false"
+# Estimate the cost of the run instead of running it
+parser.add_argument(
+    "--plan",
+    action="store_true",
+    help="Only report the pairs to route, the part already cached, and the expected time of the run at each concurrency.",
+)
+parser.add_argument(
+    "--plan-requests",
+    default=defaults["plan_requests"],
+    type=int,
+    help=f"Live requests sent to the OSRM API servers of each profile at each concurrency to measure their latency with --plan. Default {defaults['plan_requests']}.",
+)
+parser.add_argument(
+    "--plan-concurrency",
+    default=defaults["plan_concurrency"],
+    type=str,
+    help="Comma separated numbers of parallel requests to measure with --plan. Default 1 and the number of threads.",
+)
+
+
+def query_osrm(endpoints, originLon, originLat, destLon, destLat, originHint="", destHint="", profile="driving"):
+    # Create the path for the OSRM API request
+    path = route_path(profile, (originLon, originLat, originHint), (destLon, destLat, destHint))
+    metrics = worker_state["metrics"]
+    start = time.perf_counter()
     try:
-        # Send the request to the OSRM API
-        response = session.get(url)
+        # Send the request to the least busy OSRM API server
+        response = endpoints.get(worker_state["session"], path)
         response.raise_for_status()
+        metrics.record(profile, time.perf_counter() - start, cached=getattr(response, "from_cache", False))
         data = response.json()
         if "routes" in data and len(data["routes"]) > 0:
             duration = int(round(data["routes"][0]["duration"] / 60.0, 0))
             distance = int(round(data["routes"][0]["distance"] / 1000.0, 0))
             return (duration, distance)
         else:
-            logger.error(f"No routes found for {origin} to {destination}.")
+            request_logger.error("No routes found for %s,%s to %s,%s.", originLon, originLat, destLon, destLat)
             return None
     except requests.exceptions.RequestException as e:
-        logger.error(f"Error sending request to OSRM API: {e}")
+        metrics.record(profile, time.perf_counter() - start, error=True)
+        request_logger.error("Error sending request to OSRM API: %s", e)
         return None
 
 
-# Function to send the request to the OSRM API
-def get_travel_time(osrm_url, permutation):
-    originId, originLon, originLat = permutation[0]
-    destId, destLon, destLat = permutation[1]
-    # Log the request
-    logger.debug(f"Requesting travel time from {originId} to {destId}...")
-
-    # Check if the coordinates are valid
-    if not (originLon and originLat and destLon and destLat):
-        logger.error(f"Invalid coordinates for {originId} or {destId}.")
-        return (originId, destId, None, None)
-
-    # Check if the coordinates are valid numbers
-    try:
-        originLon = float(originLon)
-        originLat = float(originLat)
-        destLon = float(destLon)
-        destLat = float(destLat)
-
-        # Forward and backward requests to OSRM API
-        forward = query_osrm(osrm_url, originLon, originLat, destLon, destLat)
-        backward = query_osrm(osrm_url, destLon, destLat, originLon, originLat)
-        if forward and backward:
-            # Return the results
-            return (originId, destId, forward[0], forward[1], backward[0], backward[1])
-        else:
-            logger.error(f"Error getting travel time from {originId} to {destId}.")
-            return (originId, destId, None, None, None, None)
+# Coordinates table and pair plan shared with the workers, set by init_worker
+worker_state = {}
+
+
+def create_shared_array(array):
+    """
+    Copy a NumPy array into a shared memory block so the workers can read it
+    without pickling nor parsing it again. Returns the SharedMemory object,
+    to be closed and unlinked by the caller, and the spec to attach to it.
+    """
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    shared = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+    shared[:] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def profile_path(path, profile, profiles):
+    """
+    Path of an output for a profile: the first profile keeps the path and
+    the rest get the profile name before the extension.
+    """
+    if profile == profiles[0]:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}_{profile}{ext}"
+
+
+def load_tiles(path, run, ids, matrix_paths):
+    """
+    Load the set of finished tiles of a previous run with the same
+    parameters and ids, or an empty set if there is nothing to resume.
+    """
+    if not os.path.exists(path):
+        return set()
+    with open(path, "r") as f:
+        progress = json.load(f)
+    if progress.get("run") != run:
+        logger.warning(f"Tiles in {path} were computed with other parameters, starting over.")
+        return set()
+    for matrix_path in matrix_paths:
+        if not os.path.exists(os.path.join(matrix_path, "time.npy")) or open_matrix(matrix_path)[0] != ids:
+            logger.warning(f"Matrix in {matrix_path} doesn't match the input, starting over.")
+            return set()
+    return {tuple(tile) for tile in progress["done"]}
+
+
+def save_tiles(path, run, done):
+    """
+    Persist the finished tiles, replacing the file atomically.
+    """
+    with open(path + ".tmp", "w") as f:
+        json.dump({"run": run, "done": sorted(done)}, f)
+    os.replace(path + ".tmp", path)
+
+
+def open_session(endpoints):
+    """
+    Open the requests cache for the endpoints of every profile.
+    """
+    # The hints don't change the route, so they are left out of the cache
+    # keys, as well as the server that answered the request
+    return CachedSession(
+        backend=SQLiteCache(CACHE_PATH),
+        ignored_parameters=["hints"],
+        key_fn=cache_key_fn(list(endpoints.values())),
+    )
 
-    except ValueError:
-        logger.error(f"Invalid coordinates for {originId} or {destId}.")
-        return (originId, destId, None, None)
 
+def init_worker(endpoints, ids, hints, shared, metrics_queue=None, log_config=None):
+    """
+    Pool initializer: open the requests cache and attach to the shared
+    arrays once per worker. `endpoints` and `hints` map each profile to its
+    OSRM endpoints and to its list of hints aligned with `ids`, `shared`
+    maps the names of the arrays to their specs, the counts of the
+    requests are sent to `metrics_queue` and the logs to the queue of
+    `log_config` (see `logs.py`).
+    """
+    if log_config:
+        init_worker_logging(*log_config)
+    worker_state["session"] = open_session(endpoints)
+    worker_state["metrics"] = TaskMetrics(metrics_queue)
+    worker_state["shm"] = []
+    for key, (name, shape, dtype) in shared.items():
+        # Pool workers share the resource tracker of the main process, which
+        # unlinks the blocks when the run finishes
+        shm = shared_memory.SharedMemory(name=name)
+        worker_state["shm"].append(shm)
+        worker_state[key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    worker_state["ids"] = ids
+    worker_state["hints"] = hints
+    worker_state["endpoints"] = endpoints
 
-def get_travel_time_per_postal_code(osrm_url, permutations):
-    results = []
-    for p in permutations:
-        result = get_travel_time(osrm_url, p)
-        if result:
-            results.append(result)
+
+# Function to send the request to the OSRM API
+def get_travel_time(endpoints, origin, destination, profile="driving"):
+    originId, originLon, originLat, originHint = origin
+    destId, destLon, destLat, destHint = destination
+    # Log the request, formatted only when debugging
+    request_logger.debug("Requesting %s travel time from %s to %s...", profile, originId, destId)
+
+    # Forward and backward requests to OSRM API
+    forward = query_osrm(endpoints, originLon, originLat, destLon, destLat, originHint, destHint, profile)
+    backward = query_osrm(endpoints, destLon, destLat, originLon, originLat, destHint, originHint, profile)
+    if forward and backward:
+        # Return the results
+        return (originId, destId, forward[0], forward[1], backward[0], backward[1])
+    else:
+        request_logger.error("Error getting travel time from %s to %s.", originId, destId)
+        return (originId, destId, None, None, None, None)
+
+
+def get_travel_time_per_postal_code(task):
+    """
+    Worker task: compute the travel times from the origin at index `task[0]`
+    to the destinations of the shared pair plan in the range
+    `task[1]:task[2]`, for every profile. Returns the list of results of
+    each profile, in the same order.
+    """
+    origin, start, stop = task
+    ids = worker_state["ids"]
+    coordinates = worker_state["coordinates"]
+    originLon, originLat = coordinates[origin].tolist()
+
+    results = {profile: [] for profile in worker_state["endpoints"]}
+    for destination in worker_state["destinations"][start:stop].tolist():
+        destLon, destLat = coordinates[destination].tolist()
+        for profile, endpoints in worker_state["endpoints"].items():
+            hints = worker_state["hints"][profile]
+            results[profile].append(
+                get_travel_time(
+                    endpoints,
+                    (ids[origin], originLon, originLat, hints[origin]),
+                    (ids[destination], destLon, destLat, hints[destination]),
+                    profile,
+                )
+            )
+        worker_state["metrics"].pair()
+    worker_state["metrics"].flush()
     return results
 
 
+def route(tiles, destinations, coordinates, ids, endpoints, hints, threads, on_tile, metrics=None, failed=None):
+    """
+    Route the tasks of every `(tile, tasks)` of `tiles` with a pool of
+    workers attached to the shared coordinates and destinations of the
+    locations, calling `on_tile(tile, results)` with the results of each
+    profile as the tiles finish. The workers send their request counts to
+    the `metrics` queue. A tile that fails is skipped and added to the
+    `failed` list, so it isn't recorded as finished and a resumed run
+    routes it again. Returns the number of routed pairs.
+    """
+    # Load the coordinates and the destinations once into shared memory
+    coordinates_shm, coordinates_spec = create_shared_array(coordinates)
+    destinations_shm, destinations_spec = create_shared_array(destinations)
+    shared = {"coordinates": coordinates_spec, "destinations": destinations_spec}
+
+    # Create a pool of workers attached to the shared arrays
+    pool = Pool(threads, initializer=init_worker, initargs=(endpoints, ids, hints, shared, metrics, worker_config()))
+    routed = 0
+    try:
+        # Use Pool.map to send the requests of each tile in parallel
+        for tile, tasks in tiles:
+            try:
+                results = pool.map(get_travel_time_per_postal_code, tasks) if tasks else []
+            except Exception as e:
+                logger.error(f"Error routing tile {tile}: {e}")
+                if failed is None:
+                    raise
+                failed.append(tile)
+                continue
+            on_tile(
+                tile,
+                {
+                    profile: [item for task_results in results for item in task_results[profile]]
+                    for profile in endpoints
+                },
+            )
+            routed += sum(stop - start for _, start, stop in tasks)
+    finally:
+        pool.close()
+        pool.join()
+        for shm in (coordinates_shm, destinations_shm):
+            shm.close()
+            shm.unlink()
+    return routed
+
+
 if __name__ == "__main__":
     # Parse the arguments
     args = parser.parse_args()
 
-    # Set up basic logging
-    logging.basicConfig(
-        level=args.loglevel.upper(),
-        format="%(asctime)s - %(levelname)s - %(message)s",
-        datefmt="%H:%M:%S",
-    )
+    # Set up the logging of the main process and the workers
+    setup_logging(args.loglevel.upper(), json_format=args.log_format == "json", sample_every=args.log_sample)
     logger = logging.getLogger()
     logger.info("Starting travel time calculation...")
 
+    # Measure the stages of the run, reported next to the output
+    run_report = RunReport("travel_times")
+    stage = run_report.begin("read_input")
+
     # Check if the input file exists
     if not os.path.exists(args.input):
         logger.error(f"Input file {args.input} does not exist.")
@@ -209,252 +534,445 @@ if __name__ == "__main__":
             exit(1)
 
     # Check if the output file already exists
-    if os.path.exists(args.output) and not args.force:
+    if os.path.exists(args.output) and not args.force and not args.plan:
         logger.error(
             f"Output file {args.output} already exists. Use --force to overwrite."
         )
         exit(1)
-    if args.force and os.path.exists(args.output):
+    if args.force and os.path.exists(args.output) and not args.plan:
         logger.warning(
             f"Output file {args.output} already exists. It will be overwritten."
         )
 
-    # Filter from the input rows the ones without lat/lon
-    data = [row for row in data if row[args.lat] and row[args.lon]]
+    # Filter from the input rows the ones without valid lat/lon
+    valid = []
+    for row in data:
+        try:
+            valid.append((row[args.id], float(row[args.lon]), float(row[args.lat])))
+        except ValueError:
+            if row[args.lat] and row[args.lon]:
+                logger.error(f"Invalid coordinates for {row[args.id]}.")
+    data = valid
     logger.info(f"Filtered {len(data)} rows with valid lat/lon coordinates.")
     if len(data) == 0:
         logger.error("No valid lat/lon coordinates found in the input file.")
         exit(1)
 
+    # Keep the first row of every duplicated id
+    unique = {}
+    for row in data:
+        unique.setdefault(row[0], row)
+    if len(unique) < len(data):
+        logger.warning(f"Dropped {len(data) - len(unique)} rows with duplicated ids, keeping the first one.")
+    data = list(unique.values())
+
     # Sort the data by the id field
-    data.sort(key=lambda x: x[args.id])
+    data.sort(key=lambda x: x[0])
     logger.info(f"Sorted {len(data)} rows by the id field.")
     if len(data) == 0:
         logger.error("No valid id field found in the input file.")
         exit(1)
-
-    # Create the permutations of the data, where each record is only
-    # computed against the records that are after it in the list
+    ids = [row[0] for row in data]
+    coordinates = np.array([(lon, lat) for _, lon, lat in data], dtype=np.float64)
+
+    # Collapse the postcodes into unique locations, only the pairs of
+    # locations are routed, using the id of the first postcode of each
+    locations = collapse(coordinates, args.tolerance)
+    location_ids = [ids[i] for i in locations.representatives.tolist()]
+    location_coordinates = coordinates[locations.representatives]
+    logger.info(f"Collapsed {len(ids)} postcodes into {locations.size} unique locations.")
+
+    # Select the pairs to route, where each record is only computed
+    # against records that are after it in the list
     # This is done to avoid computing the same route twice
     # and to avoid computing the route from the origin to itself
-    # The result is a list of tuples with the origin and destination
-    # coordinates
-    permutations = {}
-    for i, origin in enumerate(data):
-        for j, destination in enumerate(data[i + 1 :]):
-            if origin[args.id] != destination[args.id]:
-                if not permutations.get(origin[args.id]):
-                    permutations[origin[args.id]] = []
-                permutations[origin[args.id]].append(
-                    (
-                        (origin[args.id], origin[args.lon], origin[args.lat]),
-                        (
-                            destination[args.id],
-                            destination[args.lon],
-                            destination[args.lat],
-                        ),
-                    )
-                )
+    # Without limits every pair is routed, without building a dense plan
+    plan = None
+    total_pairs = locations.size * (locations.size - 1) // 2
+    selected = total_pairs
+    if args.radius or args.nearest:
+        plan = select_pairs(location_coordinates, args.radius, args.nearest)
+        selected = plan.size
+        logger.info(
+            f"Selected {selected} of {total_pairs} pairs with radius {args.radius} km and {args.nearest} nearest postcodes."
+        )
 
-    logger.info(
-        f"Created {len(sum(permutations.values(), []))} permutations of the data."
-    )
-    if len(permutations) == 0:
+    # Origins with at least a destination, as the index of their location
+    postal_codes = [location_ids[i] for i in origins(plan, locations.size).tolist()]
+
+    logger.info(f"Created {selected} permutations of the data.")
+    if selected == 0:
         logger.error("No valid permutations found in the input file.")
         exit(1)
+    stage.items = len(ids)
+    run_report.end(stage)
 
-    postal_codes = permutations.keys()
-
-    # Use multiprocessing to create a pool of workers to send the requests
-    from multiprocessing import Pool, cpu_count
-    from functools import partial
+    # Get the OSRM API servers of each profile
+    profiles = [p.strip() for p in args.profiles.split(",") if p.strip()]
+    if len(set(profiles)) != len(profiles) or not profiles:
+        logger.error(f"Invalid profiles: {args.profiles}.")
+        exit(1)
+    try:
+        urls = split_profiles(args.osrm, profiles)
+    except ValueError as e:
+        logger.error(f"Invalid OSRM URLs: {e}.")
+        exit(1)
 
-    # Create a pool of workers
-    pool = Pool(args.threads)
-    logger.info(f"Using {args.threads} threads for parallel requests.")
-    # Create a partial function to pass the osrm_url to the worker
-    partial_get_travel_times = partial(get_travel_time_per_postal_code, args.osrm)
+    # Check the OSRM API servers snapping the first postcode
+    endpoints = {}
+    lon, lat = location_coordinates[0].tolist()
+    for profile in profiles:
+        endpoints[profile] = Endpoints.from_option(urls[profile], timeout=args.timeout)
+        healthy = endpoints[profile].check(f"/nearest/v1/{profile}/{lon},{lat}")
+        logger.info(
+            f"Using {len(healthy)} of {len(endpoints[profile])} OSRM API servers for {profile}: {', '.join(healthy)}."
+        )
+        if not healthy:
+            logger.error(f"No OSRM API server is available for {profile}.")
+            exit(1)
 
-    # Use Pool.map to send the requests in parallel
+    # Snap the postcodes once to get their OSRM hints
+    stage = run_report.begin("hints")
+    hints = {profile: [""] * locations.size for profile in profiles}
+    if args.hints:
+        md5 = graph_md5()
+        if md5 is None:
+            logger.warning("No OSM PBF metadata found, hints can't be checked against the graph.")
+        for profile in profiles:
+            sent = sum(endpoints[profile].stats().values())
+            hints[profile] = prefetch_hints(
+                endpoints[profile],
+                location_ids,
+                location_coordinates,
+                profile_path(args.hints, profile, profiles),
+                md5,
+                args.threads,
+                profile,
+            )
+            logger.info(
+                f"Using {profile} OSRM hints for {sum(1 for h in hints[profile] if h)} of {locations.size} locations."
+            )
+            fetched = sum(endpoints[profile].stats().values()) - sent
+            stage.items += locations.size
+            stage.cache("hints", locations.size - fetched, locations.size)
+    run_report.end(stage)
 
-    results = []
+    # Check the landmark parameters
     try:
-        if args.subset > 0:
-            logger.info(f"Processing only the first {args.subset} postal codes.")
-            # extract from the permutations dict the first args.subset keys
-            subset_permutations = {}
-            for i, postal_code in enumerate(postal_codes):
-                if i >= args.subset:
-                    break
-                subset_permutations[postal_code] = permutations[postal_code]
-            results = pool.map(partial_get_travel_times, subset_permutations.values())
-        else:
-            logger.info(f"Processing all {len(permutations)} permutations.")
-            results = pool.map(partial_get_travel_times, permutations.values())
-        # Flatten the list of results
-        results = [item for sublist in results for item in sublist]
-        logger.info(f"Processed {len(results)} requests.")
-    except Exception as e:
-        logger.error(f"Error sending requests: {e}")
-    finally:
-        pool.close()
-        pool.join()
-        logger.info("Finished sending requests.")
-        logger.info(f"Received {len(results)} results.")
-        if len(results) == 0:
-            logger.error("No results received.")
+        thresholds = [int(t) for t in args.thresholds.split(",") if t.strip()]
+    except ValueError:
+        logger.error(f"Invalid thresholds: {args.thresholds}.")
+        exit(1)
+    if args.landmarks and (args.subset or not thresholds):
+        logger.error("Landmarks need some thresholds and can't be combined with a subset.")
+        exit(1)
+
+    # With landmarks, the pairs to the landmarks are routed first
+    routing_plan = plan
+    if args.landmarks:
+        landmarks = pick_landmarks(location_coordinates, args.landmarks)
+        routing_plan = landmark_plan(locations.size, landmarks)
+        logger.info(
+            f"Routing {routing_plan.size} pairs to {len(landmarks)} landmarks: {', '.join(location_ids[i] for i in landmarks.tolist())}."
+        )
+
+    # Split the matrix of locations in tiles, or a single one
+    tile_size = args.tile_size or max(locations.size, 1)
+    blocks = [range(start, start + tile_size) for start in range(0, locations.size, tile_size)]
+    tiles = [(bi, bj) for bi in range(len(blocks)) for bj in range(bi, len(blocks))]
+
+    # Only route the first origins when processing a subset
+    last_origin = locations.size
+    if args.subset > 0:
+        logger.info(f"Processing only the first {args.subset} postal codes.")
+        postal_codes = postal_codes[: args.subset]
+        first_origins = origins(plan, locations.size)[: args.subset]
+        last_origin = int(first_origins[-1]) + 1 if len(first_origins) else 0
+    else:
+        logger.info(f"Processing all {len(postal_codes)} postal codes.")
+
+    # Estimate the cost of the run and stop
+    if args.plan:
+        try:
+            concurrencies = sorted({int(c) for c in args.plan_concurrency.split(",") if c.strip()} or {1, args.threads})
+        except ValueError:
+            logger.error(f"Invalid concurrency: {args.plan_concurrency}.")
             exit(1)
+        if args.landmarks:
+            logger.warning("Only the pairs to the landmarks are estimated, the undecided pairs are routed after them.")
+        pairs, *sample = sample_pairs(routing_plan, locations.size, COVERAGE_SAMPLE, last_origin)
+        logger.info(f"Estimating {pairs} pairs of {len(postal_codes)} postal codes from a sample of {len(sample[0])} pairs.")
+        session = open_session(endpoints)
+        report = {}
+        for profile in profiles:
+            report[profile] = estimate(
+                session,
+                endpoints[profile],
+                profile,
+                location_coordinates,
+                hints[profile],
+                pairs,
+                sample,
+                concurrencies,
+                args.plan_requests,
+            )
+            logger.info(
+                f"{profile}: {report[profile]['requests']} requests, {report[profile]['cache_hit_ratio']:.1%} cached, {report[profile]['projected_requests']} to send."
+            )
+            for concurrency, measured in report[profile]["concurrency"].items():
+                logger.info(
+                    f"{profile} with {concurrency} parallel requests: {measured['requests_per_second']} requests/s, "
+                    f"p50 {measured['latency_ms']['p50']} ms, p95 {measured['latency_ms']['p95']} ms, "
+                    f"{measured['errors']} errors, ETA {format_duration(measured['eta_seconds'])}."
+                )
 
-    # Write the results to a CSV file
-    fieldnames = ["cp_from", "cp_to", "from_time", "from_dist", "to_time", "to_dist"]
-    with open(args.output, "w", newline="") as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        for result in results:
-            originId, destId, from_time, from_dist, to_time, to_dist = result
-            writer.writerow(
+        plan_file = args.output.replace(".csv", ".plan.json")
+        with open(plan_file, "w") as f:
+            json.dump(
                 {
-                    "cp_from": originId,
-                    "cp_to": destId,
-                    "from_time": from_time,
-                    "from_dist": from_dist,
-                    "to_time": to_time,
-                    "to_dist": to_dist,
-                }
+                    "timestamp": time.strftime('%Y-%m-%d %H:%M:%S'),
+                    "postal_codes": len(postal_codes),
+                    "locations": locations.size,
+                    "pairs": {
+                        "radius_km": args.radius,
+                        "nearest": args.nearest,
+                        "tolerance_m": args.tolerance,
+                        "landmarks": args.landmarks,
+                        "subset": args.subset,
+                        "selected": selected,
+                        "total": total_pairs,
+                        "to_route": pairs,
+                    },
+                    "profiles": report,
+                },
+                f,
+                indent=4,
             )
+        logger.info(f"Plan written to {plan_file}.")
+        exit(0)
+
+    stage = run_report.begin("routing")
+    # Matrix folder of each profile, the finished tiles are stored in the
+    # one of the first profile to resume the tiled runs
+    matrix_paths = {
+        profile: profile_path(args.output.replace(".csv", ".matrix"), profile, profiles)
+        for profile in profiles
+    }
+    progress_file = os.path.join(matrix_paths[profiles[0]], "tiles.json")
+    run = {
+        "tile_size": tile_size,
+        "radius": args.radius,
+        "nearest": args.nearest,
+        "tolerance": args.tolerance,
+        "subset": args.subset,
+        "profiles": profiles,
+        "landmarks": args.landmarks,
+        "thresholds": thresholds,
+    }
+    done = set()
+    if args.tile_size:
+        done = load_tiles(progress_file, run, ids, matrix_paths.values())
+    matrices = {}
+    flags = {}
+    index = {postcode: i for i, postcode in enumerate(ids)}
+    for profile in profiles:
+        if done:
+            _, time_matrix, dist_matrix = open_matrix(matrix_paths[profile], mode="r+")
+            if args.landmarks:
+                flags[profile] = open_flags(matrix_paths[profile], mode="r+")
+        else:
+            # Postcodes in the same location are not routed
+            time_matrix, dist_matrix = create_matrix(matrix_paths[profile], ids)
+            fill(time_matrix, dist_matrix, index, fan_out([], ids, locations))
+            if args.landmarks:
+                flags[profile] = create_flags(matrix_paths[profile], len(ids), thresholds)
+        matrices[profile] = (time_matrix, dist_matrix)
+    if done:
+        logger.info(f"Resuming from {len(done)} of {len(tiles)} finished tiles.")
+
+    def write_tile(tile, results):
+        """
+        Fan the results of each profile out from the locations to the
+        postcodes and write them to its matrix, recording the finished tiles
+        of the tiled runs.
+        """
+        for profile in profiles:
+            time_matrix, dist_matrix = matrices[profile]
+            fill(time_matrix, dist_matrix, index, fan_out(results[profile], ids, locations, same_location=False))
+            time_matrix.flush()
+            dist_matrix.flush()
+        if args.tile_size and tile is not None:
+            done.add(tile)
+            save_tiles(progress_file, run, done)
+            logger.info(f"Finished tile {len(done)} of {len(tiles)}.")
+
+    def tasks_of(plan, bi, bj):
+        rows = range(blocks[bi].start, min(blocks[bi].stop, last_origin))
+        return tile_tasks(plan, locations.size, rows, blocks[bj])
+
+    def pending(plan, resumable):
+        """
+        Tasks of the tiles of a plan, skipping the finished ones.
+        """
+        for bi, bj in tiles:
+            if resumable and (bi, bj) in done:
+                continue
+            yield ((bi, bj) if resumable else None), tasks_of(plan, bi, bj)
+
+    # Without a plan the destinations are every location
+    def destinations(plan):
+        return np.arange(locations.size, dtype=np.int32) if plan is None else plan.indices
 
-    # Write the results to a JSON file with a dictionary of postal codes and the travel times
-    # against all the other postal codes in an array of strings
+    logger.info(f"Using {args.threads} threads for parallel requests.")
+    # Report the progress of the workers while routing, without the pairs
+    # of the finished tiles
+    metrics = Metrics(args.metrics, args.metrics_interval)
+    metrics.expect(
+        int(pair_offsets(routing_plan, locations.size)[last_origin])
+        - sum(stop - start for tile in done for _, start, stop in tasks_of(routing_plan, *tile))
+    )
+    metrics.start()
 
-    json_results = {}
-    for result in results:
-        originId, destId, from_time, from_dist, to_time, to_dist = result
-        originId = str(int(originId))
-        destId = str(int(destId))
-        # Forward
-        if not json_results.get(originId):
-            json_results[originId] = []
-
-        json_results[originId].append(
-            ",".join([str(int(destId)), str(from_time), str(from_dist)])
+    routed = 0
+    bounded = 0
+    failed = []
+    interrupted = False
+    try:
+        routed = route(
+            pending(routing_plan, True),
+            destinations(routing_plan),
+            location_coordinates,
+            location_ids,
+            endpoints,
+            hints,
+            args.threads,
+            write_tile,
+            metrics.queue,
+            failed,
         )
-        # Backward
-        if not json_results.get(destId):
-            json_results[destId] = []
-        json_results[destId].append(
-            ",".join([str(int(originId)), str(to_time), str(to_dist)])
+        # The landmark bounds need every pair to the landmarks
+        if args.landmarks and not failed:
+            # Bound the rest of the pairs and route the undecided ones
+            exact_plan, bounded = bound_pairs(matrices, flags, locations, landmarks, thresholds, plan)
+            logger.info(f"Bounded {bounded} pairs with the landmarks, routing {exact_plan.size} more pairs.")
+            metrics.expect(exact_plan.size)
+            routed += route(
+                pending(exact_plan, False),
+                destinations(exact_plan),
+                location_coordinates,
+                location_ids,
+                endpoints,
+                hints,
+                args.threads,
+                write_tile,
+                metrics.queue,
+                failed,
+            )
+            for profile in profiles:
+                mark_exact(matrices[profile][0], flags[profile])
+        logger.info(f"Processed {routed} requests.")
+    except Exception as e:
+        logger.error(f"Error sending requests: {e}")
+        interrupted = True
+    finally:
+        metrics.stop()
+        logger.info("Finished sending requests.")
+    summary = metrics.summary()
+    stage.items = routed
+    stage.cache("osrm_requests", sum(summary["cache_hits"].values()), sum(summary["requests"].values()))
+    run_report.end(stage)
+
+    # Don't export partial matrices as a finished result, the finished
+    # tiles are already recorded to resume the run
+    if failed or interrupted:
+        if failed:
+            logger.error(f"Failed to route {len(failed)} tiles: {', '.join(str(tile) for tile in failed)}.")
+        logger.error(
+            f"Routing didn't finish, the results are not exported. Run again to resume"
+            f"{' from the finished tiles' if args.tile_size else ''}."
         )
+        exit(1)
 
-    # Sort each array in the json_results dictionary
-    for key in json_results.keys():
-        json_results[key].sort()
+    # Compute some stats on the results of the first profile, streaming
+    # over its matrix. The landmark upper bounds are flagged in the exports
+    # and left out of the stats
+    stage = run_report.begin("export")
+    bounds = flags if all(flags.get(profile) is not None for profile in profiles) else {}
+    time_matrix, dist_matrix = matrices[profiles[0]]
+    received, time_stats, dist_stats = diff_stats(
+        iter_pairs(time_matrix, dist_matrix, ids, flags=bounds.get(profiles[0]))
+    )
+    logger.info(f"Received {received} results.")
+    if received == 0:
+        logger.error("No results received.")
+        exit(1)
+    for profile in profiles:
+        logger.info(f"Matrix for {profile} written to {matrix_paths[profile]}.")
+
+    # Write the results to a CSV file, with the columns of the other
+    # profiles prefixed by their name
+    write_csv(
+        args.output,
+        profiles,
+        [iter_pairs(*matrices[profile], ids, flags=bounds.get(profile)) for profile in profiles],
+        bounded=bool(bounds),
+    )
 
-    # Write the json_results to a JSON file
+    # Write the results to a JSON file with a dictionary of postal codes and the travel times
+    # against all the other postal codes in an array of strings
     json_file = args.output.replace(".csv", ".json")
-    with open(json_file, "w") as f:
-        json.dump(json_results, f, indent=4)
+    write_json(json_file, time_matrix, dist_matrix, ids, bounds.get(profiles[0]))
 
     logger.info(f"Results written to {args.output}.")
 
-    # Print the first 10 results
+    # Print the first 10 results, marking the landmark upper bounds
     logger.info("First 10 results:")
-    for r in results[:10]:
-        logger.info(f"Result: {r}")
-
-    # Compute some stats on the results
-    # For each row, compute the difference in time and distance
-    stats = []
-    for result in results:
-        originId, destId, from_time, from_dist, to_time, to_dist = result
-        if from_time and to_time:
-            time_diff = abs(from_time - to_time)
-            dist_diff = abs(from_dist - to_dist)
-            stats.append((originId, destId, time_diff, dist_diff))
-        else:
-            logger.error(f"Invalid result for {originId} to {destId}.")
-
-    # Compute the average time and distance differences
-    avg_time_diff = sum([s[2] for s in stats]) / len(stats) if stats else 0
-    avg_dist_diff = sum([s[3] for s in stats]) / len(stats) if stats else 0
-    logger.info(f"Average time difference: {avg_time_diff:.2f} minutes.")
-    logger.info(f"Average distance difference: {avg_dist_diff:.2f} km.")
-
-    # Find and compute the maximum time and distance differences
-    max_time_diff = max([s[2] for s in stats]) if stats else 0
-    max_dist_diff = max([s[3] for s in stats]) if stats else 0
-    max_time_from_postal_code = list(
-        filter(lambda x: abs(x[2] - x[4]) == max_time_diff, results)
-    )
-    max_dist_from_postal_code = list(
-        filter(lambda x: abs(x[3] - x[5]) == max_dist_diff, results)
-    )
-    logger.info(
-        f"Maximum time difference: {max_time_diff:.2f} minutes between {max_time_from_postal_code[0][0]} and {max_time_from_postal_code[0][1]}."
-    )
-    logger.info(
-        f"Maximum distance difference: {max_dist_diff:.2f} km between {max_dist_from_postal_code[0][0]} and {max_dist_from_postal_code[0][1]}."
-    )
-
-    # Compute the standard deviation of the time and distance differences
-    import statistics
-
-    time_diffs = [s[2] for s in stats]
-    dist_diffs = [s[3] for s in stats]
-    if len(time_diffs) > 1:
-        time_stddev = statistics.stdev(time_diffs)
-    else:
-        time_stddev = 0
-    if len(dist_diffs) > 1:
-        dist_stddev = statistics.stdev(dist_diffs)
-    else:
-        dist_stddev = 0
-    logger.info(f"Standard deviation of time differences: {time_stddev:.2f} minutes.")
-    logger.info(f"Standard deviation of distance differences: {dist_stddev:.2f} km.")
-
-    # Compute the p95 and p99 of the time and distance differences
-    time_diffs.sort()
-    dist_diffs.sort()
-    p95_time_diff = time_diffs[int(len(time_diffs) * 0.95)] if time_diffs else 0
-    p99_time_diff = time_diffs[int(len(time_diffs) * 0.99)] if time_diffs else 0
-    p95_dist_diff = dist_diffs[int(len(dist_diffs) * 0.95)] if dist_diffs else 0
-    p99_dist_diff = dist_diffs[int(len(dist_diffs) * 0.99)] if dist_diffs else 0
-    logger.info(f"95th percentile time difference: {p95_time_diff:.2f} minutes.")
-    logger.info(f"99th percentile time difference: {p99_time_diff:.2f} minutes.")
-    logger.info(f"95th percentile distance difference: {p95_dist_diff:.2f} km.")
-    logger.info(f"99th percentile distance difference: {p99_dist_diff:.2f} km.")
-    logger.info("Finished travel time calculation.")
+    for r in itertools.islice(iter_pairs(time_matrix, dist_matrix, ids, flags=bounds.get(profiles[0])), 10):
+        logger.info(f"Result: {r[:6]}{' (upper bounds)' if r[6:] and r[6] else ''}")
+
+    for name, stats, unit in (("time", time_stats, "minutes"), ("distance", dist_stats, "km")):
+        logger.info(f"Average {name} difference: {stats['avg']:.2f} {unit}.")
+        if stats["max_record"]:
+            logger.info(
+                f"Maximum {name} difference: {stats['max']:.2f} {unit} between {stats['max_record'][0][0]} and {stats['max_record'][0][1]}."
+            )
+        logger.info(f"Standard deviation of {name} differences: {stats['stddev']:.2f} {unit}.")
+        logger.info(f"95th percentile {name} difference: {stats['p95']:.2f} {unit}.")
+        logger.info(f"99th percentile {name} difference: {stats['p99']:.2f} {unit}.")
+    stage.items = received
+    run_report.end(stage)
 
     # Store all the stats in a json file
-    import json
-
     stats_file = args.output.replace(".csv", ".metadata.json")
     with open(stats_file, "w") as f:
         json.dump(
             {
                 "timestamp": time.strftime('%Y-%m-%d %H:%M:%S'),
                 "postal_codes": len(postal_codes),
-                "travel_times": len(results),
-                "time_diffs": {
-                    "avg": round(avg_time_diff, 2),
-                    "max": max_time_diff,
-                    "max_record": max_time_from_postal_code,
-                    "stddev": round(time_stddev, 2),
-                    "p95": p95_time_diff,
-                    "p99": p99_time_diff,
-                },
-                "dist_diffs": {
-                    "avg": round(avg_dist_diff, 2),
-                    "max": max_dist_diff,
-                    "max_record": max_dist_from_postal_code,
-                    "stddev": round(dist_stddev, 2),
-                    "p95": p95_dist_diff,
-                    "p99": p99_dist_diff,
+                "travel_times": received,
+                "profiles": profiles,
+                "osrm_requests": {profile: endpoints[profile].stats() for profile in profiles},
+                "locations": locations.size,
+                "pairs": {
+                    "radius_km": args.radius,
+                    "nearest": args.nearest,
+                    "tolerance_m": args.tolerance,
+                    "tile_size": args.tile_size,
+                    "selected": selected,
+                    "total": total_pairs,
+                    "landmarks": args.landmarks,
+                    "thresholds": thresholds if args.landmarks else [],
+                    "bounded": bounded,
                 },
+                "metrics": summary,
+                "time_diffs": time_stats,
+                "dist_diffs": dist_stats,
             },
             f,
             indent=4,
         )
     logger.info(f"Stats written to {stats_file}.")
+    run_report.write(args.output.replace(".csv", ".report.json"))
     logger.info("Finished travel time calculation.")
 
     exit(0)